@@ -63,6 +63,19 @@ class AdminLog(BaseModel):
 
 
 # 数据库操作函数
+async def migrate_query_logs(conn: aiosqlite.Connection):
+    """为旧版本创建的 query_logs 表补充新增的列"""
+    cursor = await conn.execute("PRAGMA table_info(query_logs)")
+    columns = {row[1] for row in await cursor.fetchall()}
+    if not columns:
+        return
+    if "request_id" not in columns:
+        await conn.execute("ALTER TABLE query_logs ADD COLUMN request_id TEXT")
+    if "cache_hit" not in columns:
+        await conn.execute("ALTER TABLE query_logs ADD COLUMN cache_hit INTEGER DEFAULT 0")
+    await conn.commit()
+
+
 async def init_admin_database():
     """初始化管理数据库"""
     global admin_db_conn
@@ -90,9 +103,12 @@ async def init_admin_database():
             response TEXT,
             response_time REAL,
             status TEXT DEFAULT 'success',
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            request_id TEXT,
+            cache_hit INTEGER DEFAULT 0
         )
     """)
+    await migrate_query_logs(admin_db_conn)
 
     # 创建系统配置表
     await admin_db_conn.execute("""
@@ -352,7 +368,7 @@ async def get_user_history(
         offset = (page - 1) * limit
 
         cursor = await admin_db_conn.execute(
-            """SELECT question, response, response_time, status, timestamp
+            """SELECT question, response, response_time, status, timestamp, cache_hit
                FROM query_logs
                WHERE user_id = ?
                ORDER BY timestamp DESC
@@ -369,7 +385,8 @@ async def get_user_history(
                 "response": row[1][:200] + "..." if row[1] and len(row[1]) > 200 else row[1],
                 "response_time": row[2],
                 "status": row[3],
-                "timestamp": row[4]
+                "timestamp": row[4],
+                "cache_hit": bool(row[5])
             })
 
         # 获取总数
@@ -11,19 +11,29 @@ from aiosqlite import Connection
 from fastapi import FastAPI, Form, HTTPException
 from fastapi.responses import PlainTextResponse
 from langchain.agents import initialize_agent, AgentType
+from langchain_core.messages import AIMessage, HumanMessage
 from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 import httpx
 
 from chain.chain import get_law_qa_chain
 from embedding.embedding import AliEmbeddings
-from flow.flow import get_law_qa_flow
+from flow.answer_cache import SemanticAnswerCache
+from flow.classifier import LegalQuestionClassifier
+from flow.history import HistoryManager
+from flow.flow import NODE_LAW_AGENT, get_law_qa_flow
 from model.model import get_model_ali, get_langgraph_model
-from retriever.retriever import get_es_retriever, get_multi_query_retriever
+from retriever.article_index import ArticleIndex
+from retriever.es_client import close_es_clients
+from retriever.retriever import (get_es_retriever, get_index_version_fn, get_law_retriever, get_multi_query_retriever,
+                                 get_retrieval_cache, get_retrieval_prefetcher)
 from tool.tool import get_law_documents_retriever_tool
 from config.config_manager import SystemConfig, init_config_manager
+from metrics.metrics import metrics
+from admin_server import migrate_query_logs
 
 
 graph = None
+answer_cache: SemanticAnswerCache = None
 default_user_id = "1"
 asqlite_conn: Connection = None
 # 存储request_id到超时回调的映射
@@ -41,6 +51,7 @@ async def init_admin_db():
     global admin_db_conn
     if admin_db_conn is None:
         admin_db_conn = await aiosqlite.connect("admin_management.sqlite")
+        await migrate_query_logs(admin_db_conn)
     return admin_db_conn
 
 
@@ -60,16 +71,30 @@ def init_law_agent():
     chain = get_law_qa_chain(law_agent, model)
     return chain
 
-async def init_law_flow(with_memory=False, use_multi_query_retriever=True):
-    global graph, asqlite_conn
+async def init_law_flow(with_memory=False, use_multi_query_retriever=True, adaptive_multi_query=None,
+                        speculative_agent=None):
+    global graph, asqlite_conn, answer_cache
     llm = get_langgraph_model()
     embedding = AliEmbeddings()
-    law_index_name = SystemConfig.get_law_index_name()
-    law_retriever = get_es_retriever(law_index_name, embedding)
+    law_retriever = get_law_retriever(embedding)
+    # 缓存版本取自底层检索器的索引，需在包装多查询检索器之前创建
+    result_cache = get_retrieval_cache(law_retriever)
+    if SystemConfig.is_answer_cache_enabled():
+        answer_cache = SemanticAnswerCache(embedding,
+                                           path=SystemConfig.get_answer_cache_path(),
+                                           threshold=SystemConfig.get_answer_cache_threshold(),
+                                           ttl_seconds=SystemConfig.get_answer_cache_ttl_seconds(),
+                                           max_entries=SystemConfig.get_answer_cache_max_entries(),
+                                           version_fn=get_index_version_fn(law_retriever))
+        metrics.register_collector("answer_cache", answer_cache.stats)
     if use_multi_query_retriever:
-        law_retriever = get_multi_query_retriever(law_retriever, llm)
+        law_retriever = get_multi_query_retriever(law_retriever, llm, adaptive=adaptive_multi_query)
 
-    retriever_tool = get_law_documents_retriever_tool(law_retriever)
+    article_index = ArticleIndex.load_if_exists(SystemConfig.get_article_index_path())
+    # 预取与检索工具使用同一个检索器
+    prefetcher = get_retrieval_prefetcher(law_retriever)
+    retriever_tool = get_law_documents_retriever_tool(law_retriever, article_index, result_cache,
+                                                      prefetcher=prefetcher)
 
     # 检查点和存储器
     checkpoints_db_name = SystemConfig.get_checkpoints_db_name()
@@ -78,26 +103,62 @@ async def init_law_flow(with_memory=False, use_multi_query_retriever=True):
     await checkpoint_saver.setup()
     # store = AsyncSqliteStore.from_conn_string("async_store.sqlite")
     # store = await store.__aenter__()
-    graph = get_law_qa_flow(llm, embedding, law_retriever, [retriever_tool], checkpoint_saver, None)
+    classifier = None
+    if SystemConfig.is_legal_classifier_enabled():
+        classifier = LegalQuestionClassifier.load_if_exists(
+            SystemConfig.get_legal_classifier_path(),
+            high_threshold=SystemConfig.get_legal_classifier_high_threshold(),
+            low_threshold=SystemConfig.get_legal_classifier_low_threshold())
+    history_manager = None
+    if SystemConfig.is_history_manager_enabled():
+        history_manager = HistoryManager(llm,
+                                         max_turns=SystemConfig.get_history_max_turns(),
+                                         max_tokens=SystemConfig.get_history_max_tokens(),
+                                         summary_max_tokens=SystemConfig.get_history_summary_max_tokens())
+    if speculative_agent is None:
+        speculative_agent = SystemConfig.is_speculative_agent_enabled()
+    graph = get_law_qa_flow(llm, embedding, law_retriever, [retriever_tool], checkpoint_saver, None, classifier,
+                            speculative_agent, prefetcher, history_manager)
 
     # print("checkpoint:", await checkpoint_saver.aget({"configurable": {"thread_id": "1"}}))
     return graph
 
 
-async def chat(message, history):
-    # chain = init_law_agent()
-    # out_callback = OutCallbackHandler()
-    # task = asyncio.create_task(
-    #     chain.ainvoke({"question": message}, config={"callbacks": [out_callback]}))
+async def stream_answer(message: str, thread_id: str, result: dict = None):
+    """
+    流式输出回答片段。相似问题命中回答缓存时直接输出缓存的回答，并写入会话历史，
+    result["cache_hit"] 标记是否命中；会话此前没有历史时，完整走完流程的法律问题回答写入缓存
+    """
+    result = result if result is not None else {}
+    result["cache_hit"] = False
+    config = {"configurable": {"thread_id": thread_id}}
+    cacheable = answer_cache is not None and answer_cache.is_cacheable(message)
+    cached = None
+    if cacheable:
+        # 回答缓存只是优化，出错时照常走完整流程
+        try:
+            cached = await answer_cache.lookup(message)
+        except Exception as e:
+            metrics.incr("answer_cache_errors")
+            print(f"Answer cache lookup failed: {e}")
+        if cached is not None:
+            result["cache_hit"] = True
+            # 追问时需要这一轮的问答作为上下文
+            await graph.aupdate_state(config, {"messages": [HumanMessage(content=message),
+                                                            AIMessage(content=cached.answer)]},
+                                      as_node=NODE_LAW_AGENT)
+            yield cached.answer
+            return
+
+    if cacheable:
+        # 会话已有历史或摘要时，回答可能用到该用户此前提供的信息，不能写入所有用户共享的缓存
+        state = await graph.aget_state(config)
+        cacheable = not state.values.get("summary") and not any(
+            isinstance(message, HumanMessage) for message in state.values.get("messages", []))
 
-    global graph
-    config = {"configurable": {"thread_id": default_user_id}}
     full_response = ""
-    content = ""
     async for chunk in graph.astream(
-            {"messages": [{"role": "user",
-                           # "content": "我骑车正常行驶在正确的非机动车道上，在通过一个路口时慢行并左右观察确认无异常时通过了，但是此时从对面突然冲出来一个小孩，我无法立即刹车因此将他撞倒，我需要承担责任吗？"}]},
-                           "content": message}]},
+            {"messages": [{"role": "user", "content": message}]},
             config=config,
             stream_mode=["messages", "custom"],
             subgraphs=True):
@@ -113,7 +174,30 @@ async def chat(message, history):
         ai_message = chunk[1][0]
         if ai_message.content == "":
             continue
-        full_response = full_response + ai_message.content
+        full_response += ai_message.content
+        yield ai_message.content
+
+    if cacheable and full_response:
+        # 非法律问题的固定回复不缓存
+        state = await graph.aget_state(config)
+        if state.values.get("is_legal_question"):
+            # 回答已经输出完毕，写缓存失败不影响本次请求
+            try:
+                await answer_cache.add(message, full_response)
+            except Exception as e:
+                metrics.incr("answer_cache_errors")
+                print(f"Answer cache add failed: {e}")
+
+
+async def chat(message, history):
+    # chain = init_law_agent()
+    # out_callback = OutCallbackHandler()
+    # task = asyncio.create_task(
+    #     chain.ainvoke({"question": message}, config={"callbacks": [out_callback]}))
+
+    full_response = ""
+    async for content in stream_answer(message, default_user_id):
+        full_response = full_response + content
         yield full_response
         # print(chunk.content, end="")
 
@@ -127,31 +211,8 @@ async def run_shell() -> None:
             break
         print("\n法律小助手:", end="")
 
-        config = {"configurable": {"thread_id": "1"}}
-        full_response = ""
-        content = ""
-        async for chunk in graph.astream(
-                {"messages": [{"role": "user",
-                               # "content": "我骑车正常行驶在正确的非机动车道上，在通过一个路口时慢行并左右观察确认无异常时通过了，但是此时从对面突然冲出来一个小孩，我无法立即刹车因此将他撞倒，我需要承担责任吗？"}]},
-                               "content": question}]},
-                config=config,
-                stream_mode=["messages", "custom"],
-                subgraphs=True):
-            # pass
-            # print("received: ", chunk)
-            if chunk[1] == "messages":
-                continue
-            chunk = chunk[2]["llm_chunk"]
-            if chunk[0] != "messages":
-                continue
-            # 工具节点的输出不打印
-            metadata = chunk[1][1]
-            if metadata["langgraph_node"] == "tools":
-                continue
-            ai_message = chunk[1][0]
-            if ai_message.content == "":
-                continue
-            print(ai_message.content, end="")
+        async for content in stream_answer(question, "1"):
+            print(content, end="")
         print()
 
 
@@ -212,7 +273,8 @@ async def is_request_already_processed(request_id: str) -> bool:
         return False
 
 
-async def log_query_data(user_id: str, question: str, response: str, response_time: float, status: str = "success", request_id: str = None):
+async def log_query_data(user_id: str, question: str, response: str, response_time: float, status: str = "success", request_id: str = None,
+                         cache_hit: bool = False):
     """记录请求据到后台管理数据库"""
     global admin_db_conn
     if not admin_db_conn:
@@ -235,9 +297,9 @@ async def log_query_data(user_id: str, question: str, response: str, response_ti
 
         # 记录查询日志
         await admin_db_conn.execute(
-            """INSERT INTO query_logs (user_id, question, response, response_time, status, timestamp, request_id)
-               VALUES (?, ?, ?, ?, ?, ?, ?)""",
-            (user_id, question, response, response_time, status, current_time, request_id)
+            """INSERT INTO query_logs (user_id, question, response, response_time, status, timestamp, request_id, cache_hit)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (user_id, question, response, response_time, status, current_time, request_id, int(cache_hit))
         )
 
         # 更新用户统计
@@ -288,33 +350,16 @@ async def get_ai_response_with_timeout(
     if not request_id:
         request_id = generate_request_id()
 
-    config = {"configurable": {"thread_id": user_id}}
     full_response = ""
+    result = {}
     start_time = time.time()
 
     try:
         # 使用asyncio.wait_for实现超时控制
         async def collect_response():
             nonlocal full_response
-            async for chunk in graph.astream(
-                {"messages": [{"role": "user", "content": message}]},
-                config=config,
-                stream_mode=["messages", "custom"],
-                subgraphs=True
-            ):
-                if chunk[1] == "messages":
-                    continue
-                chunk_data = chunk[2]["llm_chunk"]
-                if chunk_data[0] != "messages":
-                    continue
-                # 工具节点的输出不打印
-                metadata = chunk_data[1][1]
-                if metadata["langgraph_node"] == "tools":
-                    continue
-                ai_message = chunk_data[1][0]
-                if ai_message.content == "":
-                    continue
-                full_response += ai_message.content
+            async for content in stream_answer(message, user_id, result):
+                full_response += content
 
         if timeout and timeout > 0:
             await asyncio.wait_for(collect_response(), timeout=timeout)
@@ -323,7 +368,8 @@ async def get_ai_response_with_timeout(
 
         # 记录成功的查询数据
         response_time = time.time() - start_time
-        log_success = await log_query_data(user_id, message, full_response, response_time, "success", request_id)
+        log_success = await log_query_data(user_id, message, full_response, response_time, "success", request_id,
+                                           cache_hit=result.get("cache_hit", False))
 
         # 如果记录成功，从pending_requests中移除
         if log_success and request_id in pending_requests:
@@ -406,6 +452,9 @@ async def lifespan(app: FastAPI):
         await asqlite_conn.close()
     if admin_db_conn:
         await admin_db_conn.close()
+    await close_es_clients()
+    if answer_cache is not None:
+        answer_cache.save()
     # 关闭配置管理器
     config_manager.close()
 
@@ -448,6 +497,12 @@ async def api_chat(
         return "抱歉，系统暂时无法处理您的请求，请稍后再试"
 
 
+@app.get("/api/metrics")
+async def api_metrics():
+    """进程内运行指标（缓存命中率、批处理大小等）"""
+    return metrics.snapshot()
+
+
 async def run_web() -> None:
     import gradio as gr
     await init_law_flow()
@@ -0,0 +1,77 @@
+"""
+检索效果与延迟对比：dense（仅kNN） vs hybrid（BM25 + kNN，RRF融合）
+评测集为 jsonl，每行 {"question": "...", "expected": ["第二十条", ...]}，
+召回的切片文本或条号包含任一 expected 即视为命中
+用法: python -m benchmark.bench_retrieval --eval eval.jsonl --k 3
+"""
+
+import argparse
+import json
+import statistics
+import time
+from typing import Dict, List
+
+from config.config_manager import SystemConfig
+from embedding.embedding import AliEmbeddings
+from retriever.retriever import get_es_retriever
+
+DEFAULT_EVAL_SET = [
+    {"question": "正当防卫", "expected": ["第二十条"]},
+    {"question": "刑法第二十条", "expected": ["第二十条"]},
+    {"question": "故意杀人罪判几年", "expected": ["第二百三十二条"]},
+    {"question": "民法典第一千一百六十五条", "expected": ["第一千一百六十五条"]},
+    {"question": "离婚后孩子抚养权归谁", "expected": ["第一千零八十四条"]},
+    {"question": "醉酒驾驶机动车怎么处罚", "expected": ["第一百三十三条之一"]},
+]
+
+
+def _load_eval_set(path: str) -> List[Dict]:
+    if not path:
+        return DEFAULT_EVAL_SET
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _is_hit(docs, expected: List[str]) -> bool:
+    for doc in docs:
+        haystack = doc.page_content + (doc.metadata.get("article") or "")
+        if any(item in haystack for item in expected):
+            return True
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="dense 与 hybrid 检索对比")
+    parser.add_argument("--eval", default=None, help="评测集 jsonl 路径，默认使用内置样例")
+    parser.add_argument("--index", default=None, help="索引或别名，默认取配置 law_index_name")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5, help="每个问题重复查询次数，用于统计延迟")
+    args = parser.parse_args()
+
+    eval_set = _load_eval_set(args.eval)
+    index_name = args.index or SystemConfig.get_law_index_name()
+    embedding = AliEmbeddings()
+    # 预先嵌入，延迟只统计 ES 部分（之后的查询向量命中缓存）
+    for item in eval_set:
+        embedding.embed_query(item["question"])
+
+    for mode in ("dense", "hybrid"):
+        retriever = get_es_retriever(index_name, embedding, mode=mode)
+        retriever.k = args.k
+        latencies, hits = [], 0
+        for item in eval_set:
+            docs = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                docs = retriever.invoke(item["question"])
+                latencies.append((time.perf_counter() - start) * 1000)
+            hits += _is_hit(docs, item["expected"])
+
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0]
+        print(f"{mode:>6}: recall@{args.k} = {hits / len(eval_set):.2%}，"
+              f"延迟 p50 {statistics.median(latencies):.1f}ms / p95 {p95:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
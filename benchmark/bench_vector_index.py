@@ -0,0 +1,139 @@
+"""
+向量维度与量化方式对比
+以 1024 维 float 向量的精确检索（script_score）结果为基准，对每种 维度:索引类型 组合
+单独建索引，统计索引大小、kNN 查询延迟和 recall@k（与基准 top-k 的重合比例）
+用法: python -m benchmark.bench_vector_index --path ../Law-Book --variants 1024:hnsw 1024:int8_hnsw 512:int8_hnsw
+"""
+
+import argparse
+import statistics
+import time
+from typing import Dict, List, Tuple
+
+from elasticsearch import helpers
+
+from benchmark.bench_retrieval import _load_eval_set
+from embedding.article_parser import LawArticleSplitter
+from embedding.embedding import AliEmbeddings
+from embedding.loader import LawLoader
+from embedding.manifest import assign_chunk_ids
+from embedding.store import TEXT_FIELD, VECTOR_FIELD, LawDocumentStore
+from retriever.es_client import get_es_client
+
+BASELINE = (1024, "hnsw")
+_INDEX_PREFIX = "bench_vector"
+
+
+def _parse_variant(value: str) -> Tuple[int, str]:
+    dims, _, index_type = value.partition(":")
+    return int(dims), index_type or "hnsw"
+
+
+def _build_index(es_client, index_name: str, docs, ids: List[str], dims: int, index_type: str,
+                 m: int, ef_construction: int) -> AliEmbeddings:
+    embeddings = AliEmbeddings(dimension=dims)
+    store = LawDocumentStore(es_client, embeddings)
+    if es_client.indices.exists(index=index_name):
+        es_client.indices.delete(index=index_name)
+    store.create_index_mapping(index_name, store.vector_index_options(index_type, m, ef_construction))
+
+    vectors = embeddings.embed_documents([doc.page_content for doc in docs])
+    actions = ({"_index": index_name, "_id": chunk_id, TEXT_FIELD: doc.page_content, VECTOR_FIELD: vector,
+                "metadata": doc.metadata} for chunk_id, doc, vector in zip(ids, docs, vectors))
+    helpers.bulk(es_client, actions, chunk_size=500)
+    es_client.indices.refresh(index=index_name)
+    es_client.options(request_timeout=3600).indices.forcemerge(index=index_name, max_num_segments=1)
+    return embeddings
+
+
+def _index_size(es_client, index_name: str) -> int:
+    stats = es_client.indices.stats(index=index_name, metric="store")
+    return stats["indices"][index_name]["primaries"]["store"]["size_in_bytes"]
+
+
+def _exact_top_k(es_client, index_name: str, vector: List[float], k: int) -> List[str]:
+    """暴力计算余弦相似度，作为召回率的基准"""
+    response = es_client.search(index=index_name, size=k, source=False, query={
+        "script_score": {
+            "query": {"match_all": {}},
+            "script": {"source": f"cosineSimilarity(params.query_vector, '{VECTOR_FIELD}') + 1.0",
+                       "params": {"query_vector": vector}},
+        }
+    })
+    return [hit["_id"] for hit in response["hits"]["hits"]]
+
+
+def _knn_top_k(es_client, index_name: str, vector: List[float], k: int, num_candidates: int) -> List[str]:
+    response = es_client.search(index=index_name, size=k, source=False, knn={
+        "field": VECTOR_FIELD, "query_vector": vector, "k": k, "num_candidates": num_candidates,
+    })
+    return [hit["_id"] for hit in response["hits"]["hits"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量维度与量化方式对比")
+    parser.add_argument("--path", default="../Law-Book", help="法律文档目录")
+    parser.add_argument("--eval", default=None, help="评测问题 jsonl 路径，默认使用内置样例")
+    parser.add_argument("--variants", nargs="+", default=["1024:hnsw", "1024:int8_hnsw", "512:int8_hnsw",
+                                                           "256:int8_hnsw"],
+                        help="维度:索引类型，索引类型为 hnsw / int8_hnsw / int4_hnsw")
+    parser.add_argument("--limit", type=int, default=0, help="只取前 N 个切片，0 表示全部")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--num-candidates", type=int, default=50)
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5, help="每个问题重复查询次数，用于统计延迟")
+    parser.add_argument("--keep", action="store_true", help="保留对比用的索引")
+    args = parser.parse_args()
+
+    es_client = get_es_client()
+    docs = LawLoader(args.path).load_and_split(text_splitter=LawArticleSplitter())
+    if args.limit:
+        docs = docs[:args.limit]
+    ids = assign_chunk_ids(docs)
+    questions = [item["question"] for item in _load_eval_set(args.eval)]
+    print(f"切片 {len(docs)} 个，问题 {len(questions)} 个")
+
+    variants = [_parse_variant(value) for value in args.variants]
+    if BASELINE not in variants:
+        variants.insert(0, BASELINE)
+
+    index_names, embeddings_by_dims = {}, {}
+    for dims, index_type in variants:
+        index_name = f"{_INDEX_PREFIX}_{dims}_{index_type}"
+        index_names[(dims, index_type)] = index_name
+        embeddings_by_dims[dims] = _build_index(es_client, index_name, docs, ids, dims, index_type,
+                                                args.m, args.ef_construction)
+
+    # 同一维度的问题向量只嵌入一次
+    query_vectors: Dict[int, List[List[float]]] = {
+        dims: embeddings.embed_documents(questions) for dims, embeddings in embeddings_by_dims.items()}
+    baseline_index = index_names[BASELINE]
+    truth = [set(_exact_top_k(es_client, baseline_index, vector, args.k)) for vector in query_vectors[BASELINE[0]]]
+
+    baseline_size = _index_size(es_client, baseline_index)
+    print(f"{'variant':>16} {'size(MB)':>10} {'ratio':>7} {'recall@' + str(args.k):>10} {'p50(ms)':>9} {'p95(ms)':>9}")
+    for (dims, index_type), index_name in index_names.items():
+        latencies, recalls = [], []
+        for vector, expected in zip(query_vectors[dims], truth):
+            found = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                found = _knn_top_k(es_client, index_name, vector, args.k, args.num_candidates)
+                latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(expected & set(found)) / len(expected) if expected else 1.0)
+
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0]
+        size = _index_size(es_client, index_name)
+        label = f"{dims}:{index_type}"
+        print(f"{label:>16} {size / 1024 / 1024:>10.1f} {size / baseline_size:>7.2f} "
+              f"{statistics.mean(recalls):>10.2%} {statistics.median(latencies):>9.1f} {p95:>9.1f}")
+
+    if not args.keep:
+        for index_name in index_names.values():
+            es_client.indices.delete(index=index_name)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,11 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# 按配置键后缀做类型转换
+_INT_SUFFIXES = ('_timeout', '_length', '_port', '_entries', '_concurrency', '_ms', '_candidates', '_k', '_seconds',
+                 '_connections', '_tokens', '_dimension', '_m', '_construction', '_turns')
+_FLOAT_SUFFIXES = ('_qps', '_weight', '_score', '_margin', '_confidence', '_threshold')
+
 
 class ConfigManager:
     """同步配置管理器"""
@@ -61,11 +66,11 @@ class ConfigManager:
                 if key in self._config_cache:
                     value = self._config_cache[key]
                     # 类型转换
-                    if key.endswith('_timeout') or key.endswith('_length'):
-                        return int(value)
-                    elif key.endswith('_port'):
+                    if key.endswith(_INT_SUFFIXES):
                         return int(value)
-                    elif key == 'enable_analytics':
+                    elif key.endswith(_FLOAT_SUFFIXES):
+                        return float(value)
+                    elif key.startswith('enable_'):
                         return value.lower() == 'true'
                     return value
                 return default
@@ -144,6 +149,69 @@ DEFAULT_CONFIGS = {
     "checkpoints_db_name": "async_checkpoints.sqlite",  # 对应config.CHECKPOINTS_DB_NAME
     "api_host": "127.0.0.1",  # 对应config.API_HOST
     "api_port": 8000,  # 对应config.API_PORT
+
+    # 法律问题分类配置
+    "enable_legal_classifier": True,
+    "legal_classifier_path": "legal_classifier.json",
+    "legal_classifier_high_threshold": 0.9,
+    "legal_classifier_low_threshold": 0.1,
+    "enable_speculative_agent": False,
+
+    # 检索预取配置
+    "enable_retrieval_prefetch": True,
+    "retrieval_prefetch_similarity_threshold": 0.5,
+    "retrieval_prefetch_ttl_seconds": 60,
+
+    # 对话历史配置
+    "enable_history_manager": True,
+    "history_max_turns": 3,
+    "history_max_tokens": 3000,
+    "history_summary_max_tokens": 500,
+
+    # 回答缓存配置
+    "enable_answer_cache": True,
+    "answer_cache_path": "answer_cache",
+    "answer_cache_threshold": 0.95,
+    "answer_cache_ttl_seconds": 86400,
+    "answer_cache_max_entries": 5000,
+
+    # 向量嵌入配置
+    "embedding_dimension": 1024,
+    "vector_index_type": "hnsw",
+    "vector_index_m": 16,
+    "vector_index_ef_construction": 100,
+    "embedding_cache_path": "embedding_cache.sqlite",
+    "embedding_cache_max_entries": 500000,
+    "embedding_max_concurrency": 8,
+    "embedding_rate_qps": 20,
+    "enable_query_batching": True,
+    "query_batch_wait_ms": 5,
+
+    # 入库配置
+    "ingest_manifest_path": "ingest_manifest.sqlite",
+    "article_index_path": "article_index.json",
+
+    # 检索配置
+    "es_max_connections": 32,
+    "es_request_timeout": 30,
+    "retriever_backend": "es",
+    "local_index_path": "local_index",
+    "retriever_mode": "dense",
+    "hybrid_candidates": 20,
+    "hybrid_bm25_weight": 1.0,
+    "hybrid_knn_weight": 1.0,
+    "rrf_k": 60,
+    "enable_law_router": True,
+    "law_router_path": "law_router.json",
+    "law_router_min_confidence": 0.6,
+    "retriever_tool_max_tokens": 1500,
+    "enable_retrieval_cache": True,
+    "retrieval_cache_max_entries": 1024,
+    "retrieval_cache_ttl_seconds": 600,
+    "retrieval_cache_version_check_seconds": 30,
+    "enable_adaptive_multi_query": False,
+    "multi_query_min_top_score": 0.8,
+    "multi_query_min_score_margin": 0.02,
 }
 
 # 配置项描述
@@ -158,10 +226,59 @@ CONFIG_DESCRIPTIONS = {
     "web_port": "Web界面端口号",
     "web_username": "Web界面用户名",
     "web_password": "Web界面密码",
-    "law_index_name": "法律文档索引名称",
+    "law_index_name": "法律文档索引名称（别名，重建索引时原子切换）",
     "checkpoints_db_name": "检查点数据库名称",
     "api_host": "API服务器主机地址",
     "api_port": "API服务器端口号",
+    "enable_legal_classifier": "是否先用本地分类器判断法律问题，不确定时再调用 LLM",
+    "legal_classifier_path": "本地法律问题分类器模型路径",
+    "legal_classifier_high_threshold": "本地分类器判定为法律问题的最低概率",
+    "legal_classifier_low_threshold": "本地分类器判定为非法律问题的最高概率",
+    "enable_speculative_agent": "是否在判断法律问题的同时提前运行 agent，非法律问题时取消",
+    "enable_retrieval_prefetch": "是否在问题到达时提前开始检索，检索工具输入相近时直接使用",
+    "retrieval_prefetch_similarity_threshold": "检索工具输入与原问题的最低相似度（字符二元组 Jaccard），达到才使用预取结果",
+    "retrieval_prefetch_ttl_seconds": "未使用的预取结果保留秒数",
+    "enable_history_manager": "是否整理对话历史：保留最近几轮，更早的对话合并为摘要",
+    "history_max_turns": "原样保留的最近对话轮数",
+    "history_max_tokens": "摘要和历史对话的 token 预算",
+    "history_summary_max_tokens": "对话摘要的最大 token 数",
+    "enable_answer_cache": "是否对相似的法律问题直接返回缓存的回答",
+    "answer_cache_path": "回答缓存文件前缀（生成 .npy 和 .json 两个文件）",
+    "answer_cache_threshold": "命中回答缓存所需的问题向量余弦相似度",
+    "answer_cache_ttl_seconds": "缓存回答的有效期（秒）",
+    "answer_cache_max_entries": "回答缓存最大条目数",
+    "embedding_dimension": "向量维度（text-embedding-v4 支持 2048/1536/1024/768/512/256/128/64），修改后需重建索引",
+    "vector_index_type": "向量索引类型：hnsw 为 float 向量，int8_hnsw / int4_hnsw 为量化向量，修改后需重建索引",
+    "vector_index_m": "HNSW 图中每个节点的邻居数",
+    "vector_index_ef_construction": "HNSW 建图时的候选队列长度",
+    "embedding_cache_path": "向量嵌入缓存数据库路径",
+    "embedding_cache_max_entries": "向量嵌入缓存最大条目数",
+    "embedding_max_concurrency": "向量嵌入接口最大并发批次数",
+    "embedding_rate_qps": "向量嵌入接口每秒最大调用次数",
+    "enable_query_batching": "是否合并并发的查询向量请求",
+    "query_batch_wait_ms": "查询向量合并的最长等待时间（毫秒）",
+    "ingest_manifest_path": "增量入库清单数据库路径",
+    "article_index_path": "条文精确查找索引文件路径，入库时生成",
+    "es_max_connections": "每个 Elasticsearch 节点保持的最大长连接数",
+    "es_request_timeout": "Elasticsearch 请求超时时间（秒）",
+    "retriever_backend": "检索后端：es 为 Elasticsearch，local 为本地内存映射向量索引",
+    "local_index_path": "本地向量索引目录",
+    "retriever_mode": "ES检索模式：dense 为仅向量检索，hybrid 为 BM25 + 向量检索融合",
+    "hybrid_candidates": "混合检索每一路参与融合的候选数",
+    "hybrid_bm25_weight": "混合检索中 BM25 结果的融合权重",
+    "hybrid_knn_weight": "混合检索中向量结果的融合权重",
+    "rrf_k": "倒数排名融合的平滑常数",
+    "enable_law_router": "是否按问题预测的法律过滤检索范围（需先生成路由词典）",
+    "law_router_path": "法律路由词典文件路径",
+    "law_router_min_confidence": "按法律过滤所需的最低路由置信度，低于该值时检索全库",
+    "retriever_tool_max_tokens": "法律检索工具单次输出的最大 token 数",
+    "enable_retrieval_cache": "是否缓存法律检索工具的检索结果",
+    "retrieval_cache_max_entries": "检索结果缓存最大条目数",
+    "retrieval_cache_ttl_seconds": "检索结果缓存有效期（秒）",
+    "retrieval_cache_version_check_seconds": "检查索引版本变化的间隔（秒），版本变化时清空检索缓存",
+    "enable_adaptive_multi_query": "是否在原问题检索结果可信时跳过 LLM 问题扩展",
+    "multi_query_min_top_score": "跳过问题扩展所需的最高向量相似度",
+    "multi_query_min_score_margin": "跳过问题扩展所需的第一名领先第二名的相似度差",
 }
 
 
@@ -241,6 +358,260 @@ class SystemConfig:
         """获取API端口号"""
         return get_config_value("api_port", DEFAULT_CONFIGS["api_port"])
 
+    # 法律问题分类配置
+    @staticmethod
+    def is_legal_classifier_enabled() -> bool:
+        """是否启用本地法律问题分类器"""
+        return get_config_value("enable_legal_classifier", DEFAULT_CONFIGS["enable_legal_classifier"])
+
+    @staticmethod
+    def get_legal_classifier_path() -> str:
+        """获取本地法律问题分类器模型路径"""
+        return get_config_value("legal_classifier_path", DEFAULT_CONFIGS["legal_classifier_path"])
+
+    @staticmethod
+    def get_legal_classifier_high_threshold() -> float:
+        """获取判定为法律问题的最低概率"""
+        return get_config_value("legal_classifier_high_threshold", DEFAULT_CONFIGS["legal_classifier_high_threshold"])
+
+    @staticmethod
+    def get_legal_classifier_low_threshold() -> float:
+        """获取判定为非法律问题的最高概率"""
+        return get_config_value("legal_classifier_low_threshold", DEFAULT_CONFIGS["legal_classifier_low_threshold"])
+
+    @staticmethod
+    def is_speculative_agent_enabled() -> bool:
+        """是否与法律问题判断并发运行 agent"""
+        return get_config_value("enable_speculative_agent", DEFAULT_CONFIGS["enable_speculative_agent"])
+
+    # 检索预取配置
+    @staticmethod
+    def is_retrieval_prefetch_enabled() -> bool:
+        """是否启用检索预取"""
+        return get_config_value("enable_retrieval_prefetch", DEFAULT_CONFIGS["enable_retrieval_prefetch"])
+
+    @staticmethod
+    def get_retrieval_prefetch_similarity_threshold() -> float:
+        """获取使用预取结果的最低相似度"""
+        return get_config_value("retrieval_prefetch_similarity_threshold",
+                                DEFAULT_CONFIGS["retrieval_prefetch_similarity_threshold"])
+
+    @staticmethod
+    def get_retrieval_prefetch_ttl_seconds() -> int:
+        """获取未使用的预取结果保留秒数"""
+        return get_config_value("retrieval_prefetch_ttl_seconds", DEFAULT_CONFIGS["retrieval_prefetch_ttl_seconds"])
+
+    # 对话历史配置
+    @staticmethod
+    def is_history_manager_enabled() -> bool:
+        """是否启用对话历史整理"""
+        return get_config_value("enable_history_manager", DEFAULT_CONFIGS["enable_history_manager"])
+
+    @staticmethod
+    def get_history_max_turns() -> int:
+        """获取原样保留的最近对话轮数"""
+        return get_config_value("history_max_turns", DEFAULT_CONFIGS["history_max_turns"])
+
+    @staticmethod
+    def get_history_max_tokens() -> int:
+        """获取摘要和历史对话的 token 预算"""
+        return get_config_value("history_max_tokens", DEFAULT_CONFIGS["history_max_tokens"])
+
+    @staticmethod
+    def get_history_summary_max_tokens() -> int:
+        """获取对话摘要的最大 token 数"""
+        return get_config_value("history_summary_max_tokens", DEFAULT_CONFIGS["history_summary_max_tokens"])
+
+    # 回答缓存配置
+    @staticmethod
+    def is_answer_cache_enabled() -> bool:
+        """是否启用回答缓存"""
+        return get_config_value("enable_answer_cache", DEFAULT_CONFIGS["enable_answer_cache"])
+
+    @staticmethod
+    def get_answer_cache_path() -> str:
+        """获取回答缓存文件前缀"""
+        return get_config_value("answer_cache_path", DEFAULT_CONFIGS["answer_cache_path"])
+
+    @staticmethod
+    def get_answer_cache_threshold() -> float:
+        """获取命中回答缓存所需的相似度"""
+        return get_config_value("answer_cache_threshold", DEFAULT_CONFIGS["answer_cache_threshold"])
+
+    @staticmethod
+    def get_answer_cache_ttl_seconds() -> int:
+        """获取缓存回答的有效期（秒）"""
+        return get_config_value("answer_cache_ttl_seconds", DEFAULT_CONFIGS["answer_cache_ttl_seconds"])
+
+    @staticmethod
+    def get_answer_cache_max_entries() -> int:
+        """获取回答缓存最大条目数"""
+        return get_config_value("answer_cache_max_entries", DEFAULT_CONFIGS["answer_cache_max_entries"])
+
+    # 向量嵌入配置
+    @staticmethod
+    def get_embedding_dimension() -> int:
+        """获取向量维度"""
+        return get_config_value("embedding_dimension", DEFAULT_CONFIGS["embedding_dimension"])
+
+    @staticmethod
+    def get_vector_index_type() -> str:
+        """获取向量索引类型"""
+        return get_config_value("vector_index_type", DEFAULT_CONFIGS["vector_index_type"])
+
+    @staticmethod
+    def get_vector_index_m() -> int:
+        """获取 HNSW 邻居数"""
+        return get_config_value("vector_index_m", DEFAULT_CONFIGS["vector_index_m"])
+
+    @staticmethod
+    def get_vector_index_ef_construction() -> int:
+        """获取 HNSW 建图候选队列长度"""
+        return get_config_value("vector_index_ef_construction", DEFAULT_CONFIGS["vector_index_ef_construction"])
+
+    @staticmethod
+    def get_embedding_cache_path() -> str:
+        """获取向量嵌入缓存数据库路径"""
+        return get_config_value("embedding_cache_path", DEFAULT_CONFIGS["embedding_cache_path"])
+
+    @staticmethod
+    def get_embedding_cache_max_entries() -> int:
+        """获取向量嵌入缓存最大条目数"""
+        return get_config_value("embedding_cache_max_entries", DEFAULT_CONFIGS["embedding_cache_max_entries"])
+
+    @staticmethod
+    def get_embedding_max_concurrency() -> int:
+        """获取向量嵌入接口最大并发批次数"""
+        return get_config_value("embedding_max_concurrency", DEFAULT_CONFIGS["embedding_max_concurrency"])
+
+    @staticmethod
+    def get_embedding_rate_limit() -> float:
+        """获取向量嵌入接口每秒最大调用次数"""
+        return get_config_value("embedding_rate_qps", DEFAULT_CONFIGS["embedding_rate_qps"])
+
+    @staticmethod
+    def is_query_batching_enabled() -> bool:
+        """是否合并并发的查询向量请求"""
+        return get_config_value("enable_query_batching", DEFAULT_CONFIGS["enable_query_batching"])
+
+    @staticmethod
+    def get_query_batch_wait_ms() -> int:
+        """获取查询向量合并的最长等待时间（毫秒）"""
+        return get_config_value("query_batch_wait_ms", DEFAULT_CONFIGS["query_batch_wait_ms"])
+
+    # 入库配置
+    @staticmethod
+    def get_ingest_manifest_path() -> str:
+        """获取增量入库清单数据库路径"""
+        return get_config_value("ingest_manifest_path", DEFAULT_CONFIGS["ingest_manifest_path"])
+
+    @staticmethod
+    def get_article_index_path() -> str:
+        """获取条文精确查找索引文件路径"""
+        return get_config_value("article_index_path", DEFAULT_CONFIGS["article_index_path"])
+
+    # 检索配置
+    @staticmethod
+    def get_es_max_connections() -> int:
+        """获取每个 Elasticsearch 节点的最大长连接数"""
+        return get_config_value("es_max_connections", DEFAULT_CONFIGS["es_max_connections"])
+
+    @staticmethod
+    def get_es_request_timeout() -> int:
+        """获取 Elasticsearch 请求超时时间（秒）"""
+        return get_config_value("es_request_timeout", DEFAULT_CONFIGS["es_request_timeout"])
+
+    @staticmethod
+    def get_retriever_backend() -> str:
+        """获取检索后端"""
+        return get_config_value("retriever_backend", DEFAULT_CONFIGS["retriever_backend"])
+
+    @staticmethod
+    def get_local_index_path() -> str:
+        """获取本地向量索引目录"""
+        return get_config_value("local_index_path", DEFAULT_CONFIGS["local_index_path"])
+
+    @staticmethod
+    def get_retriever_mode() -> str:
+        """获取ES检索模式"""
+        return get_config_value("retriever_mode", DEFAULT_CONFIGS["retriever_mode"])
+
+    @staticmethod
+    def get_hybrid_candidates() -> int:
+        """获取混合检索每一路的候选数"""
+        return get_config_value("hybrid_candidates", DEFAULT_CONFIGS["hybrid_candidates"])
+
+    @staticmethod
+    def get_hybrid_bm25_weight() -> float:
+        """获取混合检索中 BM25 的融合权重"""
+        return get_config_value("hybrid_bm25_weight", DEFAULT_CONFIGS["hybrid_bm25_weight"])
+
+    @staticmethod
+    def get_hybrid_knn_weight() -> float:
+        """获取混合检索中向量检索的融合权重"""
+        return get_config_value("hybrid_knn_weight", DEFAULT_CONFIGS["hybrid_knn_weight"])
+
+    @staticmethod
+    def get_rrf_k() -> int:
+        """获取倒数排名融合的平滑常数"""
+        return get_config_value("rrf_k", DEFAULT_CONFIGS["rrf_k"])
+
+    @staticmethod
+    def is_law_router_enabled() -> bool:
+        """是否按法律过滤检索范围"""
+        return get_config_value("enable_law_router", DEFAULT_CONFIGS["enable_law_router"])
+
+    @staticmethod
+    def get_law_router_path() -> str:
+        """获取法律路由词典文件路径"""
+        return get_config_value("law_router_path", DEFAULT_CONFIGS["law_router_path"])
+
+    @staticmethod
+    def get_law_router_min_confidence() -> float:
+        """获取按法律过滤所需的最低路由置信度"""
+        return get_config_value("law_router_min_confidence", DEFAULT_CONFIGS["law_router_min_confidence"])
+
+    @staticmethod
+    def get_retriever_tool_max_tokens() -> int:
+        """获取法律检索工具单次输出的最大 token 数"""
+        return get_config_value("retriever_tool_max_tokens", DEFAULT_CONFIGS["retriever_tool_max_tokens"])
+
+    @staticmethod
+    def is_retrieval_cache_enabled() -> bool:
+        """是否缓存检索结果"""
+        return get_config_value("enable_retrieval_cache", DEFAULT_CONFIGS["enable_retrieval_cache"])
+
+    @staticmethod
+    def get_retrieval_cache_max_entries() -> int:
+        """获取检索结果缓存最大条目数"""
+        return get_config_value("retrieval_cache_max_entries", DEFAULT_CONFIGS["retrieval_cache_max_entries"])
+
+    @staticmethod
+    def get_retrieval_cache_ttl_seconds() -> int:
+        """获取检索结果缓存有效期（秒）"""
+        return get_config_value("retrieval_cache_ttl_seconds", DEFAULT_CONFIGS["retrieval_cache_ttl_seconds"])
+
+    @staticmethod
+    def get_retrieval_cache_version_check_seconds() -> int:
+        """获取检查索引版本变化的间隔（秒）"""
+        return get_config_value("retrieval_cache_version_check_seconds",
+                                DEFAULT_CONFIGS["retrieval_cache_version_check_seconds"])
+
+    @staticmethod
+    def is_adaptive_multi_query_enabled() -> bool:
+        """是否启用自适应问题扩展"""
+        return get_config_value("enable_adaptive_multi_query", DEFAULT_CONFIGS["enable_adaptive_multi_query"])
+
+    @staticmethod
+    def get_multi_query_min_top_score() -> float:
+        """获取跳过问题扩展所需的最高向量相似度"""
+        return get_config_value("multi_query_min_top_score", DEFAULT_CONFIGS["multi_query_min_top_score"])
+
+    @staticmethod
+    def get_multi_query_min_score_margin() -> float:
+        """获取跳过问题扩展所需的领先幅度"""
+        return get_config_value("multi_query_min_score_margin", DEFAULT_CONFIGS["multi_query_min_score_margin"])
+
     # 更新方法（仅针对可动态更新的配置）
     @staticmethod
     def update_max_response_length(length: int) -> bool:
@@ -0,0 +1,228 @@
+# coding: utf-8
+"""
+法律条文解析器
+逐行扫描一次 markdown，按 编/章/节/条/款/项 结构切分：每条一个切片，超长的条按款切分，
+切片长度按字符数计算，不依赖 tiktoken
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain.docstore.document import Document
+from langchain.text_splitter import TextSplitter
+
+_CN_NUM = "零〇一二三四五六七八九十百千万两"
+_NUM = rf"[{_CN_NUM}\d]+"
+
+_HEADING_PATTERN = re.compile(r"^(#{1,6})\s*(.+?)\s*$")
+_PART_PATTERN = re.compile(rf"^第{_NUM}编")
+_CHAPTER_PATTERN = re.compile(rf"^第{_NUM}章")
+_SECTION_PATTERN = re.compile(rf"^第{_NUM}节")
+_ARTICLE_PATTERN = re.compile(rf"^\**(第({_NUM})条(?:之([{_CN_NUM}]+))?)\**(?:[ 　]+|$)(.*)$")
+_ITEM_PATTERN = re.compile(rf"^[（(][{_CN_NUM}]+[）)]")
+_COMMENT_PATTERN = re.compile(r"^<!--.*-->$")
+
+_CN_DIGITS = {"零": 0, "〇": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4,
+              "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_CN_UNITS = {"十": 10, "百": 100, "千": 1000, "万": 10000}
+
+
+def cn_to_int(text: str) -> int:
+    """中文或阿拉伯数字转整数，如“一千一百六十五” -> 1165"""
+    text = text.strip()
+    if text.isdigit():
+        return int(text)
+
+    total, section, number = 0, 0, 0
+    for ch in text:
+        if ch in _CN_DIGITS:
+            number = _CN_DIGITS[ch]
+        elif ch in _CN_UNITS:
+            unit = _CN_UNITS[ch]
+            if unit == 10000:
+                total += (section + number) * unit
+                section = 0
+            else:
+                # “十五”中的“十”前面没有数字
+                section += (number or 1) * unit
+            number = 0
+        else:
+            raise ValueError(f"无法识别的数字: {text}")
+    return total + section + number
+
+
+def int_to_cn(value: int) -> str:
+    """整数转条文中使用的中文数字，如 1165 -> “一千一百六十五”"""
+    if value == 0:
+        return "零"
+    if value >= 10000:
+        high, low = divmod(value, 10000)
+        rest = int_to_cn(low) if low else ""
+        if low and low < 1000:
+            rest = "零" + rest
+        return int_to_cn(high) + "万" + rest
+
+    digits = "零一二三四五六七八九"
+    units = ["", "十", "百", "千"]
+    parts, need_zero = [], False
+    for pos in (3, 2, 1, 0):
+        digit = value // 10 ** pos % 10
+        if digit == 0:
+            need_zero = bool(parts)
+            continue
+        if need_zero:
+            parts.append("零")
+            need_zero = False
+        parts.append(digits[digit] + units[pos])
+    text = "".join(parts)
+    # 10~19 写作“十X”
+    return text[1:] if text.startswith("一十") else text
+
+
+class _Article:
+    """解析中的一条：条号和各款（项并入所属的款）"""
+
+    def __init__(self, label: str, number: int, sub_number: int = 0):
+        self.label = label
+        self.number = number
+        # “第一百三十三条之一”中的“之一”
+        self.sub_number = sub_number
+        self.paragraphs: List[str] = []
+
+    def add_line(self, line: str):
+        if self.paragraphs and _ITEM_PATTERN.match(line):
+            self.paragraphs[-1] += "\n" + line
+        else:
+            self.paragraphs.append(line)
+
+
+class LawArticleSplitter(TextSplitter):
+    """按条切分法律文档，超过 max_chars 的条按款切分，超长的款再按项或字符数切分"""
+
+    def __init__(self, max_chars: int = 500, **kwargs: Any) -> None:
+        self.max_chars = max_chars
+        kwargs.setdefault("chunk_overlap", 0)
+        super().__init__(chunk_size=max_chars, **kwargs)
+
+    def split_text(self, text: str) -> List[str]:
+        return [chunk for chunk, _ in self.parse(text)]
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        """Split documents."""
+        result = []
+        for doc in documents:
+            for chunk, metadata in self.parse(doc.page_content):
+                result.append(Document(page_content=chunk, metadata=metadata | doc.metadata))
+        return result
+
+    def parse(self, text: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """扫描一次全文，返回 (切片文本, 结构化元数据) 列表"""
+        chunks: List[Tuple[str, Dict[str, Any]]] = []
+        headers: Dict[str, str] = {}
+        structure: Dict[str, str] = {}
+        article: Optional[_Article] = None
+        loose_lines: List[str] = []
+
+        def flush():
+            nonlocal article, loose_lines
+            metadata = self._base_metadata(headers, structure)
+            if article is not None:
+                chunks.extend(self._emit_article(article, metadata))
+            elif loose_lines and len(headers) > 1:
+                # 序言等不分条的正文，文件开头的发布信息不入库
+                chunks.extend((piece, metadata) for piece in self._hard_split("\n".join(loose_lines)))
+            article, loose_lines = None, []
+
+        for raw_line in text.splitlines():
+            line = raw_line.strip()
+            if not line or _COMMENT_PATTERN.match(line):
+                continue
+
+            heading = _HEADING_PATTERN.match(line)
+            if heading:
+                flush()
+                level = len(heading.group(1))
+                title = heading.group(2)
+                for deeper in range(level, 7):
+                    headers.pop(f"header{deeper}", None)
+                headers[f"header{level}"] = title
+                self._update_structure(structure, level, title)
+                continue
+
+            match = _ARTICLE_PATTERN.match(line)
+            if match:
+                flush()
+                label, number, sub_number, rest = match.groups()
+                article = _Article(label, cn_to_int(number), cn_to_int(sub_number) if sub_number else 0)
+                if rest:
+                    article.add_line(rest)
+                continue
+
+            if article is not None:
+                article.add_line(line)
+            else:
+                loose_lines.append(line)
+        flush()
+        return chunks
+
+    @staticmethod
+    def _update_structure(structure: Dict[str, str], level: int, title: str):
+        if level == 1:
+            structure.clear()
+            structure["law"] = title
+        elif _PART_PATTERN.match(title):
+            for key in ("part", "chapter", "section"):
+                structure.pop(key, None)
+            structure["part"] = title
+        elif _CHAPTER_PATTERN.match(title):
+            structure.pop("section", None)
+            structure["chapter"] = title
+        elif _SECTION_PATTERN.match(title):
+            structure["section"] = title
+
+    @staticmethod
+    def _base_metadata(headers: Dict[str, str], structure: Dict[str, str]) -> Dict[str, Any]:
+        metadata: Dict[str, Any] = dict(headers)
+        metadata["book"] = headers.get("header1")
+        for key in ("part", "chapter", "section"):
+            if key in structure:
+                metadata[key] = structure[key]
+        return metadata
+
+    def _emit_article(self, article: _Article, metadata: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+        metadata = metadata | {"article": article.label, "article_no": article.number}
+        if article.sub_number:
+            metadata["article_sub_no"] = article.sub_number
+        full_text = f"{article.label} " + "\n".join(article.paragraphs)
+        if len(full_text) <= self.max_chars:
+            return [(full_text, metadata)]
+
+        # 超长的条按款切分，每个切片都带上条号
+        chunks = []
+        for index, paragraph in enumerate(article.paragraphs, start=1):
+            for piece in self._hard_split(paragraph, prefix=f"{article.label} "):
+                chunks.append((piece, metadata | {"paragraph_no": index}))
+        return chunks
+
+    def _hard_split(self, text: str, prefix: str = "") -> List[str]:
+        """优先在项的边界切分，单项仍然超长时按字符数切分"""
+        limit = max(1, self.max_chars - len(prefix))
+        if len(text) <= limit:
+            return [prefix + text]
+
+        pieces, current = [], ""
+        for line in text.split("\n"):
+            while len(line) > limit:
+                if current:
+                    pieces.append(current)
+                    current = ""
+                pieces.append(line[:limit])
+                line = line[limit:]
+            if current and len(current) + 1 + len(line) > limit:
+                pieces.append(current)
+                current = line
+            else:
+                current = f"{current}\n{line}" if current else line
+        if current:
+            pieces.append(current)
+        return [prefix + piece for piece in pieces]
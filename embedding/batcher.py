@@ -0,0 +1,92 @@
+"""
+查询向量微批处理
+把并发到达的 embed_query 请求在几毫秒内合并成一次接口调用，再把向量分发回各自的调用方
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+from metrics.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBatcher:
+    """查询合并器：攒满 max_batch_size 条或等待 max_wait_ms 后发出一批"""
+
+    def __init__(self,
+                 embed_fn: Callable[[List[str]], List[List[float]]],
+                 max_batch_size: int = 10,
+                 max_wait_ms: int = 5,
+                 max_inflight_batches: int = 4):
+        self._embed_fn = embed_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._cond = threading.Condition()
+        self._pending: List[Tuple[str, Future, float]] = []
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight_batches,
+                                            thread_name_prefix="query-batcher")
+        self._worker = None
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._collect_loop, name="query-batcher-collector", daemon=True)
+            self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        """提交一条查询，返回向量的 Future"""
+        future = Future()
+        with self._cond:
+            self._ensure_worker()
+            self._pending.append((text, future, time.perf_counter()))
+            self._cond.notify()
+        return future
+
+    def embed(self, text: str) -> List[float]:
+        return self.submit(text).result()
+
+    async def aembed(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _collect_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # 以最早到达的请求为起点计算等待窗口
+                deadline = self._pending[0][2] + self.max_wait
+                while len(self._pending) < self.max_batch_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_batch_size]
+                self._pending = self._pending[self.max_batch_size:]
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: List[Tuple[str, Future, float]]):
+        # 调用方已取消（如预取、推测执行被取消）的请求跳过；其余标记为运行中，之后不能再被取消
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        # 同一批内相同的文本只嵌入一次
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        start = time.perf_counter()
+        try:
+            vectors: Dict[str, List[float]] = dict(zip(texts, self._embed_fn(texts)))
+        except Exception as e:
+            logger.error(f"批量嵌入查询失败: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        done = time.perf_counter()
+        metrics.observe("embedding_query_batch_size", len(batch))
+        metrics.observe("embedding_query_batch_call_ms", (done - start) * 1000)
+        for text, future, enqueued in batch:
+            metrics.observe("embedding_query_latency_ms", (done - enqueued) * 1000)
+            future.set_result(vectors[text])
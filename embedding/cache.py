@@ -0,0 +1,164 @@
+"""
+向量嵌入缓存
+以 (模型, 维度, instruct, 文本哈希) 为键，将向量以 float32 blob 持久化到 sqlite，
+重复入库的条文和重复出现的问题不再调用嵌入接口
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config.config_manager import SystemConfig
+from metrics.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# sqlite 单条语句的参数个数有上限，批量查询时分段
+_SQL_BATCH = 500
+# 命中时的访问时间先记在内存中，积累到一定条数或时间后批量写回，淘汰前也会写回
+_TOUCH_FLUSH_SIZE = 1000
+_TOUCH_FLUSH_SECONDS = 60
+
+
+class EmbeddingCache:
+    """基于sqlite的内容寻址向量缓存，超过容量时按最近访问时间淘汰（LRU）"""
+
+    def __init__(self, db_path: str = "embedding_cache.sqlite", max_entries: int = 500000):
+        self._db_path = db_path
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_access ON embedding_cache (last_access)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        # key -> 尚未写回的最近访问时间
+        self._touched: Dict[str, float] = {}
+        self._touched_flushed_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, dimension: int, instruct: str, text: str) -> str:
+        """生成缓存键，模型参数不同的向量互不复用"""
+        raw = "\x00".join([model, str(dimension), instruct or "", text])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _encode(vector: List[float]) -> bytes:
+        return array("f", vector).tobytes()
+
+    @staticmethod
+    def _decode(blob: bytes) -> List[float]:
+        vector = array("f")
+        vector.frombytes(blob)
+        return vector.tolist()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        """批量查询，返回命中的 key -> 向量"""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), _SQL_BATCH):
+                part = keys[i:i + _SQL_BATCH]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embedding_cache WHERE key IN ({placeholders})", part).fetchall()
+                for key, blob in rows:
+                    found[key] = self._decode(blob)
+                    self._touched[key] = now
+            if (len(self._touched) >= _TOUCH_FLUSH_SIZE
+                    or time.monotonic() - self._touched_flushed_at >= _TOUCH_FLUSH_SECONDS):
+                self._flush_touched()
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        metrics.incr("embedding_cache_hits", len(found))
+        metrics.incr("embedding_cache_misses", len(keys) - len(found))
+        return found
+
+    def get(self, key: str) -> Optional[List[float]]:
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items: Iterable[Tuple[str, List[float]]]):
+        """批量写入，写入后超出容量则淘汰最久未访问的条目"""
+        now = time.time()
+        rows = [(key, self._encode(vector), now) for key, vector in items]
+        if not rows:
+            return
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embedding_cache (key, vector, last_access) VALUES (?, ?, ?)", rows)
+            self._size += self._conn.total_changes - before
+            if self._max_entries and self._size > self._max_entries:
+                # 淘汰按访问时间排序，先写回内存中的访问记录
+                self._flush_touched()
+                self._evict(self._size - self._max_entries)
+            self._conn.commit()
+
+    def set(self, key: str, vector: List[float]):
+        self.set_many([(key, vector)])
+
+    def _flush_touched(self):
+        """把内存中的访问时间批量写回，需持有锁，由调用方提交"""
+        if self._touched:
+            self._conn.executemany("UPDATE embedding_cache SET last_access = ? WHERE key = ?",
+                                   [(last_access, key) for key, last_access in self._touched.items()])
+            self._touched.clear()
+        self._touched_flushed_at = time.monotonic()
+
+    def _evict(self, count: int):
+        cursor = self._conn.execute(
+            """DELETE FROM embedding_cache WHERE key IN (
+                   SELECT key FROM embedding_cache ORDER BY last_access LIMIT ?)""",
+            (count,))
+        self._size -= cursor.rowcount
+        metrics.incr("embedding_cache_evictions", cursor.rowcount)
+        logger.info(f"嵌入缓存淘汰了 {cursor.rowcount} 条记录")
+
+    def stats(self) -> Dict[str, float]:
+        """命中统计"""
+        total = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "max_entries": self._max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
+
+
+_default_cache: Optional[EmbeddingCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """获取进程内共享的嵌入缓存"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache(SystemConfig.get_embedding_cache_path(),
+                                            SystemConfig.get_embedding_cache_max_entries())
+            metrics.register_collector("embedding_cache", _default_cache.stats)
+        return _default_cache
@@ -1,60 +1,190 @@
-from typing import List
+import asyncio
+import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Coroutine, List, Optional
 
 import dashscope
 from dashscope import TextEmbedding
 from langchain_core.embeddings import Embeddings
 
+from config.config_manager import SystemConfig
+from embedding.batcher import QueryBatcher
+from embedding.cache import EmbeddingCache, get_embedding_cache
+from embedding.limiter import TokenBucket
+from metrics.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 接口单次调用最多支持的文本条数
+BATCH_SIZE = 10
+# text-embedding-v4 支持的输出维度
+SUPPORTED_DIMENSIONS = (2048, 1536, 1024, 768, 512, 256, 128, 64)
+
+_rate_limiter: Optional[TokenBucket] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_embedding_rate_limiter() -> TokenBucket:
+    """嵌入接口的配额按账号计算，进程内所有实例共用一个令牌桶"""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = TokenBucket(SystemConfig.get_embedding_rate_limit())
+        return _rate_limiter
+
+
+class EmbeddingThrottledError(Exception):
+    """接口限流或服务端临时错误，可以重试"""
+
+
+def _run_sync(coro: Coroutine):
+    """在同步代码中运行协程，当前线程已有事件循环时放到新线程中执行"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
 
 class AliEmbeddings(Embeddings):
-    def __init__(self, model_name: str = "text-embedding-v4", api_key: str = None):
+    def __init__(self,
+                 model_name: str = "text-embedding-v4",
+                 api_key: str = None,
+                 dimension: int = None,
+                 instruct: str = "Chinese Laws and Regulations",
+                 cache: Optional[EmbeddingCache] = None,
+                 use_cache: bool = True,
+                 max_concurrency: int = None,
+                 max_retries: int = 5,
+                 batch_queries: bool = None):
         self.model_name = model_name
-        dashscope.api_key = "sk-f1dc8b855d9747e1877fb393664b3335"
+        self.dimension = dimension or SystemConfig.get_embedding_dimension()
+        if self.dimension not in SUPPORTED_DIMENSIONS:
+            raise ValueError(f"不支持的向量维度 {self.dimension}，可选 {SUPPORTED_DIMENSIONS}")
+        self.instruct = instruct
+        # 未命中缓存的文本才会调用接口
+        self.cache = cache or (get_embedding_cache() if use_cache else None)
+        self.max_concurrency = max_concurrency or SystemConfig.get_embedding_max_concurrency()
+        self.max_retries = max_retries
+        self.rate_limiter = get_embedding_rate_limiter()
+        # 并发的单条查询合并成一次接口调用
+        if batch_queries is None:
+            batch_queries = SystemConfig.is_query_batching_enabled()
+        self.query_batcher = QueryBatcher(
+            lambda batch: _run_sync(self._aembed_texts(batch)),
+            max_batch_size=BATCH_SIZE,
+            max_wait_ms=SystemConfig.get_query_batch_wait_ms(),
+        ) if batch_queries else None
+        dashscope.api_key = api_key or "sk-f1dc8b855d9747e1877fb393664b3335"
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """嵌入文档列表"""
-        batch = []
-        res = []
-
-        def batch_embedding(texts: List[str]) -> List[float]:
-            response = TextEmbedding.call(
-                model="text-embedding-v4",
-                input=texts,
-                # 仅 text-embedding-v3及 text-embedding-v4支持以下参数
-                dimension=1024,  # 指定向量维度
-                output_type="dense",  # 指定输出稠密向量（dense）/稀疏向量（sparse）/同时输出两种向量（dense&sparse）
-                # 仅 text-embedding-v4支持以下参数
-                instruct="Chinese Laws and Regulations"
-            )
-
-            if response.status_code == 200:
-                embeddings = [embedding['embedding'] for embedding in response.output['embeddings']]
-                return  embeddings
-            else:
-                raise Exception(f"Embedding failed: {response.message}")
-
-        for text in texts:
-            batch.append(text)
-            if len(batch) == 10:
-                res.extend(batch_embedding(batch))
-                batch = []
-        if len(batch) > 0:
-            res.extend(batch_embedding(batch))
-        return res
-
-    def embed_query(self, text: str) -> List[float]:
-        """嵌入查询文本"""
-        if len(text) > 1000:
-            text = text[:1000]
+    def _batch_embedding(self, texts: List[str]) -> List[List[float]]:
         response = TextEmbedding.call(
-            model="text-embedding-v4",
-            input=text,
+            model=self.model_name,
+            input=texts,
             # 仅 text-embedding-v3及 text-embedding-v4支持以下参数
-            dimension=1024,  # 指定向量维度
+            dimension=self.dimension,  # 指定向量维度
             output_type="dense",  # 指定输出稠密向量（dense）/稀疏向量（sparse）/同时输出两种向量（dense&sparse）
             # 仅 text-embedding-v4支持以下参数
-            instruct="Chinese Laws and Regulations"
+            instruct=self.instruct
         )
+
         if response.status_code == 200:
-            return response.output['embeddings'][0]['embedding']
+            embeddings = sorted(response.output['embeddings'], key=lambda item: item['text_index'])
+            return [embedding['embedding'] for embedding in embeddings]
+        elif response.status_code == 429 or response.status_code >= 500 or "Throttling" in str(response.code):
+            raise EmbeddingThrottledError(f"Embedding throttled: {response.code} {response.message}")
         else:
-            raise Exception(f"Embedding failed: {response.message}")
\ No newline at end of file
+            raise Exception(f"Embedding failed: {response.message}")
+
+    async def _abatch_embedding(self, texts: List[str]) -> List[List[float]]:
+        """限流并在限流错误时指数退避重试"""
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire()
+            try:
+                return await asyncio.to_thread(self._batch_embedding, texts)
+            except EmbeddingThrottledError as e:
+                if attempt == self.max_retries:
+                    raise Exception(f"Embedding failed after {attempt + 1} attempts: {e}")
+                delay = min(30.0, 0.5 * 2 ** attempt) * (0.5 + random.random())
+                metrics.incr("embedding_api_retries")
+                logger.warning(f"嵌入接口限流，{delay:.2f}秒后重试: {e}")
+                await asyncio.sleep(delay)
+
+    async def _aembed_texts(self, texts: List[str]) -> List[List[float]]:
+        """按批并发调用接口，结果保持输入顺序"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await self._abatch_embedding(batch)
+
+        batches = [texts[i:i + BATCH_SIZE] for i in range(0, len(texts), BATCH_SIZE)]
+        results = await asyncio.gather(*(run(batch) for batch in batches))
+        metrics.incr("embedding_api_calls", len(batches))
+        return [vector for result in results for vector in result]
+
+    def _cache_key(self, text: str) -> str:
+        return EmbeddingCache.make_key(self.model_name, self.dimension, self.instruct, text)
+
+    async def _aembed_with_cache(self, texts: List[str]) -> List[List[float]]:
+        """先查缓存，未命中的文本按批调用接口后写回缓存"""
+        if self.cache is None:
+            return await self._aembed_texts(texts)
+
+        keys = [self._cache_key(text) for text in texts]
+        cached = self.cache.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = await self._aembed_texts(list(missing.values()))
+            new_items = list(zip(missing.keys(), vectors))
+            self.cache.set_many(new_items)
+            cached.update(new_items)
+
+        return [cached[key] for key in keys]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """异步嵌入文档列表"""
+        return await self._aembed_with_cache(texts)
+
+    def _lookup_query(self, text: str):
+        """查询文本截断后查缓存，返回 (截断后的文本, 缓存键, 缓存向量或None)"""
+        if len(text) > 1000:
+            text = text[:1000]
+        key = self._cache_key(text)
+        vector = self.cache.get(key) if self.cache is not None else None
+        return text, key, vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """异步嵌入查询文本"""
+        if self.query_batcher is None:
+            return (await self._aembed_with_cache([text[:1000]]))[0]
+
+        text, key, vector = self._lookup_query(text)
+        if vector is None:
+            vector = await self.query_batcher.aembed(text)
+            if self.cache is not None:
+                self.cache.set(key, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """嵌入文档列表"""
+        return _run_sync(self.aembed_documents(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        """嵌入查询文本"""
+        if self.query_batcher is None:
+            return _run_sync(self.aembed_query(text))
+
+        text, key, vector = self._lookup_query(text)
+        if vector is None:
+            vector = self.query_batcher.embed(text)
+            if self.cache is not None:
+                self.cache.set(key, vector)
+        return vector
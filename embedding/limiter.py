@@ -0,0 +1,46 @@
+"""
+令牌桶限流器
+用于限制对嵌入接口的调用速率，可同时在多个线程和事件循环中使用
+"""
+
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """令牌桶：以 rate 个/秒的速度补充令牌，桶容量为 capacity"""
+
+    def __init__(self, rate: float, capacity: int = None):
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: float = 1) -> float:
+        """预占令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    async def acquire(self, tokens: float = 1):
+        """异步获取令牌"""
+        if not self.rate or self.rate <= 0:
+            return
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self, tokens: float = 1):
+        """同步获取令牌"""
+        if not self.rate or self.rate <= 0:
+            return
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
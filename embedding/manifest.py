@@ -0,0 +1,243 @@
+"""
+入库清单与进度日志
+记录每个索引中每个切片的确定性ID和内容哈希，用于增量入库时判断新增、变更、删除的切片，
+以及中断后恢复入库时跳过已完成的文件和批次
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+_ARTICLE_PATTERN = re.compile(r"^\s*(第[零〇一二三四五六七八九十百千万两\d]+条(?:之[零〇一二三四五六七八九十]+)?)")
+_HEADER_KEYS = ("header1", "header2", "header3", "header4")
+
+
+def extract_article(text: str) -> str:
+    """提取切片开头的条号，如“第二十条”，没有则返回空字符串"""
+    match = _ARTICLE_PATTERN.match(text)
+    return match.group(1) if match else ""
+
+
+def chunk_key(doc: Document) -> str:
+    """切片的逻辑位置：来源文件 + 标题路径 + 条号"""
+    metadata = doc.metadata
+    parts = [metadata.get("source", "")]
+    parts.extend(metadata.get(key) or "" for key in _HEADER_KEYS)
+    parts.append(metadata.get("article") or extract_article(doc.page_content))
+    return "\x1f".join(parts)
+
+
+def assign_chunk_ids(docs: Iterable[Document]) -> List[str]:
+    """为切片生成确定性ID，同一位置有多个切片时按出现顺序编号"""
+    ids = []
+    seen: Dict[str, int] = {}
+    for doc in docs:
+        key = chunk_key(doc)
+        ordinal = seen.get(key, 0)
+        seen[key] = ordinal + 1
+        ids.append(hashlib.sha1(f"{key}\x1f{ordinal}".encode("utf-8")).hexdigest())
+    return ids
+
+
+def content_hash(doc: Document) -> str:
+    """切片内容和元数据的哈希，任一变化都视为变更"""
+    payload = json.dumps([doc.page_content, doc.metadata], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class IngestReport:
+    """增量入库结果统计"""
+    added: int = 0
+    changed: int = 0
+    deleted: int = 0
+    skipped: int = 0
+
+    def __str__(self):
+        return f"新增 {self.added}，变更 {self.changed}，删除 {self.deleted}，跳过 {self.skipped}"
+
+
+class IngestManifest:
+    """基于sqlite的入库清单"""
+
+    def __init__(self, db_path: str = "ingest_manifest.sqlite"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_manifest (
+                index_name TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                source TEXT,
+                content_hash TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (index_name, chunk_id)
+            )
+        """)
+        # 流式入库时条文索引的条目先写到这里，入库结束后再从这里生成条文索引文件
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS article_entries (
+                index_name TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                book TEXT NOT NULL,
+                article_key TEXT NOT NULL,
+                chunk TEXT NOT NULL,
+                PRIMARY KEY (index_name, chunk_id)
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS article_entries_book ON article_entries (index_name, book, article_key)")
+        self._conn.commit()
+
+    def load(self, index_name: str) -> Dict[str, str]:
+        """返回索引中已入库切片的 chunk_id -> content_hash"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id, content_hash FROM ingest_manifest WHERE index_name = ?", (index_name,)).fetchall()
+        return dict(rows)
+
+    def upsert(self, index_name: str, entries: Iterable[Tuple[str, str, str]]):
+        """写入 (chunk_id, source, content_hash)"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                """INSERT OR REPLACE INTO ingest_manifest (index_name, chunk_id, source, content_hash, updated_at)
+                   VALUES (?, ?, ?, ?, ?)""",
+                [(index_name, chunk_id, source, digest, now) for chunk_id, source, digest in entries])
+            self._conn.commit()
+
+    def delete(self, index_name: str, chunk_ids: Iterable[str]):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM ingest_manifest WHERE index_name = ? AND chunk_id = ?",
+                [(index_name, chunk_id) for chunk_id in chunk_ids])
+            self._conn.commit()
+
+    def clear(self, index_name: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM ingest_manifest WHERE index_name = ?", (index_name,))
+            self._conn.commit()
+
+    def add_articles(self, index_name: str, entries: Iterable[Tuple[str, Dict[str, Any]]]):
+        """写入条文索引条目 (条号键, 条文切片)，切片需带 id"""
+        with self._lock:
+            self._conn.executemany(
+                """INSERT OR REPLACE INTO article_entries (index_name, chunk_id, book, article_key, chunk)
+                   VALUES (?, ?, ?, ?, ?)""",
+                [(index_name, chunk["id"], chunk["book"], key, json.dumps(chunk, ensure_ascii=False))
+                 for key, chunk in entries])
+            self._conn.commit()
+
+    def article_books(self, index_name: str) -> List[str]:
+        """条文索引中的法律名称，按首次写入的顺序"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT book FROM article_entries WHERE index_name = ? GROUP BY book ORDER BY MIN(rowid)",
+                (index_name,)).fetchall()
+        return [row[0] for row in rows]
+
+    def iter_articles(self, index_name: str, batch_size: int = 1000) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """按法律、条号键分组逐批读出 (法律名称, 条号键, 条文切片)，同一条的切片保持写入顺序"""
+        with self._lock:
+            cursor = self._conn.execute(
+                """SELECT book, article_key, chunk FROM article_entries WHERE index_name = ?
+                   ORDER BY book, article_key, rowid""",
+                (index_name,))
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for book, key, chunk in rows:
+                yield book, key, json.loads(chunk)
+
+    def clear_articles(self, index_name: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM article_entries WHERE index_name = ?", (index_name,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class IngestJournal:
+    """
+    入库进度日志，与入库清单存放在同一个数据库中
+    记录每个索引最近一次入库的状态和已完成的文件；已写入的批次由入库清单记录
+    """
+
+    def __init__(self, db_path: str = "ingest_manifest.sqlite"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_runs (
+                index_name TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                incremental INTEGER NOT NULL DEFAULT 0,
+                started_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_files (
+                index_name TEXT NOT NULL,
+                source TEXT NOT NULL,
+                completed_at REAL NOT NULL,
+                PRIMARY KEY (index_name, source)
+            )
+        """)
+        self._conn.commit()
+
+    def start_run(self, index_name: str, incremental: bool):
+        """开始新的一次入库，清空上次的文件进度"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM ingest_files WHERE index_name = ?", (index_name,))
+            self._conn.execute(
+                """INSERT OR REPLACE INTO ingest_runs (index_name, status, incremental, started_at, updated_at)
+                   VALUES (?, 'running', ?, ?, ?)""",
+                (index_name, int(incremental), now, now))
+            self._conn.commit()
+
+    def get_run(self, index_name: str) -> Optional[Dict[str, object]]:
+        """最近一次入库的状态，没有记录时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, incremental, started_at FROM ingest_runs WHERE index_name = ?",
+                (index_name,)).fetchone()
+        if row is None:
+            return None
+        return {"status": row[0], "incremental": bool(row[1]), "started_at": row[2]}
+
+    def completed_files(self, index_name: str) -> Set[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source FROM ingest_files WHERE index_name = ?", (index_name,)).fetchall()
+        return {row[0] for row in rows}
+
+    def mark_file_done(self, index_name: str, source: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ingest_files (index_name, source, completed_at) VALUES (?, ?, ?)",
+                (index_name, source, now))
+            self._conn.execute("UPDATE ingest_runs SET updated_at = ? WHERE index_name = ?", (now, index_name))
+            self._conn.commit()
+
+    def finish_run(self, index_name: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE ingest_runs SET status = 'completed', updated_at = ? WHERE index_name = ?",
+                (time.time(), index_name))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
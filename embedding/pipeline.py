@@ -0,0 +1,286 @@
+"""
+流式入库管道
+加载 -> 切分 -> 嵌入 -> 写入 四个阶段各占一个线程，通过有界队列连接：
+嵌入第 N 批的同时写入第 N-1 批，内存占用只与队列长度和批大小有关，与语料规模无关。
+每批写入后立即记入入库清单，文件全部写完后记入进度日志，中断后可以用 resume 模式跳过已完成的工作
+"""
+
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+from langchain_core.documents import Document
+from langchain.text_splitter import TextSplitter
+
+from config.config_manager import SystemConfig
+from embedding.loader import LawLoader
+from embedding.manifest import IngestJournal, IngestManifest, IngestReport, assign_chunk_ids, content_hash
+from embedding.store import LawDocumentStore
+from retriever.article_index import iter_article_entries, save_article_entries
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+@dataclass
+class ChunkBatch:
+    """同一文件内的一批切片"""
+    source: str
+    seq: int
+    documents: List[Document]
+    ids: List[str]
+    hashes: List[str]
+    vectors: Optional[List[List[float]]] = None
+    last: bool = False
+
+
+@dataclass
+class StageStats:
+    """单个阶段的吞吐统计"""
+    name: str
+    items: int = 0
+    batches: int = 0
+    busy_seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.items / self.busy_seconds if self.busy_seconds else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"items": self.items, "batches": self.batches,
+                "busy_seconds": round(self.busy_seconds, 3), "items_per_second": round(self.throughput, 2)}
+
+
+@dataclass
+class PipelineReport:
+    """管道运行结果"""
+    elapsed_seconds: float = 0.0
+    stages: Dict[str, StageStats] = field(default_factory=dict)
+    ingest: IngestReport = field(default_factory=IngestReport)
+
+    def __str__(self):
+        lines = [f"总耗时 {self.elapsed_seconds:.2f}s，{self.ingest}"]
+        for stats in self.stages.values():
+            lines.append(f"  [{stats.name}] {stats.items} 项 / {stats.busy_seconds:.2f}s 忙碌，"
+                         f"{stats.throughput:.1f} 项/秒")
+        return "\n".join(lines)
+
+
+class IngestionPipeline:
+    """法律文档流式入库管道"""
+
+    def __init__(self,
+                 document_store: LawDocumentStore,
+                 text_splitter: TextSplitter,
+                 index_name: str = "law_documents",
+                 batch_size: int = 64,
+                 queue_size: int = 2,
+                 incremental: bool = False,
+                 resume: bool = False):
+        self.document_store = document_store
+        self.text_splitter = text_splitter
+        self.index_name = index_name
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.incremental = incremental
+        self.resume = resume
+        self._skip_unchanged = incremental
+        self._done_files: Set[str] = set()
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+
+    def iter_files(self, path: str) -> Iterator[Document]:
+        """逐个文件加载，不把整个语料读入内存"""
+        return LawLoader(path).lazy_load()
+
+    def split_file(self, doc: Document, existing: Dict[str, str], seen_ids: Set[str],
+                   manifest: IngestManifest) -> Iterator[ChunkBatch]:
+        """切分单个文件并按批输出，增量模式下跳过内容未变的切片；条文索引条目逐文件写入清单数据库"""
+        chunks = self.text_splitter.split_documents([doc])
+        ids = assign_chunk_ids(chunks)
+        source = doc.metadata.get("source", "")
+        seen_ids.update(ids)
+        manifest.add_articles(self.index_name, [(key, chunk) for _, key, chunk in iter_article_entries(chunks, ids)])
+        if source in self._done_files:
+            self._report.ingest.skipped += len(chunks)
+            return
+
+        pending_docs, pending_ids, pending_hashes = [], [], []
+        seq = 0
+        for chunk_id, chunk in zip(ids, chunks):
+            digest = content_hash(chunk)
+            if self._skip_unchanged and existing.get(chunk_id) == digest:
+                self._report.ingest.skipped += 1
+                continue
+            if chunk_id in existing:
+                self._report.ingest.changed += 1
+            else:
+                self._report.ingest.added += 1
+            pending_docs.append(chunk)
+            pending_ids.append(chunk_id)
+            pending_hashes.append(digest)
+            if len(pending_docs) >= self.batch_size:
+                yield ChunkBatch(source, seq, pending_docs, pending_ids, pending_hashes)
+                pending_docs, pending_ids, pending_hashes = [], [], []
+                seq += 1
+        yield ChunkBatch(source, seq, pending_docs, pending_ids, pending_hashes, last=True)
+
+    def embed_batch(self, batch: ChunkBatch) -> ChunkBatch:
+        if batch.documents:
+            batch.vectors = self.document_store.embeddings.embed_documents(
+                [doc.page_content for doc in batch.documents])
+        return batch
+
+    def index_batch(self, batch: ChunkBatch, vectorstore, manifest: IngestManifest,
+                    journal: IngestJournal) -> ChunkBatch:
+        if batch.documents:
+            vectorstore.add_embeddings(
+                text_embeddings=list(zip([doc.page_content for doc in batch.documents], batch.vectors)),
+                metadatas=[doc.metadata for doc in batch.documents],
+                ids=batch.ids,
+                refresh_indices=False,
+            )
+            manifest.upsert(self.index_name, zip(batch.ids, [batch.source] * len(batch.ids), batch.hashes))
+        if batch.last:
+            journal.mark_file_done(self.index_name, batch.source)
+        return batch
+
+    def _put(self, q: queue.Queue, item):
+        """下游出错时不再阻塞在满队列上"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _run_stage(self, stats: StageStats, source: Iterable, fn: Callable[[Any], Iterable],
+                   out_q: Optional[queue.Queue], time_source: bool = False):
+        """运行一个阶段；只有数据源阶段把读取耗时计入忙碌时间，其余阶段读取时是在等待上游"""
+        try:
+            iterator = iter(source)
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                if not time_source:
+                    start = time.perf_counter()
+                outputs = list(fn(item))
+                stats.busy_seconds += time.perf_counter() - start
+                for output in outputs:
+                    if isinstance(output, ChunkBatch):
+                        stats.items += len(output.documents)
+                        stats.batches += 1
+                    else:
+                        stats.items += 1
+                    if out_q is not None:
+                        self._put(out_q, output)
+        except BaseException as e:
+            logger.exception(f"入库阶段 {stats.name} 失败")
+            self._errors.append(e)
+            self._stop.set()
+        finally:
+            if out_q is not None:
+                self._put(out_q, _DONE)
+
+    def _drain(self, q: queue.Queue) -> Iterator:
+        while True:
+            item = self._get(q)
+            if item is _DONE:
+                return
+            yield item
+
+    def run(self, path: str) -> PipelineReport:
+        """运行管道，返回各阶段吞吐统计"""
+        self._report = PipelineReport()
+        self._stop.clear()
+        self._errors = []
+        start = time.perf_counter()
+
+        vectorstore = self.document_store._get_vectorstore(self.index_name)
+        manifest = IngestManifest(SystemConfig.get_ingest_manifest_path())
+        journal = IngestJournal(SystemConfig.get_ingest_manifest_path())
+        last_run = journal.get_run(self.index_name) if self.resume else None
+        if last_run is not None and last_run["status"] == "running":
+            # 恢复上次中断的入库：跳过已完成的文件，已写入清单的切片视为已完成
+            self.incremental = last_run["incremental"]
+            self._skip_unchanged = True
+            self._done_files = journal.completed_files(self.index_name)
+            existing = manifest.load(self.index_name)
+            logger.info(f"恢复索引 {self.index_name} 的入库，已完成 {len(self._done_files)} 个文件")
+        else:
+            if self.resume:
+                logger.info(f"索引 {self.index_name} 没有未完成的入库，重新开始")
+            journal.start_run(self.index_name, self.incremental)
+            self._skip_unchanged = self.incremental
+            self._done_files = set()
+            if self.incremental:
+                existing = manifest.load(self.index_name)
+            else:
+                existing = {}
+                manifest.clear(self.index_name)
+        seen_ids: Set[str] = set()
+        # 每次入库都会重新切分所有文件（包括恢复时已完成的文件），条文索引条目整体重写
+        manifest.clear_articles(self.index_name)
+
+        file_q = queue.Queue(maxsize=self.queue_size)
+        split_q = queue.Queue(maxsize=self.queue_size)
+        embed_q = queue.Queue(maxsize=self.queue_size)
+        stages = {name: StageStats(name) for name in ("load", "split", "embed", "index")}
+        self._report.stages = stages
+
+        threads = [
+            threading.Thread(target=self._run_stage, name="ingest-load",
+                             args=(stages["load"], self.iter_files(path), lambda doc: [doc], file_q, True)),
+            threading.Thread(target=self._run_stage, name="ingest-split",
+                             args=(stages["split"], self._drain(file_q),
+                                   lambda doc: self.split_file(doc, existing, seen_ids, manifest), split_q)),
+            threading.Thread(target=self._run_stage, name="ingest-embed",
+                             args=(stages["embed"], self._drain(split_q), lambda batch: [self.embed_batch(batch)],
+                                   embed_q)),
+            threading.Thread(target=self._run_stage, name="ingest-index",
+                             args=(stages["index"], self._drain(embed_q),
+                                   lambda batch: [self.index_batch(batch, vectorstore, manifest, journal)], None)),
+        ]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            if self._errors:
+                raise self._errors[0]
+
+            if self.incremental:
+                deleted_ids = list(set(existing) - seen_ids)
+                if deleted_ids:
+                    vectorstore.delete(ids=deleted_ids)
+                    manifest.delete(self.index_name, deleted_ids)
+                self._report.ingest.deleted = len(deleted_ids)
+            self.document_store.es_client.indices.refresh(index=self.index_name)
+            # 条文索引从清单数据库逐条写出，入库过程中不在内存中累积所有切片的全文
+            self.document_store.publish_article_index(
+                lambda path: save_article_entries(path, manifest.article_books(self.index_name),
+                                                  manifest.iter_articles(self.index_name)),
+                self.index_name)
+            journal.finish_run(self.index_name)
+        finally:
+            manifest.close()
+            journal.close()
+
+        self._report.elapsed_seconds = time.perf_counter() - start
+        logger.info(f"流式入库完成:\n{self._report}")
+        return self._report
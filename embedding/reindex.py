@@ -0,0 +1,161 @@
+"""
+基于别名的蓝绿重建索引
+在后台构建 <别名>_<版本> 的新索引，校验文档数和冒烟查询后原子切换别名，旧索引保留用于回滚。
+线上服务始终通过别名（配置项 law_index_name）读取，重建期间只有新索引关闭刷新和副本，
+且 bulk 线程数默认较小，避免影响在线查询
+"""
+
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from config.config_manager import SystemConfig
+from embedding.store import LawDocumentStore, VECTOR_FIELD
+from retriever.article_index import promote_article_index, versioned_article_index_path
+
+logger = logging.getLogger(__name__)
+
+
+class ReindexValidationError(Exception):
+    """新索引校验未通过，别名不会切换"""
+
+
+def resolve_index_alias(es_client, alias: str) -> Optional[str]:
+    """返回别名当前指向的索引；alias 本身是普通索引时返回它自己，不存在返回 None"""
+    if es_client.indices.exists_alias(name=alias):
+        indices = sorted(es_client.indices.get_alias(name=alias).keys())
+        return indices[-1] if indices else None
+    if es_client.indices.exists(index=alias):
+        return alias
+    return None
+
+
+class LawIndexManager:
+    """法律文档索引的版本管理"""
+
+    def __init__(self, document_store: LawDocumentStore = None, alias: str = None):
+        self.document_store = document_store or LawDocumentStore()
+        self.es_client = self.document_store.es_client
+        self.alias = alias or SystemConfig.get_law_index_name()
+
+    def versioned_name(self, version: str) -> str:
+        return f"{self.alias}_{version}"
+
+    def list_versions(self) -> List[Dict[str, object]]:
+        """列出所有版本索引及文档数，按版本排序"""
+        current = self.current_index()
+        indices = self.es_client.indices.get(index=f"{self.alias}_*")
+        versions = []
+        for name in sorted(indices.keys()):
+            count = self.es_client.count(index=name)["count"]
+            versions.append({"index": name, "docs": count, "current": name == current})
+        return versions
+
+    def current_index(self) -> Optional[str]:
+        return resolve_index_alias(self.es_client, self.alias)
+
+    def build(self, documents: List[Document], version: str = None, thread_count: int = 2, **bulk_kwargs) -> str:
+        """构建新版本索引，不影响别名"""
+        index_name = self.versioned_name(version or time.strftime("%Y%m%d%H%M%S"))
+        if self.es_client.indices.exists(index=index_name):
+            raise ValueError(f"索引 {index_name} 已存在")
+        logger.info(f"开始构建索引 {index_name}，共 {len(documents)} 个切片")
+        stats = self.document_store.bulk_store_documents(documents, index_name, thread_count=thread_count,
+                                                         **bulk_kwargs)
+        logger.info(f"索引 {index_name} 构建完成: {stats}")
+        return index_name
+
+    def validate(self, index_name: str, expected_docs: int, smoke_query: str = "正当防卫") -> None:
+        """校验文档数与预期一致，且冒烟查询能召回结果"""
+        count = self.es_client.count(index=index_name)["count"]
+        if count != expected_docs:
+            raise ReindexValidationError(f"索引 {index_name} 文档数 {count} 与预期 {expected_docs} 不一致")
+
+        vector = self.document_store.embeddings.embed_query(smoke_query)
+        response = self.es_client.search(
+            index=index_name,
+            knn={"field": VECTOR_FIELD, "query_vector": vector, "k": 3, "num_candidates": 50},
+            source=False,
+        )
+        if not response["hits"]["hits"]:
+            raise ReindexValidationError(f"索引 {index_name} 冒烟查询“{smoke_query}”没有结果")
+        logger.info(f"索引 {index_name} 校验通过：{count} 个文档")
+
+    def swap(self, index_name: str) -> None:
+        """原子地把别名切换到新索引"""
+        actions = []
+        if self.es_client.indices.exists_alias(name=self.alias):
+            for old_index in self.es_client.indices.get_alias(name=self.alias):
+                actions.append({"remove": {"index": old_index, "alias": self.alias}})
+        elif self.es_client.indices.exists(index=self.alias):
+            # 首次迁移：同名的普通索引无法与别名共存，在同一个原子操作中删除
+            logger.warning(f"{self.alias} 是普通索引，切换别名时将被删除")
+            actions.append({"remove_index": {"index": self.alias}})
+        actions.append({"add": {"index": index_name, "alias": self.alias}})
+        self.es_client.indices.update_aliases(actions=actions)
+        logger.info(f"别名 {self.alias} 已切换到 {index_name}")
+        # 条文索引随别名切换，回滚时同样恢复为旧版本的条文索引
+        promote_article_index(SystemConfig.get_article_index_path(), index_name)
+
+    def rollback(self) -> str:
+        """把别名切回上一个版本"""
+        current = self.current_index()
+        names = [version["index"] for version in self.list_versions()]
+        if current not in names or names.index(current) == 0:
+            raise ValueError(f"没有可回滚的旧版本（当前 {current}）")
+        previous = names[names.index(current) - 1]
+        self.swap(previous)
+        return previous
+
+    def cleanup(self, keep: int = 2) -> List[str]:
+        """删除多余的旧版本，始终保留当前版本和最近 keep 个版本"""
+        current = self.current_index()
+        names = [version["index"] for version in self.list_versions()]
+        removable = [name for name in names[:-keep] if name != current] if keep > 0 else []
+        for name in removable:
+            self.es_client.indices.delete(index=name)
+            article_index_path = versioned_article_index_path(SystemConfig.get_article_index_path(), name)
+            if os.path.exists(article_index_path):
+                os.remove(article_index_path)
+            logger.info(f"删除旧索引 {name}")
+        return removable
+
+    def reindex(self, documents: List[Document], smoke_query: str = "正当防卫", keep: int = 2,
+                **bulk_kwargs) -> str:
+        """构建 -> 校验 -> 切换 -> 清理；校验失败时保留新索引供排查，别名不变"""
+        index_name = self.build(documents, **bulk_kwargs)
+        self.validate(index_name, len(documents), smoke_query)
+        self.swap(index_name)
+        self.cleanup(keep)
+        return index_name
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from embedding.article_parser import LawArticleSplitter
+    from embedding.loader import LawLoader
+
+    parser = argparse.ArgumentParser(description="法律文档索引蓝绿重建")
+    parser.add_argument("command", choices=["build", "list", "rollback", "cleanup"])
+    parser.add_argument("--path", default="../Law-Book", help="法律文档目录")
+    parser.add_argument("--alias", default=None, help="线上读取的别名，默认取配置 law_index_name")
+    parser.add_argument("--smoke-query", default="正当防卫", help="切换前的冒烟查询")
+    parser.add_argument("--keep", type=int, default=2, help="保留的历史版本数")
+    parser.add_argument("--bulk-threads", type=int, default=2, help="bulk 写入线程数")
+    args = parser.parse_args()
+
+    manager = LawIndexManager(alias=args.alias)
+    if args.command == "build":
+        docs = LawLoader(args.path).load_and_split(text_splitter=LawArticleSplitter())
+        print(manager.reindex(docs, smoke_query=args.smoke_query, keep=args.keep, thread_count=args.bulk_threads))
+    elif args.command == "list":
+        for version in manager.list_versions():
+            print(version)
+    elif args.command == "rollback":
+        print(manager.rollback())
+    elif args.command == "cleanup":
+        print(manager.cleanup(args.keep))
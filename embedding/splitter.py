@@ -1,13 +1,60 @@
 # coding: utf-8
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import AbstractSet, Any, Collection, Iterable, List, Literal, Optional, Union
+
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.text_splitter import MarkdownHeaderTextSplitter
 from langchain.docstore.document import Document
-from typing import Any, Iterable, List
+
+# 子进程中的切分器，由进程池初始化函数设置
+_worker_splitter: Optional["LawSplitter"] = None
+
+
+def _init_worker(splitter: "LawSplitter") -> None:
+    global _worker_splitter
+    _worker_splitter = splitter
+
+
+def _split_in_worker(documents: List[Document]) -> List[Document]:
+    return _worker_splitter._split_serial(documents)
+
+
+class _TiktokenLength:
+    """可序列化的 tiktoken 长度函数，编码器在各进程中按需加载"""
+
+    def __init__(self, encoding_name: str, model_name: Optional[str],
+                 allowed_special: Union[Literal["all"], AbstractSet[str]],
+                 disallowed_special: Union[Literal["all"], Collection[str]]):
+        self.encoding_name = encoding_name
+        self.model_name = model_name
+        self.allowed_special = allowed_special
+        self.disallowed_special = disallowed_special
+        self._encoder = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_encoder"] = None
+        return state
+
+    def __call__(self, text: str) -> int:
+        if self._encoder is None:
+            import tiktoken
+
+            if self.model_name is not None:
+                self._encoder = tiktoken.encoding_for_model(self.model_name)
+            else:
+                self._encoder = tiktoken.get_encoding(self.encoding_name)
+        return len(self._encoder.encode(
+            text, allowed_special=self.allowed_special, disallowed_special=self.disallowed_special))
 
 
 class LawSplitter(RecursiveCharacterTextSplitter):
-    def __init__(self, **kwargs: Any) -> None:
-        """Initialize a LawSplitter."""
+    def __init__(self, workers: int = 1, files_per_task: int = 4, **kwargs: Any) -> None:
+        """Initialize a LawSplitter.
+
+        workers 大于 1 时按文件分组并发到多个进程切分，输出顺序与串行切分一致
+        """
         separators = [r"第\S*条 "]
         is_separator_regex = True
 
@@ -19,10 +66,29 @@ class LawSplitter(RecursiveCharacterTextSplitter):
         ]
 
         self.md_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on)
+        self.workers = workers if workers and workers > 0 else (os.cpu_count() or 1)
+        self.files_per_task = files_per_task
         super().__init__(separators=separators, is_separator_regex=is_separator_regex, **kwargs)
 
+    @classmethod
+    def from_tiktoken_encoder(cls,
+                              encoding_name: str = "gpt2",
+                              model_name: Optional[str] = None,
+                              allowed_special: Union[Literal["all"], AbstractSet[str]] = set(),
+                              disallowed_special: Union[Literal["all"], Collection[str]] = "all",
+                              **kwargs: Any) -> "LawSplitter":
+        """与基类相同，但长度函数可以序列化到子进程"""
+        length_function = _TiktokenLength(encoding_name, model_name, allowed_special, disallowed_special)
+        return cls(length_function=length_function, **kwargs)
+
     def split_documents(self, documents: Iterable[Document]) -> List[Document]:
         """Split documents."""
+        documents = list(documents)
+        if self.workers > 1 and len(documents) > 1:
+            return self._split_parallel(documents)
+        return self._split_serial(documents)
+
+    def _split_serial(self, documents: Iterable[Document]) -> List[Document]:
         texts, metadatas = [], []
         for doc in documents:
             md_docs = self.md_splitter.split_text(doc.page_content)
@@ -33,3 +99,13 @@ class LawSplitter(RecursiveCharacterTextSplitter):
                     md_doc.metadata | doc.metadata | {"book": md_doc.metadata.get("header1")})
 
         return self.create_documents(texts, metadatas=metadatas)
+
+    def _split_parallel(self, documents: List[Document]) -> List[Document]:
+        """按文件分组发送到进程池，map 保证结果按输入顺序拼接"""
+        tasks = [documents[i:i + self.files_per_task] for i in range(0, len(documents), self.files_per_task)]
+        workers = min(self.workers, len(tasks))
+        result = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(self,)) as executor:
+            for chunk in executor.map(_split_in_worker, tasks):
+                result.extend(chunk)
+        return result
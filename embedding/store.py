@@ -1,65 +1,258 @@
-from typing import List
+import logging
+import time
+from typing import Any, Callable, Dict, List
 
-from elasticsearch import Elasticsearch
+from elasticsearch import helpers
 from langchain_community.vectorstores import ElasticsearchStore
 from langchain_core.documents import Document
 
+from config.config_manager import SystemConfig
+from embedding.article_parser import LawArticleSplitter
 from embedding.embedding import AliEmbeddings
 from embedding.loader import LawLoader
+from embedding.manifest import IngestManifest, IngestReport, assign_chunk_ids, content_hash
 from embedding.splitter import LawSplitter
+from retriever.article_index import ArticleIndex, promote_article_index, versioned_article_index_path
+from retriever.es_client import get_es_client
+
+logger = logging.getLogger(__name__)
+
+# 与 ElasticsearchStore 默认的字段名保持一致
+TEXT_FIELD = "text"
+VECTOR_FIELD = "vector"
 
 
 class LawDocumentStore:
-    def __init__(self, es_client=None):
-        self.es_client = es_client or Elasticsearch(
-            hosts=["http://localhost:9200"],
-            # 如果有认证信息
-            http_auth=('elastic', '123456')
-        )
-        self.embeddings = AliEmbeddings()
+    def __init__(self, es_client=None, embeddings: AliEmbeddings = None):
+        self.es_client = es_client or get_es_client()
+        self.embeddings = embeddings or AliEmbeddings()
 
-    def store_documents(self, split_documents: List[Document], index_name: str = "law_documents"):
+    def save_article_index(self, split_documents: List[Document], ids: List[str], index_name: str):
+        """根据完整语料的切分结果重建条文精确查找索引"""
+        self.publish_article_index(ArticleIndex.from_documents(split_documents, ids).save, index_name)
+
+    def publish_article_index(self, save: Callable[[str], None], index_name: str):
         """
-        将切分后的法律文档存储到Elasticsearch
+        save 把条文索引写到给定路径。条文索引按具体索引名保存，只有写入的是别名当前指向的索引时才替换线上文件；
+        蓝绿重建的新版本在切换别名时再替换，见 LawIndexManager.swap
         """
-        # 创建向量存储
-        vectorstore = ElasticsearchStore(
+        from embedding.reindex import resolve_index_alias
+
+        path = SystemConfig.get_article_index_path()
+        concrete = resolve_index_alias(self.es_client, index_name) or index_name
+        save(versioned_article_index_path(path, concrete))
+        if resolve_index_alias(self.es_client, SystemConfig.get_law_index_name()) == concrete:
+            promote_article_index(path, concrete)
+
+    def _record_ingested(self, index_name: str, ids: List[str], split_documents: List[Document],
+                         errors: List[Dict[str, Any]] = ()):
+        """全量入库后重写清单和条文索引；写入失败的切片不记入，之后的增量入库会重新写入"""
+        failed_ids = {item.get("index", {}).get("_id") for item in errors}
+        stored = [(chunk_id, doc) for chunk_id, doc in zip(ids, split_documents) if chunk_id not in failed_ids]
+        manifest = IngestManifest(SystemConfig.get_ingest_manifest_path())
+        manifest.clear(index_name)
+        manifest.upsert(index_name, [(chunk_id, doc.metadata.get("source"), content_hash(doc))
+                                     for chunk_id, doc in stored])
+        manifest.close()
+        self.save_article_index([doc for _, doc in stored], [chunk_id for chunk_id, _ in stored], index_name)
+
+    def _get_vectorstore(self, index_name: str) -> ElasticsearchStore:
+        # 先按优化的mapping建索引，避免 ElasticsearchStore 以动态mapping自动建索引
+        self.create_index_mapping(index_name)
+        return ElasticsearchStore(
             es_connection=self.es_client,
             index_name=index_name,
             embedding=self.embeddings,
             strategy=ElasticsearchStore.ApproxRetrievalStrategy()  # 或者 DenseVectorStrategy
         )
 
-        # 添加文档
-        vectorstore.add_documents(split_documents)
+    def store_documents(self, split_documents: List[Document], index_name: str = "law_documents"):
+        """
+        将切分后的法律文档存储到Elasticsearch
+        """
+        # 创建向量存储
+        vectorstore = self._get_vectorstore(index_name)
 
+        # 添加文档，使用确定性ID保证重复执行不会产生重复文档
+        ids = assign_chunk_ids(split_documents)
+        errors = []
+        try:
+            vectorstore.add_documents(split_documents, ids=ids)
+        except helpers.BulkIndexError as e:
+            # 其余切片已写入，只记录失败的切片
+            errors = e.errors
+            logger.error(f"入库有 {len(errors)} 条失败，第一条: {errors[0] if errors else None}")
+
+        self._record_ingested(index_name, ids, split_documents, errors)
         return vectorstore
 
-    def create_index_mapping(self, index_name: str = "law_documents"):
+    def store_documents_incremental(self, split_documents: List[Document],
+                                    index_name: str = "law_documents") -> IngestReport:
+        """
+        增量入库：只嵌入并写入新增或变更的切片，删除源文件中已不存在的切片
+        split_documents 需为完整语料的切分结果
+        """
+        vectorstore = self._get_vectorstore(index_name)
+        manifest = IngestManifest(SystemConfig.get_ingest_manifest_path())
+        report = IngestReport()
+
+        try:
+            existing = manifest.load(index_name)
+            ids = assign_chunk_ids(split_documents)
+
+            upsert_docs, upsert_ids, entries = [], [], []
+            for chunk_id, doc in zip(ids, split_documents):
+                digest = content_hash(doc)
+                old_digest = existing.get(chunk_id)
+                if old_digest == digest:
+                    report.skipped += 1
+                    continue
+                if old_digest is None:
+                    report.added += 1
+                else:
+                    report.changed += 1
+                upsert_docs.append(doc)
+                upsert_ids.append(chunk_id)
+                entries.append((chunk_id, doc.metadata.get("source"), digest))
+
+            if upsert_docs:
+                # 相同ID的文档会被覆盖，变更的切片直接重新写入
+                vectorstore.add_documents(upsert_docs, ids=upsert_ids)
+                manifest.upsert(index_name, entries)
+
+            deleted_ids = list(set(existing) - set(ids))
+            if deleted_ids:
+                vectorstore.delete(ids=deleted_ids)
+                manifest.delete(index_name, deleted_ids)
+            report.deleted = len(deleted_ids)
+        finally:
+            manifest.close()
+        self.save_article_index(split_documents, ids, index_name)
+
+        logger.info(f"索引 {index_name} 增量入库完成: {report}")
+        return report
+
+    def bulk_store_documents(self,
+                             split_documents: List[Document],
+                             index_name: str = "law_documents",
+                             thread_count: int = 4,
+                             chunk_size: int = 500,
+                             max_chunk_bytes: int = 50 * 1024 * 1024,
+                             embed_batch_size: int = 200,
+                             force_merge: bool = True) -> Dict[str, Any]:
+        """
+        批量入库模式：先按 create_index_mapping 建索引，入库期间关闭刷新和副本，
+        多线程 bulk 写入，完成后恢复设置并合并分段
+        """
+        self.create_index_mapping(index_name)
+        current = self.es_client.indices.get_settings(index=index_name)[index_name]["settings"]["index"]
+        # 未显式设置的项恢复为 None，即 ES 默认值
+        original_settings = {
+            "refresh_interval": current.get("refresh_interval"),
+            "number_of_replicas": current.get("number_of_replicas"),
+        }
+        self.es_client.indices.put_settings(index=index_name,
+                                            settings={"refresh_interval": "-1", "number_of_replicas": 0})
+
+        ids = assign_chunk_ids(split_documents)
+
+        def actions():
+            # 按批嵌入，嵌入下一批时上一批已在 bulk 线程中写入
+            for i in range(0, len(split_documents), embed_batch_size):
+                batch = split_documents[i:i + embed_batch_size]
+                vectors = self.embeddings.embed_documents([doc.page_content for doc in batch])
+                for chunk_id, doc, vector in zip(ids[i:i + embed_batch_size], batch, vectors):
+                    yield {
+                        "_op_type": "index",
+                        "_index": index_name,
+                        "_id": chunk_id,
+                        TEXT_FIELD: doc.page_content,
+                        VECTOR_FIELD: vector,
+                        "metadata": doc.metadata,
+                    }
+
+        start = time.perf_counter()
+        indexed, errors = 0, []
+        try:
+            for ok, item in helpers.parallel_bulk(self.es_client, actions(), thread_count=thread_count,
+                                                  chunk_size=chunk_size, max_chunk_bytes=max_chunk_bytes,
+                                                  raise_on_error=False):
+                if ok:
+                    indexed += 1
+                else:
+                    errors.append(item)
+        finally:
+            self.es_client.indices.put_settings(index=index_name, settings=original_settings)
+            self.es_client.indices.refresh(index=index_name)
+        load_seconds = time.perf_counter() - start
+
+        if force_merge:
+            self.es_client.options(request_timeout=3600).indices.forcemerge(index=index_name, max_num_segments=1)
+        elapsed = time.perf_counter() - start
+
+        self._record_ingested(index_name, ids, split_documents, errors)
+
+        stats = {
+            "docs": indexed,
+            "errors": len(errors),
+            "load_seconds": round(load_seconds, 2),
+            "total_seconds": round(elapsed, 2),
+            "docs_per_second": round(indexed / load_seconds, 1) if load_seconds else 0.0,
+        }
+        if errors:
+            logger.error(f"批量入库有 {len(errors)} 条失败，第一条: {errors[0]}")
+        logger.info(f"索引 {index_name} 批量入库完成: {stats}")
+        return stats
+
+    @staticmethod
+    def vector_index_options(index_type: str = None, m: int = None, ef_construction: int = None) -> Dict[str, Any]:
+        """
+        dense_vector 的 HNSW 参数，index_type 为 hnsw（float）、int8_hnsw 或 int4_hnsw（量化，内存占用约为 1/4、1/8），
+        默认取配置
+        """
+        return {
+            "type": index_type or SystemConfig.get_vector_index_type(),
+            "m": m or SystemConfig.get_vector_index_m(),
+            "ef_construction": ef_construction or SystemConfig.get_vector_index_ef_construction(),
+        }
+
+    def create_index_mapping(self, index_name: str = "law_documents", index_options: Dict[str, Any] = None):
         """
         创建优化的索引mapping
+        字段布局与 ElasticsearchStore 一致：text、vector 以及 metadata 下的各元数据字段
         """
+        keyword = {"type": "keyword"}
         mapping = {
+            "settings": {
+                "number_of_shards": 1,
+            },
             "mappings": {
                 "properties": {
-                    "text": {"type": "text"},
-                    "embedding": {
+                    TEXT_FIELD: {"type": "text"},
+                    VECTOR_FIELD: {
                         "type": "dense_vector",
-                        "dims": 1024,
+                        "dims": self.embeddings.dimension,
                         "index": True,
-                        "similarity": "cosine"
+                        "similarity": "cosine",
+                        "index_options": index_options or self.vector_index_options(),
                     },
-                    "book": {"type": "keyword"},
-                    "header1": {"type": "keyword"},
-                    "header2": {"type": "keyword"},
-                    "header3": {"type": "keyword"},
-                    "header4": {"type": "keyword"},
-                    "source": {"type": "keyword"},
-                    "page": {"type": "integer"},
-                    # 其他metadata字段
                     "metadata": {
-                        "type": "object",
-                        "enabled": True
+                        "properties": {
+                            "book": keyword,
+                            "header1": keyword,
+                            "header2": keyword,
+                            "header3": keyword,
+                            "header4": keyword,
+                            "part": keyword,
+                            "chapter": keyword,
+                            "section": keyword,
+                            "article": keyword,
+                            "article_no": {"type": "integer"},
+                            "article_sub_no": {"type": "integer"},
+                            "paragraph_no": {"type": "integer"},
+                            "source": keyword,
+                            "page": {"type": "integer"},
+                        }
                     }
                 }
             }
@@ -69,12 +262,51 @@ class LawDocumentStore:
         if not self.es_client.indices.exists(index=index_name):
             self.es_client.indices.create(index=index_name, body=mapping)
 
+
 if __name__ == '__main__':
-    text_splitter = LawSplitter.from_tiktoken_encoder(
-        chunk_size=100, chunk_overlap=20
-    )
-    docs = LawLoader("../Law-Book").load_and_split(text_splitter=text_splitter)
+    import argparse
 
-    # print(len(docs))
+    parser = argparse.ArgumentParser(description="法律文档入库")
+    parser.add_argument("--path", default="../Law-Book", help="法律文档目录")
+    parser.add_argument("--index", default="law_documents", help="索引名称")
+    parser.add_argument("--incremental", action="store_true", help="只入库新增或变更的条文，并删除已移除的条文")
+    parser.add_argument("--stream", action="store_true", help="使用流式管道入库，内存占用与语料规模无关")
+    parser.add_argument("--batch-size", type=int, default=64, help="流式入库每批切片数")
+    parser.add_argument("--resume", action="store_true", help="从上次中断处继续流式入库，跳过已完成的文件和批次")
+    parser.add_argument("--splitter", choices=["article", "tiktoken"], default="article",
+                        help="article: 按条/款切分；tiktoken: 原有的按token长度切分")
+    parser.add_argument("--max-chars", type=int, default=500, help="按条切分时单个切片的最大字符数")
+    parser.add_argument("--workers", type=int, default=1, help="tiktoken切分的进程数，0 表示使用全部CPU")
+    parser.add_argument("--bulk", action="store_true", help="批量入库模式：关闭刷新和副本，多线程 bulk 写入")
+    parser.add_argument("--bulk-threads", type=int, default=4, help="bulk 写入线程数")
+    parser.add_argument("--bulk-chunk-size", type=int, default=500, help="每个 bulk 请求的文档数")
+    parser.add_argument("--bulk-max-mb", type=int, default=50, help="每个 bulk 请求的最大字节数（MB）")
+    args = parser.parse_args()
+
+    if args.splitter == "article":
+        text_splitter = LawArticleSplitter(max_chars=args.max_chars)
+    else:
+        text_splitter = LawSplitter.from_tiktoken_encoder(
+            chunk_size=100, chunk_overlap=20, workers=args.workers
+        )
     document_store = LawDocumentStore()
-    document_store.store_documents(docs)
\ No newline at end of file
+
+    if args.stream or args.resume:
+        from embedding.pipeline import IngestionPipeline
+
+        pipeline = IngestionPipeline(document_store, text_splitter, index_name=args.index,
+                                     batch_size=args.batch_size, incremental=args.incremental,
+                                     resume=args.resume)
+        print(pipeline.run(args.path))
+    else:
+        docs = LawLoader(args.path).load_and_split(text_splitter=text_splitter)
+
+        # print(len(docs))
+        if args.bulk:
+            print(document_store.bulk_store_documents(docs, args.index, thread_count=args.bulk_threads,
+                                                      chunk_size=args.bulk_chunk_size,
+                                                      max_chunk_bytes=args.bulk_max_mb * 1024 * 1024))
+        elif args.incremental:
+            print(document_store.store_documents_incremental(docs, args.index))
+        else:
+            document_store.store_documents(docs, args.index)
@@ -0,0 +1,224 @@
+"""
+语义回答缓存
+热门问题反复出现，每次都要走完整个问答流程（法律问题判断、ReAct 检索、生成回答）。
+新问题的向量与已缓存问题的向量做余弦相似度匹配，超过阈值直接返回缓存的回答。
+向量矩阵常驻内存并持久化到磁盘，按 TTL 过期，法律索引版本变化时整体失效；
+依赖上下文的追问（“那如果…”“上面说的…”）不参与缓存
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from flow.followup import is_history_dependent
+from metrics.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 向量矩阵的初始行数
+_INITIAL_ROWS = 256
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    created_at: float
+    similarity: float = 0.0
+
+
+class SemanticAnswerCache:
+    """基于问题向量相似度的回答缓存，线程安全"""
+
+    def __init__(self,
+                 embedding: Embeddings,
+                 path: str = "answer_cache",
+                 threshold: float = 0.95,
+                 ttl_seconds: int = 86400,
+                 max_entries: int = 5000,
+                 version_fn: Optional[Callable[[], Optional[str]]] = None,
+                 version_check_seconds: int = 60,
+                 save_every: int = 20):
+        """path 为文件前缀，向量保存为 {path}.npy，问题和回答保存为 {path}.json"""
+        self.embedding = embedding
+        self.path = path
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.version_fn = version_fn
+        self.version_check_seconds = version_check_seconds
+        self.save_every = save_every
+        self._lock = threading.Lock()
+        # 预分配的向量矩阵，前 len(self._entries) 行有效，写满时成倍扩容
+        self._buffer: Optional[np.ndarray] = None
+        self._entries: List[CachedAnswer] = []
+        self._version: Optional[str] = None
+        self._version_checked_at = 0.0
+        self._unsaved = 0
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(f"{self.path}.json") or not os.path.exists(f"{self.path}.npy"):
+            return
+        with open(f"{self.path}.json", encoding="utf-8") as f:
+            data = json.load(f)
+        vectors = np.load(f"{self.path}.npy")
+        if len(vectors) != len(data["entries"]):
+            logger.warning(f"回答缓存文件 {self.path} 不一致，丢弃")
+            return
+        dimension = getattr(self.embedding, "dimension", None)
+        if len(vectors) and dimension and vectors.shape[1] != dimension:
+            # 修改向量维度后旧向量无法比较
+            logger.warning(f"回答缓存向量维度 {vectors.shape[1]} 与当前 {dimension} 不一致，丢弃")
+            return
+        self._version = data.get("version")
+        self._entries = [CachedAnswer(**entry) for entry in data["entries"]]
+        self._vectors = vectors if len(vectors) else None
+        logger.info(f"加载回答缓存 {len(self._entries)} 条")
+
+    def save(self):
+        with self._lock:
+            entries = [asdict(entry) for entry in self._entries]
+            # 矩阵会被原地写入，复制后再在锁外保存
+            vectors = self._vectors.copy() if self._vectors is not None else np.zeros((0, 0), dtype=np.float32)
+            version = self._version
+            self._unsaved = 0
+        # 先写临时文件再替换，避免中途退出留下损坏的缓存
+        np.save(f"{self.path}.tmp.npy", vectors)
+        with open(f"{self.path}.tmp.json", "w", encoding="utf-8") as f:
+            json.dump({"version": version, "entries": entries}, f, ensure_ascii=False)
+        os.replace(f"{self.path}.tmp.npy", f"{self.path}.npy")
+        os.replace(f"{self.path}.tmp.json", f"{self.path}.json")
+
+    @property
+    def _vectors(self) -> Optional[np.ndarray]:
+        if self._buffer is None or not self._entries:
+            return None
+        return self._buffer[:len(self._entries)]
+
+    @_vectors.setter
+    def _vectors(self, vectors: Optional[np.ndarray]):
+        self._buffer = None if vectors is None else np.array(vectors, dtype=np.float32)
+
+    def _append_vector(self, vector: np.ndarray):
+        """在已有条目之后写入一行，需在追加条目之前调用"""
+        count = len(self._entries)
+        if self._buffer is None:
+            self._buffer = np.empty((_INITIAL_ROWS, len(vector)), dtype=np.float32)
+        elif count >= len(self._buffer):
+            grown = np.empty((len(self._buffer) * 2, self._buffer.shape[1]), dtype=np.float32)
+            grown[:count] = self._buffer[:count]
+            self._buffer = grown
+        self._buffer[count] = vector
+
+    def _clear(self):
+        self._vectors = None
+        self._entries = []
+
+    async def _check_version(self):
+        """版本查询是同步的 ES 请求，在线程中执行，不持有锁、不阻塞事件循环"""
+        if self.version_fn is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now - self._version_checked_at < self.version_check_seconds:
+                return
+            self._version_checked_at = now
+        try:
+            version = await asyncio.to_thread(self.version_fn)
+        except Exception as e:
+            logger.warning(f"获取索引版本失败，暂不失效回答缓存: {e}")
+            return
+        with self._lock:
+            if version != self._version:
+                if self._entries:
+                    logger.info(f"索引版本由 {self._version} 变为 {version}，清空回答缓存")
+                self._clear()
+                self._version = version
+
+    def _drop_expired(self):
+        now = time.time()
+        keep = [i for i, entry in enumerate(self._entries) if now - entry.created_at <= self.ttl_seconds]
+        if len(keep) < len(self._entries):
+            # 先按当前条目数取出矩阵再更新条目
+            self._vectors = self._vectors[keep] if keep else None
+            self._entries = [self._entries[i] for i in keep]
+
+    def _drop_mismatched(self, vector: np.ndarray):
+        if self._vectors is not None and self._vectors.shape[1] != len(vector):
+            logger.warning(f"回答缓存向量维度 {self._vectors.shape[1]} 与当前 {len(vector)} 不一致，清空")
+            self._clear()
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        return array / (np.linalg.norm(array) or 1.0)
+
+    def is_cacheable(self, question: str) -> bool:
+        if is_history_dependent(question):
+            self.skipped += 1
+            metrics.incr("answer_cache_skipped")
+            return False
+        return True
+
+    async def lookup(self, question: str) -> Optional[CachedAnswer]:
+        """返回相似度超过阈值的缓存回答"""
+        vector = self._normalize(await self.embedding.aembed_query(question))
+        await self._check_version()
+        with self._lock:
+            self._drop_expired()
+            self._drop_mismatched(vector)
+            best = None
+            if self._vectors is not None:
+                similarities = self._vectors @ vector
+                index = int(np.argmax(similarities))
+                if similarities[index] >= self.threshold:
+                    entry = self._entries[index]
+                    best = CachedAnswer(entry.question, entry.answer, entry.created_at, float(similarities[index]))
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.incr("answer_cache_hits" if best else "answer_cache_misses")
+        if best:
+            logger.info(f"回答缓存命中: {question} ~ {best.question}（相似度 {best.similarity:.3f}）")
+        return best
+
+    async def add(self, question: str, answer: str):
+        vector = self._normalize(await self.embedding.aembed_query(question))
+        await self._check_version()
+        with self._lock:
+            self._drop_mismatched(vector)
+            self._append_vector(vector)
+            self._entries.append(CachedAnswer(question, answer, time.time()))
+            if len(self._entries) > self.max_entries:
+                # 按写入时间淘汰最早的回答，一次多淘汰一些，避免每次写入都移动整个矩阵
+                overflow = max(len(self._entries) - self.max_entries, self.max_entries // 10)
+                self._vectors = self._vectors[overflow:]
+                self._entries = self._entries[overflow:]
+            self._unsaved += 1
+            should_save = self._unsaved >= self.save_every
+        if should_save:
+            await asyncio.to_thread(self.save)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "skipped": self.skipped,
+            "index_version": self._version,
+        }
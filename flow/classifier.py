@@ -0,0 +1,203 @@
+"""
+本地法律问题分类器
+字符 n-gram 逻辑回归模型，训练数据来自 query_logs（回复为非法律问题标准回复的视为非法律问题），
+另加从 Law-Book 标题构建的法律词典作为特征和规则。
+明确的法律问题和明确的无关问题直接在本地判定，只有不确定的问题才交给 LLM
+"""
+
+import json
+import logging
+import math
+import os
+import random
+import re
+import sqlite3
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from prompt.prompt import NON_LEGAL_RESPONSES
+
+logger = logging.getLogger(__name__)
+
+SOURCE_LEXICON = "lexicon"
+SOURCE_MODEL = "model"
+SOURCE_LLM = "llm"
+
+_CN_NUM = "零〇一二三四五六七八九十百千万两"
+_ARTICLE_CITATION = re.compile(rf"第[{_CN_NUM}\d]+条")
+_NGRAM_RANGE = (1, 3)
+_LEXICON_FEATURE = "__lexicon__"
+
+# 通用法律用语，与 Law-Book 中的法律名称、标题关键词一起构成法律词典
+_COMMON_LEGAL_TERMS = [
+    "法律", "法规", "违法", "犯法", "犯罪", "判刑", "坐牢", "刑事", "民事", "行政", "起诉", "上诉", "诉讼", "仲裁",
+    "律师", "法院", "检察院", "公安", "报警", "赔偿", "索赔", "违约", "合同", "协议", "侵权", "责任", "罚款",
+    "拘留", "判决", "离婚", "抚养", "继承", "遗嘱", "劳动", "工伤", "辞退", "欠薪", "借款", "欠款", "担保",
+    "房产", "租赁", "物业", "交通事故", "肇事", "诈骗", "盗窃", "维权", "投诉", "权益", "条款", "证据", "立案",
+]
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).lower()
+    return "".join(ch for ch in text if not unicodedata.category(ch).startswith(("P", "Z", "C")))
+
+
+@dataclass
+class ClassifierDecision:
+    """label 为 None 表示不确定，需要交给 LLM 判断"""
+    label: Optional[bool]
+    probability: float
+    source: str
+
+
+class LegalQuestionClassifier:
+    """字符 n-gram 逻辑回归 + 法律词典"""
+
+    def __init__(self,
+                 weights: Dict[str, float] = None,
+                 bias: float = 0.0,
+                 law_names: Iterable[str] = (),
+                 lexicon: Iterable[str] = (),
+                 high_threshold: float = 0.9,
+                 low_threshold: float = 0.1):
+        self.weights = weights or {}
+        self.bias = bias
+        # 法律名称出现在问题中即判定为法律问题
+        self.law_names = sorted(set(law_names), key=len, reverse=True)
+        self.lexicon = sorted(set(lexicon) | set(_COMMON_LEGAL_TERMS), key=len, reverse=True)
+        self.high_threshold = high_threshold
+        self.low_threshold = low_threshold
+
+    def features(self, text: str) -> Dict[str, float]:
+        text = normalize_text(text)
+        features: Dict[str, float] = {}
+        for n in range(_NGRAM_RANGE[0], _NGRAM_RANGE[1] + 1):
+            for i in range(len(text) - n + 1):
+                gram = text[i:i + n]
+                features[gram] = features.get(gram, 0.0) + 1.0
+        # 按长度归一化，长短问题的分数可比
+        norm = math.sqrt(sum(value * value for value in features.values())) or 1.0
+        features = {key: value / norm for key, value in features.items()}
+        hits = sum(1 for term in self.lexicon if term in text)
+        if hits:
+            features[_LEXICON_FEATURE] = min(hits, 3) / 3
+        return features
+
+    def predict_proba(self, text: str) -> float:
+        score = self.bias + sum(self.weights.get(key, 0.0) * value for key, value in self.features(text).items())
+        return 1.0 / (1.0 + math.exp(-max(min(score, 30.0), -30.0)))
+
+    def classify(self, text: str) -> ClassifierDecision:
+        if _ARTICLE_CITATION.search(text) or any(name in text for name in self.law_names):
+            return ClassifierDecision(True, 1.0, SOURCE_LEXICON)
+        probability = self.predict_proba(text)
+        if probability >= self.high_threshold:
+            return ClassifierDecision(True, probability, SOURCE_MODEL)
+        if probability <= self.low_threshold:
+            return ClassifierDecision(False, probability, SOURCE_MODEL)
+        return ClassifierDecision(None, probability, SOURCE_LLM)
+
+    def fit(self, samples: Sequence[Tuple[str, bool]], epochs: int = 20, learning_rate: float = 0.5,
+            l2: float = 1e-4, seed: int = 0) -> "LegalQuestionClassifier":
+        """随机梯度下降训练，两类样本按数量加权，避免法律问题占多数时偏向法律"""
+        positives = sum(1 for _, label in samples if label)
+        negatives = len(samples) - positives
+        if not positives or not negatives:
+            raise ValueError(f"训练数据需要同时包含两类样本，法律 {positives} 条，非法律 {negatives} 条")
+        class_weight = {True: len(samples) / (2 * positives), False: len(samples) / (2 * negatives)}
+
+        data = [(self.features(text), label) for text, label in samples]
+        rng = random.Random(seed)
+        self.weights, self.bias = {}, 0.0
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            rate = learning_rate / (1 + epoch)
+            for features, label in data:
+                score = self.bias + sum(self.weights.get(key, 0.0) * value for key, value in features.items())
+                probability = 1.0 / (1.0 + math.exp(-max(min(score, 30.0), -30.0)))
+                gradient = (probability - (1.0 if label else 0.0)) * class_weight[label]
+                for key, value in features.items():
+                    weight = self.weights.get(key, 0.0)
+                    self.weights[key] = weight - rate * (gradient * value + l2 * weight)
+                self.bias -= rate * gradient
+        # 去掉接近 0 的权重，减小模型文件
+        self.weights = {key: round(value, 6) for key, value in self.weights.items() if abs(value) > 1e-4}
+        return self
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"weights": self.weights, "bias": self.bias, "law_names": self.law_names,
+                       "lexicon": [term for term in self.lexicon if term not in _COMMON_LEGAL_TERMS]},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        logger.info(f"法律问题分类器已保存到 {path}，特征 {len(self.weights)} 个")
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "LegalQuestionClassifier":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["weights"], data["bias"], data["law_names"], data["lexicon"], **kwargs)
+
+    @classmethod
+    def load_if_exists(cls, path: str, **kwargs) -> Optional["LegalQuestionClassifier"]:
+        if not path or not os.path.exists(path):
+            logger.info(f"未找到法律问题分类器 {path}，使用 LLM 判断")
+            return None
+        return cls.load(path, **kwargs)
+
+
+def load_samples_from_query_logs(db_path: str) -> List[Tuple[str, bool]]:
+    """回复为非法律问题标准回复的问题标为非法律，其余成功回复的问题标为法律"""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT question, response FROM query_logs WHERE status = 'success' AND response IS NOT NULL").fetchall()
+    finally:
+        conn.close()
+    non_legal = set(NON_LEGAL_RESPONSES)
+    labels: Dict[str, bool] = {}
+    for question, response in rows:
+        labels[question.strip()] = response.strip() not in non_legal
+    return [(question, label) for question, label in labels.items() if question]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from config.config_manager import SystemConfig
+    from retriever.router import LawBookRouter
+
+    parser = argparse.ArgumentParser(description="训练本地法律问题分类器")
+    parser.add_argument("--db", default="admin_management.sqlite", help="管理数据库路径（query_logs）")
+    parser.add_argument("--router", default=None, help="法律路由词典路径，用作法律词典，默认取配置 law_router_path")
+    parser.add_argument("--epochs", type=int, default=20)
+    args = parser.parse_args()
+
+    samples = load_samples_from_query_logs(args.db)
+    law_names, lexicon = [], []
+    router = LawBookRouter.load_if_exists(args.router or SystemConfig.get_law_router_path())
+    if router is not None:
+        law_names, lexicon = list(router.aliases), list(router.terms)
+
+    # 留出 10% 评估本地判定的覆盖率和准确率
+    random.Random(0).shuffle(samples)
+    split = max(1, len(samples) // 10)
+    holdout, train = samples[:split], samples[split:]
+    classifier = LegalQuestionClassifier(law_names=law_names, lexicon=lexicon,
+                                         high_threshold=SystemConfig.get_legal_classifier_high_threshold(),
+                                         low_threshold=SystemConfig.get_legal_classifier_low_threshold())
+    classifier.fit(train, epochs=args.epochs)
+
+    decided = correct = 0
+    for text, label in holdout:
+        decision = classifier.classify(text)
+        if decision.label is not None:
+            decided += 1
+            correct += decision.label == label
+    print(f"训练 {len(train)} 条，评估 {len(holdout)} 条：本地判定 {decided / len(holdout):.1%}，"
+          f"准确率 {correct / decided if decided else 0:.1%}")
+
+    classifier.fit(samples, epochs=args.epochs)
+    classifier.save(SystemConfig.get_legal_classifier_path())
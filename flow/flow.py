@@ -1,11 +1,13 @@
 import asyncio
-from typing import Annotated, List
+import logging
+import time
+from typing import Annotated, Callable, List, Optional
 import random
 import sqlite3
 
 from langchain_core.embeddings import Embeddings
 from langchain_core.language_models import BaseChatModel
-from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
 from langchain_core.retrievers import BaseRetriever
 from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import Tool
@@ -24,29 +26,52 @@ from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import ToolNode, tools_condition, create_react_agent
 from embedding.embedding import AliEmbeddings
+from flow.classifier import SOURCE_LLM, LegalQuestionClassifier
+from flow.followup import is_history_dependent
+from flow.history import HistoryManager
+from metrics.metrics import metrics
 from model.model import get_model_ali, get_langgraph_model
-from prompt.prompt import REACT_AGENT_PROMPT, CHECK_LAW_PROMPT
+from prompt.prompt import REACT_AGENT_PROMPT, CHECK_LAW_PROMPT, NON_LEGAL_RESPONSES
+from retriever.prefetch import RetrievalPrefetcher
 from retriever.retriever import get_es_retriever, get_multi_query_retriever
 from tool.tool import get_law_documents_retriever_tool
 
+logger = logging.getLogger(__name__)
+
 
 class State(TypedDict):
     messages: Annotated[list, add_messages]
     check_legal_question_prompt: BaseMessage
     is_legal_question: bool
+    # 已合并的早期对话的滚动摘要，以及因超出预算移出消息列表、等待合并的对话，见 flow/history.py
+    summary: str
+    evicted_messages: list
 
 # 节点名常量
+NODE_MANAGE_HISTORY = "manage_history"
 NODE_FORMAT_CHECK_LEGAL_PROMPT = "format_check_legal_prompt"
 NODE_CHECK_LEGAL_QUESTION = "check_legal_question"
 NODE_LAW_AGENT = "law_agent"
 NODE_GET_NON_LEGAL_RESPONSE = "get_non_legal_response"
 
+def _log_legal_check(source: str, is_legal: bool, start: float, probability: float = None):
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    metrics.incr(f"legal_check_{source}")
+    metrics.observe(f"legal_check_{source}_ms", elapsed_ms)
+    logger.info(f"法律问题判断: {'Legal' if is_legal else 'None Legal'}，来源 {source}，"
+                f"概率 {probability if probability is not None else '-'}，耗时 {elapsed_ms:.2f}ms")
+
+
 def get_law_qa_flow(model: BaseChatModel,
                           embedding: Embeddings,
                           retriever: BaseRetriever,
                           tools: List[Tool],
                           checkpoint_saver,
-                          store
+                          store,
+                          classifier: Optional[LegalQuestionClassifier] = None,
+                          speculative: bool = False,
+                          prefetcher: Optional[RetrievalPrefetcher] = None,
+                          history_manager: Optional[HistoryManager] = None
                           ):
     graph_builder = StateGraph(State)
 
@@ -58,10 +83,8 @@ def get_law_qa_flow(model: BaseChatModel,
             state_update[key] = value
         return state_update
 
-    async def call_arbitrary_model(state):
-        """Example node that calls an arbitrary model and streams the output"""
-        writer = get_stream_writer()
-        # Assume you have a streaming client that yields chunks
+    async def run_agent(state, writer: Callable[[dict], None]) -> list:
+        """运行 ReAct agent，流式片段交给 writer，返回最终回复"""
         assistant_message = []
         async for chunk in agent.astream(state, stream_mode=["updates", "messages"]):
             # print(chunk)
@@ -72,18 +95,55 @@ def get_law_qa_flow(model: BaseChatModel,
                     chunk[1]["agent"]["messages"][0].content != ""):
                 assistant_message = chunk[1]["agent"]["messages"]
             writer({"llm_chunk": chunk})
-        return {"messages": assistant_message}
+        return assistant_message
+
+    async def call_arbitrary_model(state, config: RunnableConfig):
+        """Example node that calls an arbitrary model and streams the output"""
+        writer = get_stream_writer()
+        try:
+            return {"messages": await run_agent(state, writer)}
+        finally:
+            discard_prefetch(config)
+
+    def discard_prefetch(config: RunnableConfig):
+        if prefetcher is not None:
+            prefetcher.discard(config["configurable"].get("thread_id"))
 
-    async def format_check_legal_prompt(state):
-        prompt = CHECK_LAW_PROMPT.format_messages(question=state["messages"][-1].content)
+    async def format_check_legal_prompt(state, config: RunnableConfig):
+        question = state["messages"][-1].content
+        # 检索与法律问题判断、智能体第一轮推理同时进行；追问的检索输入会被改写，不预取
+        if prefetcher is not None and not is_history_dependent(question):
+            prefetcher.start(config["configurable"].get("thread_id"), question)
+        prompt = CHECK_LAW_PROMPT.format_messages(question=question)
         return Command(update=update_state(check_legal_question_prompt=prompt[0]))
 
-    async def check_legal_question(state):
+    def has_prior_turns(state) -> bool:
+        return bool(state.get("summary")) or any(isinstance(message, HumanMessage)
+                                                 for message in state["messages"][:-1])
+
+    async def is_legal_question(state) -> bool:
+        start = time.perf_counter()
+        if classifier is not None:
+            # 明确的问题在本地判定，不确定时再调用 LLM
+            question = state["messages"][-1].content
+            decision = classifier.classify(question)
+            # 分类器只看当前问题，会话中的追问缺少法律用语，判为非法律问题时交给看得到上下文的 LLM
+            if decision.label is False and is_history_dependent(question) and has_prior_turns(state):
+                decision.label = None
+            if decision.label is not None:
+                _log_legal_check(decision.source, decision.label, start, decision.probability)
+                return decision.label
+
         messages = [state["check_legal_question_prompt"]]
         messages = add_messages(state["messages"], messages)
         core = model.ainvoke(messages)
         res = await asyncio.gather(core)
-        return Command(update=update_state(is_legal_question=(res[0].content == "Legal")))
+        is_legal = res[0].content == "Legal"
+        _log_legal_check(SOURCE_LLM, is_legal, start)
+        return is_legal
+
+    async def check_legal_question(state):
+        return Command(update=update_state(is_legal_question=await is_legal_question(state)))
 
     async def agent_route(state):
         if state["is_legal_question"]:
@@ -91,26 +151,69 @@ def get_law_qa_flow(model: BaseChatModel,
         else:
             return NODE_GET_NON_LEGAL_RESPONSE
 
-    async def get_non_legal_response(state):
+    async def get_non_legal_response(state, config: RunnableConfig):
         """返回非法律问题的标准回复"""
-        responses = [
-            "抱歉，我是一个专门的法律智能助手，只能回答与法律相关的问题。请问您有什么法律方面的疑问吗？",
-            "您的问题超出了我的专业范围。我专注于提供法律法规、案例解读等法律咨询服务。",
-            "作为法律助手，我无法回答非法律相关问题。如果您有法律方面的困惑，我很乐意为您解答。",
-            "我主要处理法律领域的咨询，如合同纠纷、劳动争议、婚姻家事等。请问您有这方面的需求吗？"
-        ]
+        discard_prefetch(config)
         writer = get_stream_writer()
         # Assume you have a streaming client that yields chunks
-        writer({"llm_chunk": ("messages", (AIMessage(content=random.choice(responses)), {"langgraph_node": "agent"}))})
+        writer({"llm_chunk": ("messages", (AIMessage(content=random.choice(NON_LEGAL_RESPONSES)),
+                                           {"langgraph_node": "agent"}))})
         return {"result": "completed"}
 
+    async def speculative_law_agent(state, config: RunnableConfig):
+        """
+        法律问题判断与 agent 同时开始，判断完成前 agent 的输出先缓存；
+        判断为法律问题时先输出缓存再继续实时输出，否则取消 agent 并返回标准回复
+        """
+        writer = get_stream_writer()
+        buffered = []
+        sink = {"write": buffered.append}
+        agent_task = asyncio.create_task(run_agent(state, lambda chunk: sink["write"](chunk)))
+        try:
+            is_legal = await is_legal_question(state)
+        except BaseException:
+            agent_task.cancel()
+            await asyncio.gather(agent_task, return_exceptions=True)
+            raise
+
+        if not is_legal:
+            agent_task.cancel()
+            await asyncio.gather(agent_task, return_exceptions=True)
+            metrics.incr("speculative_agent_cancelled")
+            await get_non_legal_response(state, config)
+            return update_state(is_legal_question=False)
+
+        # 输出缓存和切换为实时输出之间没有 await，agent 的片段不会乱序
+        metrics.incr("speculative_agent_used")
+        metrics.observe("speculative_agent_buffered_chunks", len(buffered))
+        for chunk in buffered:
+            writer(chunk)
+        sink["write"] = writer
+        try:
+            return update_state(messages=await agent_task, is_legal_question=True)
+        finally:
+            discard_prefetch(config)
+
     graph_builder.add_node(NODE_FORMAT_CHECK_LEGAL_PROMPT, format_check_legal_prompt)
+    if history_manager is not None:
+        # 先整理对话历史，后续节点看到的都是预算内的消息
+        graph_builder.add_node(NODE_MANAGE_HISTORY, history_manager)
+        graph_builder.add_edge(START, NODE_MANAGE_HISTORY)
+        graph_builder.add_edge(NODE_MANAGE_HISTORY, NODE_FORMAT_CHECK_LEGAL_PROMPT)
+    else:
+        graph_builder.add_edge(START, NODE_FORMAT_CHECK_LEGAL_PROMPT)
+    if speculative:
+        # 判断和 agent 在同一个节点中并发执行，节点名沿用 law_agent
+        graph_builder.add_node(NODE_LAW_AGENT, speculative_law_agent)
+        graph_builder.add_edge(NODE_FORMAT_CHECK_LEGAL_PROMPT, NODE_LAW_AGENT)
+        graph_builder.add_edge(NODE_LAW_AGENT, END)
+        return graph_builder.compile(checkpointer=checkpoint_saver, store=store)
+
     graph_builder.add_node(NODE_CHECK_LEGAL_QUESTION, check_legal_question)
     graph_builder.add_node(NODE_LAW_AGENT, call_arbitrary_model)
     graph_builder.add_node(NODE_GET_NON_LEGAL_RESPONSE, get_non_legal_response)
 
     # Any time a tool is called, we return to the chatbot to decide the next step
-    graph_builder.add_edge(START, NODE_FORMAT_CHECK_LEGAL_PROMPT)
     graph_builder.add_edge(NODE_FORMAT_CHECK_LEGAL_PROMPT, NODE_CHECK_LEGAL_QUESTION)
     graph_builder.add_conditional_edges(NODE_CHECK_LEGAL_QUESTION, agent_route,
                                         {NODE_LAW_AGENT: NODE_LAW_AGENT, NODE_GET_NON_LEGAL_RESPONSE: NODE_GET_NON_LEGAL_RESPONSE})
@@ -0,0 +1,23 @@
+"""
+追问识别
+“那如果对方不同意呢”“你说的第二条…”这类问题的含义取决于对话历史，
+回答缓存、检索预取和本地法律问题分类都不能只看问题本身
+"""
+
+import re
+
+# 只匹配指回对话的说法：句首的承接语和指示代词、明确引用上文的词；
+# 句中的“这种情况”“他们”、句末的“呢”在独立问题中也很常见，不算追问
+_HISTORY_DEPENDENT_PATTERN = re.compile(
+    r"^(那|那么)(如果|要是|假如|万一|我|他|她|对方)|"
+    r"^(如果这样|这样的话|那样的话|照这么说|照你说的|按你说的)|"
+    r"^(这|那)(个|种|条|些|样)|"
+    r"(你说的|你刚才|你上面|上面说|上面提到|上述|刚才说|刚刚说|前面说|前面提到|上一个问题|上个问题|上一条)"
+)
+_MIN_QUESTION_LENGTH = 4
+
+
+def is_history_dependent(question: str) -> bool:
+    """过短或指代上文的问题视为依赖对话历史"""
+    question = question.strip()
+    return len(question) < _MIN_QUESTION_LENGTH or bool(_HISTORY_DEPENDENT_PATTERN.search(question))
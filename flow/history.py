@@ -0,0 +1,157 @@
+"""
+对话历史管理
+thread_id 为用户的 openid，历史消息会一直累积，工具返回的检索结果尤其长，每轮都完整发给模型。
+在流程入口整理历史：最近 N 轮原样保留（去掉其中的工具调用和检索结果），更早的对话在后台合并进滚动摘要，
+摘要以固定 id 的系统消息放在消息列表开头。超出轮数的对话在合并进摘要之后才移出消息列表；
+超出 token 预算的最早几轮立即移出消息列表，暂存在 state 的 evicted_messages 中等待合并，
+任何一轮对话都在消息、暂存或摘要之一中。
+摘要任务的结果在该会话的下一轮写入 state，进程重启丢失结果时重新生成
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+from metrics.metrics import metrics
+from model.tokens import estimate_tokens, truncate_to_tokens
+from prompt.prompt import HISTORY_SUMMARY_PROMPT
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_MESSAGE_ID = "conversation_summary"
+_SUMMARY_PREFIX = "以下是与该用户之前对话的摘要，回答时可以参考：\n"
+# 每条消息的角色等格式开销
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def split_turns(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+    """按用户消息切分对话轮次"""
+    turns: List[List[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def strip_tool_messages(turn: List[BaseMessage]) -> List[BaseMessage]:
+    """去掉检索结果和只包含工具调用的 AI 消息，两者必须一起去掉，否则工具调用没有对应的结果"""
+    return [message for message in turn
+            if not isinstance(message, ToolMessage)
+            and not (isinstance(message, AIMessage) and message.tool_calls and not message.content)]
+
+
+def render_turn(turn: List[BaseMessage]) -> str:
+    lines = []
+    for message in strip_tool_messages(turn):
+        if isinstance(message, AIMessage) and message.tool_calls:
+            message = AIMessage(content=message.content)
+        role = "用户" if isinstance(message, HumanMessage) else "助手"
+        lines.append(f"{role}：{message.content}")
+    return "\n".join(lines)
+
+
+def messages_tokens(messages: List[BaseMessage]) -> int:
+    return sum(estimate_tokens(str(message.content)) + _MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+class HistoryManager:
+    """流程入口节点，整理对话历史并在后台生成滚动摘要"""
+
+    def __init__(self,
+                 model: BaseChatModel,
+                 max_turns: int = 3,
+                 max_tokens: int = 3000,
+                 summary_max_tokens: int = 500,
+                 max_pending_results: int = 1000):
+        self.model = model
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.max_pending_results = max_pending_results
+        # thread_id -> 正在生成摘要的任务
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # thread_id -> (新摘要, 已合并轮次首条消息的 id)，等待该会话下一轮写入 state；
+        # 用户不再回来时按容量淘汰最早的结果，对应的对话仍在消息中，下次会重新生成摘要
+        self._results: "OrderedDict[str, Tuple[str, List[str]]]" = OrderedDict()
+
+    async def _summarize(self, summary: str, turns: List[List[BaseMessage]]) -> Tuple[str, List[str]]:
+        """返回新的摘要和已合并轮次首条消息的 id"""
+        prompt = HISTORY_SUMMARY_PROMPT.format(summary=summary or "无",
+                                               history="\n\n".join(render_turn(turn) for turn in turns),
+                                               max_tokens=self.summary_max_tokens)
+        # 不继承流程的回调，摘要不会出现在本轮的流式输出中
+        response = await self.model.ainvoke(prompt, config={"callbacks": [], "run_name": "history_summary"})
+        metrics.incr("history_summaries")
+        return truncate_to_tokens(response.content.strip(), self.summary_max_tokens), [turn[0].id for turn in turns]
+
+    def _start_summary(self, thread_id: str, summary: str, turns: List[List[BaseMessage]]):
+        task = asyncio.create_task(self._summarize(summary, turns))
+        self._tasks[thread_id] = task
+        task.add_done_callback(lambda done: self._on_summary_done(thread_id, done))
+
+    def _on_summary_done(self, thread_id: str, task: asyncio.Task):
+        self._tasks.pop(thread_id, None)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.warning(f"对话摘要生成失败，下一轮重试: {task.exception()}")
+            return
+        self._results[thread_id] = task.result()
+        self._results.move_to_end(thread_id)
+        while len(self._results) > self.max_pending_results:
+            self._results.popitem(last=False)
+
+    def summary_message(self, summary: str) -> List[BaseMessage]:
+        return [SystemMessage(content=_SUMMARY_PREFIX + summary, id=SUMMARY_MESSAGE_ID)] if summary else []
+
+    async def __call__(self, state, config: RunnableConfig):
+        thread_id = config["configurable"].get("thread_id")
+        messages = state["messages"]
+        summary = state.get("summary") or ""
+        evicted = state.get("evicted_messages") or []
+
+        turns = split_turns([message for message in messages if message.id != SUMMARY_MESSAGE_ID])
+        current, previous = turns[-1], [strip_tool_messages(turn) for turn in turns[:-1]]
+        evicted_turns = split_turns(evicted)
+        # 上一轮启动的摘要已完成：更新摘要，移出已合并的对话
+        result = self._results.pop(thread_id, None)
+        if result is not None:
+            summary, folded = result
+            folded = set(folded)
+            previous = [turn for turn in previous if turn[0].id not in folded]
+            evicted_turns = [turn for turn in evicted_turns if turn[0].id not in folded]
+
+        def total_tokens(history: List[List[BaseMessage]]) -> int:
+            return messages_tokens(self.summary_message(summary) + [m for turn in history for m in turn] + current)
+
+        # 超出预算的最早几轮立即从模型输入中移出，不等摘要完成
+        cut = 0
+        while cut < len(previous) and total_tokens(previous[cut:]) > self.max_tokens:
+            cut += 1
+        over_turns = len(previous) - min(len(previous), max(self.max_turns, 0))
+        evicted_turns += previous[:cut]
+        previous = previous[cut:]
+        # 暂存的对话和超出保留轮数的对话交给摘要，同一会话同时只有一个摘要任务
+        to_summarize = evicted_turns + previous[:max(over_turns - cut, 0)]
+        if to_summarize and thread_id not in self._tasks:
+            self._start_summary(thread_id, summary, to_summarize)
+        metrics.observe("history_prompt_tokens", total_tokens(previous))
+
+        new_messages = self.summary_message(summary) + [m for turn in previous for m in turn] + current
+        new_evicted = [m for turn in evicted_turns for m in turn]
+        if ([message.id for message in new_messages] == [message.id for message in messages]
+                and [message.id for message in new_evicted] == [message.id for message in evicted]
+                and summary == (state.get("summary") or "")):
+            return {"summary": summary}
+        metrics.incr("history_messages_removed", max(0, len(messages) - len(new_messages)))
+        # 整体替换消息列表，摘要消息才能保持在开头
+        return {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES)] + new_messages,
+                "summary": summary,
+                "evicted_messages": new_evicted}
@@ -0,0 +1,101 @@
+"""
+进程内指标收集
+提供计数器与数值分布统计，通过 /api/metrics 接口暴露
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+
+
+class _Summary:
+    """数值分布的简单统计（次数、总和、最小值、最大值）"""
+
+    __slots__ = ("count", "total", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "avg": self.total / self.count if self.count else 0.0,
+            "min": self.min,
+            "max": self.max,
+        }
+
+
+class Metrics:
+    """线程安全的指标注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._summaries: Dict[str, _Summary] = {}
+        self._collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def incr(self, name: str, value: float = 1):
+        """计数器累加"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float):
+        """记录一个观测值，如耗时、批大小"""
+        with self._lock:
+            summary = self._summaries.get(name)
+            if summary is None:
+                summary = self._summaries[name] = _Summary()
+            summary.add(value)
+
+    @contextmanager
+    def timer(self, name: str):
+        """统计代码块耗时（毫秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000)
+
+    def get_counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def register_collector(self, name: str, collector: Callable[[], Dict[str, Any]]):
+        """注册在导出时才计算的指标，如缓存命中率"""
+        with self._lock:
+            self._collectors[name] = collector
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出所有指标"""
+        with self._lock:
+            counters = dict(self._counters)
+            summaries = {name: summary.to_dict() for name, summary in self._summaries.items()}
+            collectors = dict(self._collectors)
+
+        collected = {}
+        for name, collector in collectors.items():
+            try:
+                collected[name] = collector()
+            except Exception as e:
+                collected[name] = {"error": str(e)}
+        return {"counters": counters, "summaries": summaries, "collectors": collected}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+
+
+# 全局指标实例
+metrics = Metrics()
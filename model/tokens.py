@@ -0,0 +1,34 @@
+"""
+token 数估算
+通义千问的分词器没有本地实现，使用 tiktoken 的 cl100k_base 近似估算，用于上下文预算和统计
+"""
+
+from functools import lru_cache
+
+_ENCODING_NAME = "cl100k_base"
+
+
+@lru_cache(maxsize=1)
+def _get_encoder():
+    import tiktoken
+
+    return tiktoken.get_encoding(_ENCODING_NAME)
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的 token 数"""
+    if not text:
+        return 0
+    return len(_get_encoder().encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """按 token 数截断文本"""
+    if max_tokens <= 0:
+        return ""
+    encoder = _get_encoder()
+    tokens = encoder.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    # 截断处可能落在多字节字符中间，解码时丢弃不完整的字节
+    return encoder.decode_bytes(tokens[:max_tokens]).decode("utf-8", errors="ignore")
@@ -49,6 +49,14 @@ CHECK_LAW_PROMPT = SystemMessagePromptTemplate.from_template(
     template=check_law_prompt_template, input_variables=["question"]
 )
 
+# 非法律问题的标准回复，查询日志中回复为其中之一的问题即被判为非法律问题
+NON_LEGAL_RESPONSES = [
+    "抱歉，我是一个专门的法律智能助手，只能回答与法律相关的问题。请问您有什么法律方面的疑问吗？",
+    "您的问题超出了我的专业范围。我专注于提供法律法规、案例解读等法律咨询服务。",
+    "作为法律助手，我无法回答非法律相关问题。如果您有法律方面的困惑，我很乐意为您解答。",
+    "我主要处理法律领域的咨询，如合同纠纷、劳动争议、婚姻家事等。请问您有这方面的需求吗？"
+]
+
 hypo_questions_prompt_template = """生成 5 个假设问题的列表，以下文档可用于回答这些问题:\n\n{context}"""
 
 HYPO_QUESTION_PROMPT = PromptTemplate(
@@ -59,3 +67,14 @@ multi_query_prompt_template = """你是一个专业的律师，您的任务是
 MULTI_QUERY_PROMPT_TEMPLATE = PromptTemplate(
     template=multi_query_prompt_template, input_variables=["question"]
 )
+
+history_summary_prompt_template = """你是一个专业律师的助手，请把之前的对话摘要和新增的对话合并成一份新的摘要，供后续回答参考。
+保留用户的身份、案情事实、涉及的法律问题和已给出的主要结论及引用的法条，省略寒暄和重复内容，不超过 {max_tokens} 个 token，只输出摘要。
+之前的摘要：
+{summary}
+新增的对话：
+{history}
+"""
+HISTORY_SUMMARY_PROMPT = PromptTemplate(
+    template=history_summary_prompt_template, input_variables=["summary", "history", "max_tokens"]
+)
@@ -0,0 +1,214 @@
+"""
+条文精确查找索引
+入库时根据 book / article 元数据构建 (法律名称别名, 条号) -> 条文切片 的映射，
+用户直接引用条文（如“民法典第1165条”“刑法第二百三十二条”）时不经过嵌入和向量检索
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+from itertools import groupby
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from embedding.article_parser import cn_to_int
+from embedding.manifest import extract_article
+
+logger = logging.getLogger(__name__)
+
+_CN_NUM = "零〇一二三四五六七八九十百千万两"
+_CITATION_PATTERN = re.compile(rf"第?([{_CN_NUM}\d]+)条(?:之([{_CN_NUM}\d]+))?")
+_LABEL_PATTERN = re.compile(rf"^第([{_CN_NUM}\d]+)条(?:之([{_CN_NUM}\d]+))?$")
+_NAME_SUFFIX_PATTERN = re.compile(r"[（(][^）)]*[）)]$")
+# 法律名称与“第X条”之间允许出现的字符
+_CITATION_GAP = " 　《》<>“”\"'的之中"
+
+# 常用简称
+_COMMON_ABBREVIATIONS = {
+    "刑事诉讼法": ["刑诉法"],
+    "民事诉讼法": ["民诉法"],
+    "行政诉讼法": ["行诉法"],
+    "道路交通安全法": ["道交法", "交通安全法"],
+    "治安管理处罚法": ["治安处罚法"],
+    "消费者权益保护法": ["消法", "消保法"],
+}
+
+
+def law_aliases(book: str) -> List[str]:
+    """法律名称的常用叫法：全称、去掉“中华人民共和国”前缀和版本后缀、常用简称"""
+    aliases = {book}
+    name = _NAME_SUFFIX_PATTERN.sub("", book).strip()
+    aliases.add(name)
+    if name.startswith("中华人民共和国"):
+        name = name[len("中华人民共和国"):]
+        aliases.add(name)
+    aliases.update(_COMMON_ABBREVIATIONS.get(name, []))
+    return sorted(alias for alias in aliases if len(alias) >= 2)
+
+
+def article_key(number: int, sub_number: int = 0) -> str:
+    return f"{number}-{sub_number}" if sub_number else str(number)
+
+
+def _parse_label(label: str) -> Optional[Tuple[int, int]]:
+    match = _LABEL_PATTERN.match(label or "")
+    if not match:
+        return None
+    return cn_to_int(match.group(1)), cn_to_int(match.group(2)) if match.group(2) else 0
+
+
+def iter_article_entries(documents: Iterable[Document],
+                         ids: Iterable[str] = None) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+    """切片中能确定法律和条号的部分，逐个返回 (法律名称, 条号键, 条文切片)"""
+    ids = list(ids) if ids is not None else None
+    for i, doc in enumerate(documents):
+        book = doc.metadata.get("book")
+        if not book:
+            continue
+        if "article_no" in doc.metadata:
+            parsed = (doc.metadata["article_no"], doc.metadata.get("article_sub_no", 0))
+        else:
+            parsed = _parse_label(extract_article(doc.page_content))
+        if parsed is None:
+            continue
+
+        chunk = {"text": doc.page_content, "book": book,
+                 "article": doc.metadata.get("article") or extract_article(doc.page_content)}
+        if ids is not None:
+            chunk["id"] = ids[i]
+        yield book, article_key(*parsed), chunk
+
+
+class ArticleIndex:
+    """(法律, 条号) -> 条文切片 的内存索引，可持久化为 json"""
+
+    def __init__(self):
+        self.aliases: Dict[str, str] = {}
+        self.articles: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+        self._alias_lengths: List[int] = []
+        self._lock = threading.Lock()
+
+    def add_documents(self, documents: Iterable[Document], ids: Iterable[str] = None):
+        """加入切片，同一条的多个切片按出现顺序保存"""
+        with self._lock:
+            for book, key, chunk in iter_article_entries(documents, ids):
+                self.articles.setdefault(book, {}).setdefault(key, []).append(chunk)
+                for alias in law_aliases(book):
+                    # 简称冲突时保留先出现的法律
+                    self.aliases.setdefault(alias, book)
+            self._alias_lengths = sorted({len(alias) for alias in self.aliases}, reverse=True)
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Document], ids: Iterable[str] = None) -> "ArticleIndex":
+        index = cls()
+        index.add_documents(documents, ids)
+        return index
+
+    def _match_book(self, prefix: str) -> Optional[str]:
+        """在“第X条”前面的文本中找最长的法律名称"""
+        prefix = prefix.rstrip(_CITATION_GAP)
+        for length in self._alias_lengths:
+            if length <= len(prefix):
+                book = self.aliases.get(prefix[-length:])
+                if book:
+                    return book
+        return None
+
+    def lookup(self, query: str) -> Optional[List[Document]]:
+        """查询中每个“法律名称 + 第X条”的引用都能找到时返回对应条文，否则返回 None"""
+        documents, last_book = [], None
+        for match in _CITATION_PATTERN.finditer(query):
+            if not match.group(0).startswith("第") and not match.group(1).isdigit():
+                continue
+            # “刑法第二十条、第二十一条”：后面的条号沿用前一个法律名称
+            book = self._match_book(query[:match.start()]) or last_book
+            if book is None:
+                return None
+            key = article_key(cn_to_int(match.group(1)), cn_to_int(match.group(2)) if match.group(2) else 0)
+            chunks = self.articles.get(book, {}).get(key)
+            if not chunks:
+                return None
+            last_book = book
+            for chunk in chunks:
+                documents.append(Document(id=chunk.get("id"), page_content=chunk["text"],
+                                          metadata={"book": chunk["book"], "article": chunk["article"],
+                                                    "source": "article_index"}))
+        return documents or None
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"aliases": self.aliases, "articles": self.articles}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        logger.info(f"条文索引已保存到 {path}，共 {len(self.articles)} 部法律")
+
+    @classmethod
+    def load(cls, path: str) -> "ArticleIndex":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls()
+        index.aliases = data["aliases"]
+        index.articles = data["articles"]
+        index._alias_lengths = sorted({len(alias) for alias in index.aliases}, reverse=True)
+        return index
+
+    @classmethod
+    def load_if_exists(cls, path: str) -> Optional["ArticleIndex"]:
+        if not path or not os.path.exists(path):
+            logger.info(f"未找到条文索引 {path}，条文引用走向量检索")
+            return None
+        return cls.load(path)
+
+
+def save_article_entries(path: str, books: Iterable[str], entries: Iterable[Tuple[str, str, Dict[str, Any]]]):
+    """
+    逐条写出与 ArticleIndex.save 格式相同的文件，不在内存中构建整个索引；
+    books 为按出现顺序排列的法律名称，entries 为按法律、条号键分组排列的 (法律名称, 条号键, 条文切片)
+    """
+    aliases: Dict[str, str] = {}
+    for book in books:
+        for alias in law_aliases(book):
+            aliases.setdefault(alias, book)
+    dumps = lambda value: json.dumps(value, ensure_ascii=False)
+    tmp_path = f"{path}.tmp"
+    book_count = 0
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(f'{{"aliases": {dumps(aliases)}, "articles": {{')
+        for book, book_entries in groupby(entries, key=lambda entry: entry[0]):
+            f.write(f'{", " if book_count else ""}{dumps(book)}: {{')
+            for i, (key, key_entries) in enumerate(groupby(book_entries, key=lambda entry: entry[1])):
+                chunks = ", ".join(dumps(chunk) for _, _, chunk in key_entries)
+                f.write(f'{", " if i else ""}{dumps(key)}: [{chunks}]')
+            f.write("}")
+            book_count += 1
+        f.write("}}")
+    os.replace(tmp_path, path)
+    logger.info(f"条文索引已保存到 {path}，共 {book_count} 部法律")
+
+
+def versioned_article_index_path(path: str, index_name: str) -> str:
+    """每个索引版本各自的条文索引文件，如 article_index.law_documents_20240101.json"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{index_name}{ext or '.json'}"
+
+
+def promote_article_index(path: str, index_name: str) -> bool:
+    """
+    把 index_name 对应版本的条文索引复制为线上读取的 path，与别名切换、回滚同时进行；
+    该版本没有条文索引时删除线上文件，避免条文查找返回其他版本的切片
+    """
+    source = versioned_article_index_path(path, index_name)
+    if not os.path.exists(source):
+        logger.warning(f"索引 {index_name} 没有条文索引文件 {source}，停用条文精确查找")
+        if os.path.exists(path):
+            os.remove(path)
+        return False
+    tmp_path = f"{path}.tmp"
+    shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, path)
+    logger.info(f"条文索引已切换到 {index_name}")
+    return True
@@ -0,0 +1,62 @@
+"""
+进程内共享的 Elasticsearch 客户端
+同步客户端供入库和管理脚本使用，异步客户端供 FastAPI / LangGraph 中的检索使用，不阻塞事件循环；
+两者各自维护一个长连接池，不再为每个检索器或入库对象单独建连接
+"""
+
+import threading
+
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+
+from config.config_manager import SystemConfig
+
+ES_HOSTS = ["http://localhost:9200"]
+# 如果有认证信息
+ES_AUTH = ('elastic', '123456')
+
+_lock = threading.Lock()
+_client: Elasticsearch = None
+_async_client: AsyncElasticsearch = None
+
+
+def _client_options() -> dict:
+    return {
+        "hosts": ES_HOSTS,
+        "http_auth": ES_AUTH,
+        # 每个节点保持的长连接数，按并发检索的数量设置
+        "connections_per_node": SystemConfig.get_es_max_connections(),
+        "request_timeout": SystemConfig.get_es_request_timeout(),
+        "retry_on_timeout": True,
+        "max_retries": 2,
+    }
+
+
+def get_es_client() -> Elasticsearch:
+    """进程内共享的同步客户端"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = Elasticsearch(**_client_options())
+    return _client
+
+
+def get_async_es_client() -> AsyncElasticsearch:
+    """进程内共享的异步客户端，需在同一个事件循环中使用"""
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                _async_client = AsyncElasticsearch(**_client_options())
+    return _async_client
+
+
+async def close_es_clients():
+    """服务关闭时释放连接池"""
+    global _client, _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+    if _client is not None:
+        _client.close()
+        _client = None
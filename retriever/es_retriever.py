@@ -0,0 +1,186 @@
+"""
+Elasticsearch 检索器
+dense 模式只做 kNN；hybrid 模式在一次 _msearch 请求中同时执行 BM25 和 kNN，再用加权 RRF 融合。
+配置了异步客户端时异步检索不阻塞事件循环；命中结果的 _source 不返回向量字段。
+配置了法律路由时按预测的法律过滤 metadata.book，过滤后没有结果时退回全库检索
+"""
+
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+from embedding.store import TEXT_FIELD, VECTOR_FIELD
+from metrics.metrics import metrics
+from retriever.fusion import reciprocal_rank_fusion
+
+MODE_DENSE = "dense"
+MODE_HYBRID = "hybrid"
+
+# 检索结果不需要向量，避免每个命中返回上千个浮点数
+_SOURCE_FILTER = {"excludes": [VECTOR_FIELD]}
+
+
+class LawESRetriever(BaseRetriever):
+    """法律条文检索器"""
+
+    es_client: Any
+    # AsyncElasticsearch，为空时异步检索退回到线程中执行同步请求
+    async_es_client: Any = None
+    index_name: str
+    embedding: Embeddings
+    k: int = 3
+    mode: str = MODE_DENSE
+    # kNN 的候选数，与 ElasticsearchStore 默认值一致
+    num_candidates: int = 50
+    # hybrid 模式下每一路参与融合的结果数
+    candidates: int = 20
+    bm25_weight: float = 1.0
+    knn_weight: float = 1.0
+    rrf_k: int = 60
+    # LawBookRouter，为空时检索全库
+    router: Any = None
+
+    @staticmethod
+    def book_filter(books: Optional[List[str]]) -> List[Dict[str, Any]]:
+        return [{"terms": {"metadata.book": books}}] if books else []
+
+    def knn_body(self, vector: List[float], size: int, books: Optional[List[str]] = None) -> Dict[str, Any]:
+        knn = {
+            "field": VECTOR_FIELD,
+            "query_vector": vector,
+            "k": size,
+            "num_candidates": max(self.num_candidates, size),
+        }
+        if books:
+            # kNN 的 filter 在近邻搜索过程中生效，候选只在这些法律中选取
+            knn["filter"] = self.book_filter(books)
+        return {"knn": knn, "size": size, "_source": _SOURCE_FILTER}
+
+    def bm25_body(self, query: str, size: int, books: Optional[List[str]] = None) -> Dict[str, Any]:
+        # 短语匹配加权，条文名、术语完整出现时排在前面
+        return {
+            "query": {
+                "bool": {
+                    "should": [
+                        {"match": {TEXT_FIELD: {"query": query}}},
+                        {"match_phrase": {TEXT_FIELD: {"query": query, "boost": 2}}},
+                    ],
+                    "filter": self.book_filter(books),
+                }
+            },
+            "size": size,
+            "_source": _SOURCE_FILTER,
+        }
+
+    def build_searches(self, query: str, vector: List[float],
+                       books: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """返回 (knn[, bm25]) 的查询体，按 _msearch 的 header/body 交替排列"""
+        if self.mode == MODE_HYBRID:
+            bodies = [self.knn_body(vector, self.candidates, books), self.bm25_body(query, self.candidates, books)]
+        else:
+            bodies = [self.knn_body(vector, self.k, books)]
+        searches = []
+        for body in bodies:
+            searches.append({"index": self.index_name})
+            searches.append(body)
+        return searches
+
+    @staticmethod
+    def hits_to_documents(hits: List[Dict[str, Any]], score_key: str = "score") -> List[Document]:
+        documents = []
+        for hit in hits:
+            source = hit["_source"]
+            metadata = dict(source.get("metadata") or {})
+            metadata[score_key] = hit["_score"]
+            documents.append(Document(id=hit["_id"], page_content=source[TEXT_FIELD], metadata=metadata))
+        return documents
+
+    def merge_responses(self, responses: List[Dict[str, Any]]) -> List[Document]:
+        """dense 模式直接返回 kNN 结果；hybrid 模式融合两路结果"""
+        for response in responses:
+            if "error" in response:
+                raise Exception(f"Elasticsearch search failed: {response['error']}")
+
+        knn_docs = self.hits_to_documents(responses[0]["hits"]["hits"], "knn_score")
+        for doc in knn_docs:
+            doc.metadata["score"] = doc.metadata["knn_score"]
+        if self.mode != MODE_HYBRID:
+            return knn_docs[:self.k]
+
+        bm25_docs = self.hits_to_documents(responses[1]["hits"]["hits"], "bm25_score")
+        fused = reciprocal_rank_fusion([knn_docs, bm25_docs], [self.knn_weight, self.bm25_weight], self.rrf_k)
+        for doc in fused:
+            doc.metadata["score"] = doc.metadata["rrf_score"]
+        return fused[:self.k]
+
+    def _route(self, query: str) -> Optional[List[str]]:
+        if self.router is None:
+            return None
+        return self.router.route(query).books or None
+
+    def _build_many(self, queries: List[str], vectors: List[List[float]],
+                    books: List[Optional[List[str]]]) -> List[Dict[str, Any]]:
+        searches = []
+        for query, vector, query_books in zip(queries, vectors, books):
+            searches.extend(self.build_searches(query, vector, query_books))
+        return searches
+
+    def _split_many(self, queries: List[str], responses: List[Dict[str, Any]]) -> List[List[Document]]:
+        per_query = len(responses) // len(queries)
+        return [self.merge_responses(responses[i * per_query:(i + 1) * per_query]) for i in range(len(queries))]
+
+    def _fallback_plan(self, books: List[Optional[List[str]]],
+                       results: List[List[Document]]) -> Tuple[List[int], List[Optional[List[str]]]]:
+        """过滤后没有结果的查询退回全库检索"""
+        retry = [i for i, (query_books, docs) in enumerate(zip(books, results)) if query_books and not docs]
+        if retry:
+            metrics.incr("law_router_fallback", len(retry))
+        return retry, [None] * len(retry)
+
+    def search_many(self, queries: List[str], vectors: List[List[float]]) -> List[List[Document]]:
+        """多个查询合并为一次 _msearch 请求，按查询分别返回结果"""
+        if not queries:
+            return []
+        books = [self._route(query) for query in queries]
+        response = self.es_client.msearch(searches=self._build_many(queries, vectors, books))
+        results = self._split_many(queries, response["responses"])
+
+        retry, no_books = self._fallback_plan(books, results)
+        if retry:
+            retry_queries = [queries[i] for i in retry]
+            response = self.es_client.msearch(
+                searches=self._build_many(retry_queries, [vectors[i] for i in retry], no_books))
+            for i, docs in zip(retry, self._split_many(retry_queries, response["responses"])):
+                results[i] = docs
+        return results
+
+    async def asearch_many(self, queries: List[str], vectors: List[List[float]]) -> List[List[Document]]:
+        if not queries:
+            return []
+        if self.async_es_client is None:
+            return await asyncio.to_thread(self.search_many, queries, vectors)
+        books = [self._route(query) for query in queries]
+        response = await self.async_es_client.msearch(searches=self._build_many(queries, vectors, books))
+        results = self._split_many(queries, response["responses"])
+
+        retry, no_books = self._fallback_plan(books, results)
+        if retry:
+            retry_queries = [queries[i] for i in retry]
+            response = await self.async_es_client.msearch(
+                searches=self._build_many(retry_queries, [vectors[i] for i in retry], no_books))
+            for i, docs in zip(retry, self._split_many(retry_queries, response["responses"])):
+                results[i] = docs
+        return results
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        vector = self.embedding.embed_query(query)
+        return self.search_many([query], [vector])[0]
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        vector = await self.embedding.aembed_query(query)
+        return (await self.asearch_many([query], [vector]))[0]
@@ -0,0 +1,36 @@
+"""
+多路检索结果融合
+"""
+
+from typing import Callable, Dict, List, Sequence
+
+from langchain_core.documents import Document
+
+
+def _default_key(doc: Document) -> str:
+    return doc.id or doc.page_content
+
+
+def reciprocal_rank_fusion(ranked_lists: Sequence[List[Document]],
+                           weights: Sequence[float] = None,
+                           k: int = 60,
+                           key: Callable[[Document], str] = _default_key) -> List[Document]:
+    """
+    加权倒数排名融合（RRF）：score(d) = Σ w_i / (k + rank_i(d))，rank 从 1 开始
+    同一文档在多路结果中按 key 去重，保留第一次出现的 Document，融合分数写入 metadata["rrf_score"]
+    """
+    weights = weights or [1.0] * len(ranked_lists)
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+    for weight, ranked in zip(weights, ranked_lists):
+        for rank, doc in enumerate(ranked, start=1):
+            doc_key = key(doc)
+            scores[doc_key] = scores.get(doc_key, 0.0) + weight / (k + rank)
+            documents.setdefault(doc_key, doc)
+
+    fused = []
+    for doc_key in sorted(scores, key=scores.get, reverse=True):
+        doc = documents[doc_key]
+        doc.metadata["rrf_score"] = scores[doc_key]
+        fused.append(doc)
+    return fused
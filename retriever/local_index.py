@@ -0,0 +1,228 @@
+"""
+进程内向量索引
+向量矩阵以 float32（可选 int8 量化）存放在内存映射文件中，元数据存放在 jsonl 旁路文件中。
+多个工作进程以只读方式映射同一文件，共享操作系统页缓存；检索为向量化的暴力 top-k，
+语料较大时可选 HNSW 图索引（需要安装 hnswlib）
+"""
+
+import json
+import logging
+import mmap
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+logger = logging.getLogger(__name__)
+
+_HEADER_FILE = "index.json"
+_VECTOR_FILE = "vectors.bin"
+_SCALE_FILE = "scales.f32"
+_META_FILE = "meta.jsonl"
+_OFFSET_FILE = "meta.offsets.i64"
+_HNSW_FILE = "hnsw.bin"
+# int8 索引每次反量化的行数
+_SCORE_BLOCK_ROWS = 8192
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class LocalVectorIndex:
+    """只读的内存映射向量索引，余弦相似度"""
+
+    def __init__(self, path: str, use_hnsw: Optional[bool] = None, ef_search: int = 64):
+        self.path = path
+        with open(os.path.join(path, _HEADER_FILE), encoding="utf-8") as f:
+            self.header = json.load(f)
+        self.count = self.header["count"]
+        self.dims = self.header["dims"]
+        self.dtype = self.header["dtype"]
+
+        self.vectors, self.scales = None, None
+        if self.count:
+            self.vectors = np.memmap(os.path.join(path, _VECTOR_FILE), mode="r",
+                                     dtype=np.int8 if self.dtype == "int8" else np.float32,
+                                     shape=(self.count, self.dims))
+            if self.dtype == "int8":
+                self.scales = np.memmap(os.path.join(path, _SCALE_FILE), mode="r", dtype=np.float32,
+                                        shape=(self.count,))
+        self._offsets = np.memmap(os.path.join(path, _OFFSET_FILE), mode="r", dtype=np.int64,
+                                  shape=(self.count + 1,))
+        self._meta_file = open(os.path.join(path, _META_FILE), "rb")
+        self._meta = mmap.mmap(self._meta_file.fileno(), 0, access=mmap.ACCESS_READ) if self.count else None
+
+        self._hnsw = None
+        hnsw_path = os.path.join(path, _HNSW_FILE)
+        if use_hnsw is None:
+            use_hnsw = os.path.exists(hnsw_path)
+        if use_hnsw:
+            self._hnsw = self._load_hnsw(hnsw_path, ef_search)
+
+    def _load_hnsw(self, hnsw_path: str, ef_search: int):
+        try:
+            import hnswlib
+        except ImportError:
+            logger.warning("未安装 hnswlib，使用暴力检索")
+            return None
+        index = hnswlib.Index(space="ip", dim=self.dims)
+        index.load_index(hnsw_path, max_elements=self.count)
+        index.set_ef(ef_search)
+        return index
+
+    @classmethod
+    def build(cls,
+              path: str,
+              ids: List[str],
+              texts: List[str],
+              metadatas: List[Dict[str, Any]],
+              vectors: Iterable[List[float]],
+              dtype: str = "float32",
+              build_hnsw: bool = False,
+              hnsw_m: int = 16,
+              hnsw_ef_construction: int = 200) -> "LocalVectorIndex":
+        """写入索引文件，向量预先归一化，检索时内积即余弦相似度"""
+        os.makedirs(path, exist_ok=True)
+        matrix = _normalize(np.asarray(list(vectors), dtype=np.float32))
+        count, dims = matrix.shape if matrix.size else (0, 0)
+
+        if dtype == "int8":
+            # 逐行对称量化
+            scales = np.abs(matrix).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            quantized = np.round(matrix / scales[:, None]).astype(np.int8)
+            quantized.tofile(os.path.join(path, _VECTOR_FILE))
+            scales.astype(np.float32).tofile(os.path.join(path, _SCALE_FILE))
+        else:
+            matrix.tofile(os.path.join(path, _VECTOR_FILE))
+
+        offsets = [0]
+        with open(os.path.join(path, _META_FILE), "wb") as f:
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                line = json.dumps({"id": chunk_id, "text": text, "metadata": metadata},
+                                  ensure_ascii=False).encode("utf-8") + b"\n"
+                f.write(line)
+                offsets.append(offsets[-1] + len(line))
+        np.asarray(offsets, dtype=np.int64).tofile(os.path.join(path, _OFFSET_FILE))
+
+        if build_hnsw and count:
+            import hnswlib
+
+            index = hnswlib.Index(space="ip", dim=dims)
+            index.init_index(max_elements=count, M=hnsw_m, ef_construction=hnsw_ef_construction)
+            index.add_items(matrix, np.arange(count))
+            index.save_index(os.path.join(path, _HNSW_FILE))
+
+        with open(os.path.join(path, _HEADER_FILE), "w", encoding="utf-8") as f:
+            json.dump({"count": int(count), "dims": int(dims), "dtype": dtype}, f)
+        return cls(path)
+
+    def get(self, position: int) -> Dict[str, Any]:
+        """读取第 position 条的 id、文本和元数据"""
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        return json.loads(self._meta[start:end])
+
+    def _int8_scores(self, query: np.ndarray) -> np.ndarray:
+        """按块反量化计算内积，避免每次查询把整个 int8 矩阵转换为 float32"""
+        scores = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, _SCORE_BLOCK_ROWS):
+            end = min(start + _SCORE_BLOCK_ROWS, self.count)
+            scores[start:end] = (self.vectors[start:end].astype(np.float32) @ query) * self.scales[start:end]
+        return scores
+
+    def search(self, query_vector: List[float], k: int = 3) -> List[Tuple[int, float]]:
+        """返回 [(位置, 相似度)]，按相似度降序；相似度为 (1 + 余弦) / 2，与 ES cosine 的 kNN 得分一致"""
+        if not self.count:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        query /= (np.linalg.norm(query) or 1.0)
+        k = min(k, self.count)
+
+        if self._hnsw is not None:
+            labels, distances = self._hnsw.knn_query(query, k=k)
+            # hnswlib 的 ip 距离为 1 - 内积
+            return [(int(label), float((2 - distance) / 2)) for label, distance in zip(labels[0], distances[0])]
+
+        if self.scales is not None:
+            scores = self._int8_scores(query)
+        else:
+            scores = self.vectors @ query
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(position), float((1 + scores[position]) / 2)) for position in top]
+
+    def close(self):
+        if self._meta is not None:
+            self._meta.close()
+        self._meta_file.close()
+
+
+class LocalVectorRetriever(BaseRetriever):
+    """基于本地向量索引的检索器，不依赖 Elasticsearch"""
+
+    embedding: Embeddings
+    index: LocalVectorIndex
+    k: int = 3
+
+    def _to_documents(self, hits: List[Tuple[int, float]]) -> List[Document]:
+        documents = []
+        for position, score in hits:
+            record = self.index.get(position)
+            documents.append(Document(id=record["id"], page_content=record["text"],
+                                      metadata=record["metadata"] | {"score": score}))
+        return documents
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self._to_documents(self.index.search(self.embedding.embed_query(query), self.k))
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        vector = await self.embedding.aembed_query(query)
+        return self._to_documents(self.index.search(vector, self.k))
+
+
+def export_from_elasticsearch(es_client, index_name: str, path: str, dtype: str = "float32",
+                              build_hnsw: bool = False) -> LocalVectorIndex:
+    """把 Elasticsearch 索引中的文本、元数据和向量导出为本地索引，不需要重新嵌入"""
+    from elasticsearch import helpers
+
+    from embedding.store import TEXT_FIELD, VECTOR_FIELD
+
+    ids, texts, metadatas, vectors = [], [], [], []
+    for hit in helpers.scan(es_client, index=index_name, query={"query": {"match_all": {}}},
+                            preserve_order=False):
+        source = hit["_source"]
+        ids.append(hit["_id"])
+        texts.append(source[TEXT_FIELD])
+        metadatas.append(source.get("metadata", {}))
+        vectors.append(source[VECTOR_FIELD])
+    # 按ID排序，保证每次导出的顺序一致
+    order = sorted(range(len(ids)), key=lambda i: ids[i])
+    logger.info(f"从索引 {index_name} 导出 {len(ids)} 条向量到 {path}")
+    return LocalVectorIndex.build(path, [ids[i] for i in order], [texts[i] for i in order],
+                                  [metadatas[i] for i in order], [vectors[i] for i in order],
+                                  dtype=dtype, build_hnsw=build_hnsw)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from embedding.store import LawDocumentStore
+
+    parser = argparse.ArgumentParser(description="从 Elasticsearch 导出本地向量索引")
+    parser.add_argument("--index", default="law_documents", help="源索引或别名")
+    parser.add_argument("--out", default="local_index", help="输出目录")
+    parser.add_argument("--dtype", choices=["float32", "int8"], default="float32")
+    parser.add_argument("--hnsw", action="store_true", help="同时构建 HNSW 图索引")
+    args = parser.parse_args()
+
+    exported = export_from_elasticsearch(LawDocumentStore().es_client, args.index, args.out,
+                                         dtype=args.dtype, build_hnsw=args.hnsw)
+    print(f"导出完成: {exported.count} 条，{exported.dims} 维，{exported.dtype}")
@@ -0,0 +1,142 @@
+"""
+多查询融合检索器
+LLM 生成问题变体的同时先检索原问题；变体的查询向量一次嵌入、所有 kNN 查询合并为一次 _msearch，
+各路结果按文档ID去重后用 RRF 融合。
+自适应模式下先检索原问题，结果足够可信（最高分和领先幅度都达到阈值）时不再调用 LLM 扩展
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import Runnable
+
+from metrics.metrics import metrics
+from retriever.es_retriever import LawESRetriever
+from retriever.fusion import reciprocal_rank_fusion
+
+logger = logging.getLogger(__name__)
+
+
+class FusionMultiQueryRetriever(BaseRetriever):
+    """并发检索原问题及其变体，融合去重"""
+
+    retriever: BaseRetriever
+    # 输入 {"question": ...}，输出问题变体列表
+    query_generator: Runnable
+    include_original: bool = True
+    max_variants: int = 3
+    # None 时返回全部去重后的结果，与 MultiQueryRetriever 返回的数量一致
+    k: Optional[int] = None
+    rrf_k: int = 60
+    adaptive: bool = False
+    # 自适应模式的阈值，基于向量相似度分数（ES 余弦相似度为 (1 + cos) / 2）
+    min_top_score: float = 0.8
+    min_score_margin: float = 0.02
+
+    def _is_confident(self, docs: List[Document]) -> bool:
+        """原问题的检索结果是否足够可信：最高分达到阈值，且领先第二名足够多"""
+        # hybrid 模式的 score 为 RRF 分数，不可与阈值比较，统一使用向量分数
+        scores = [doc.metadata.get("knn_score", doc.metadata.get("score")) for doc in docs]
+        scores = sorted((score for score in scores if score is not None), reverse=True)
+        if not scores or scores[0] < self.min_top_score:
+            return False
+        margin = scores[0] - scores[1] if len(scores) > 1 else scores[0]
+        return margin >= self.min_score_margin
+
+    def _record_expansion(self, query: str, skipped: bool):
+        if skipped:
+            metrics.incr("multi_query_expansion_skipped")
+            logger.info(f"原问题检索结果可信，跳过问题扩展: {query}")
+        else:
+            metrics.incr("multi_query_expansion_used")
+
+    def _clean_variants(self, query: str, variants: Any) -> List[str]:
+        if isinstance(variants, str):
+            variants = variants.split("\n")
+        cleaned = []
+        for variant in variants or []:
+            variant = variant.strip()
+            if variant and variant != query and variant not in cleaned:
+                cleaned.append(variant)
+        return cleaned[:self.max_variants]
+
+    def _search_variants(self, variants: List[str]) -> List[List[Document]]:
+        if isinstance(self.retriever, LawESRetriever):
+            vectors = self.retriever.embedding.embed_documents(variants)
+            return self.retriever.search_many(variants, vectors)
+        return self.retriever.batch(variants)
+
+    async def _asearch_variants(self, variants: List[str]) -> List[List[Document]]:
+        if isinstance(self.retriever, LawESRetriever):
+            vectors = await self.retriever.embedding.aembed_documents(variants)
+            return await self.retriever.asearch_many(variants, vectors)
+        return await self.retriever.abatch(variants)
+
+    def _fuse(self, ranked_lists: List[List[Document]]) -> List[Document]:
+        fused = reciprocal_rank_fusion(ranked_lists, k=self.rrf_k)
+        for doc in fused:
+            doc.metadata["score"] = doc.metadata["rrf_score"]
+        return fused[:self.k] if self.k else fused
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        if self.adaptive:
+            return self._adaptive_get_relevant_documents(query)
+        with metrics.timer("multi_query_retrieval_ms"), ThreadPoolExecutor(max_workers=2) as executor:
+            original = executor.submit(self.retriever.invoke, query) if self.include_original else None
+            variants = self._clean_variants(query, self.query_generator.invoke({"question": query}))
+            logger.info(f"生成的问题变体: {variants}")
+            metrics.observe("multi_query_variants", len(variants))
+
+            ranked_lists = [original.result()] if original is not None else []
+            ranked_lists.extend(self._search_variants(variants) if variants else [])
+        return self._fuse(ranked_lists)
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        if self.adaptive:
+            return await self._aadaptive_get_relevant_documents(query)
+        with metrics.timer("multi_query_retrieval_ms"):
+            original = asyncio.ensure_future(self.retriever.ainvoke(query)) if self.include_original else None
+            try:
+                variants = self._clean_variants(query, await self.query_generator.ainvoke({"question": query}))
+            except BaseException:
+                if original is not None:
+                    original.cancel()
+                raise
+            logger.info(f"生成的问题变体: {variants}")
+            metrics.observe("multi_query_variants", len(variants))
+
+            ranked_lists = [await original] if original is not None else []
+            ranked_lists.extend(await self._asearch_variants(variants) if variants else [])
+        return self._fuse(ranked_lists)
+
+    def _adaptive_get_relevant_documents(self, query: str) -> List[Document]:
+        with metrics.timer("multi_query_retrieval_ms"):
+            docs = self.retriever.invoke(query)
+            confident = self._is_confident(docs)
+            self._record_expansion(query, confident)
+            if confident:
+                return docs
+
+            variants = self._clean_variants(query, self.query_generator.invoke({"question": query}))
+            metrics.observe("multi_query_variants", len(variants))
+            ranked_lists = [docs] + (self._search_variants(variants) if variants else [])
+        return self._fuse(ranked_lists)
+
+    async def _aadaptive_get_relevant_documents(self, query: str) -> List[Document]:
+        with metrics.timer("multi_query_retrieval_ms"):
+            docs = await self.retriever.ainvoke(query)
+            confident = self._is_confident(docs)
+            self._record_expansion(query, confident)
+            if confident:
+                return docs
+
+            variants = self._clean_variants(query, await self.query_generator.ainvoke({"question": query}))
+            metrics.observe("multi_query_variants", len(variants))
+            ranked_lists = [docs] + (await self._asearch_variants(variants) if variants else [])
+        return self._fuse(ranked_lists)
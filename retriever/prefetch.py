@@ -0,0 +1,112 @@
+"""
+检索预取
+ReAct 智能体的第一次检索输入几乎总是与用户原问题相近，但要等法律问题判断和智能体第一轮推理之后才开始。
+问题一到达就按会话 thread_id 在后台开始检索，检索工具收到相近的输入时直接等待预取结果，
+检索耗时与判断、推理的 LLM 调用重叠
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from metrics.metrics import metrics
+from retriever.result_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+def query_similarity(first: str, second: str) -> float:
+    """归一化后一方包含另一方视为相同，否则为字符二元组的 Jaccard 相似度"""
+    first, second = normalize_query(first), normalize_query(second)
+    if not first or not second:
+        return 0.0
+    if first in second or second in first:
+        return 1.0
+    first_grams = {first[i:i + 2] for i in range(len(first) - 1)} or {first}
+    second_grams = {second[i:i + 2] for i in range(len(second) - 1)} or {second}
+    return len(first_grams & second_grams) / len(first_grams | second_grams)
+
+
+@dataclass
+class _Prefetch:
+    query: str
+    task: asyncio.Task
+    started_at: float
+
+
+class RetrievalPrefetcher:
+    """按会话保存正在进行或已完成的预取检索，只在事件循环中使用"""
+
+    def __init__(self, retriever: BaseRetriever, similarity_threshold: float = 0.5, ttl_seconds: int = 60):
+        self.retriever = retriever
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self._prefetches: Dict[str, _Prefetch] = {}
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.wasted = 0
+
+    def _drop_expired(self):
+        now = time.monotonic()
+        for key in [key for key, prefetch in self._prefetches.items() if now - prefetch.started_at > self.ttl_seconds]:
+            self.discard(key)
+
+    def start(self, key: str, query: str):
+        """开始预取，同一会话未使用的上一次预取被取消"""
+        self._drop_expired()
+        self.discard(key)
+        task = asyncio.create_task(self.retriever.ainvoke(query))
+        # 预取失败时由检索工具重新检索，这里只取出异常避免未处理异常的警告
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._prefetches[key] = _Prefetch(query, task, time.monotonic())
+        self.started += 1
+        metrics.incr("retrieval_prefetch_started")
+
+    def discard(self, key: str):
+        """取消并丢弃会话的预取，本轮对话结束或判断为非法律问题时调用"""
+        prefetch = self._prefetches.pop(key, None)
+        if prefetch is None:
+            return
+        prefetch.task.cancel()
+        self.wasted += 1
+        metrics.incr("retrieval_prefetch_wasted")
+
+    async def take(self, key: str, query: str) -> Optional[List[Document]]:
+        """检索输入与预取问题相近时等待并返回预取结果，每次预取只使用一次"""
+        prefetch = self._prefetches.get(key)
+        if prefetch is None:
+            return None
+        similarity = query_similarity(prefetch.query, query)
+        if similarity < self.similarity_threshold:
+            # 智能体改写后的输入差别较大，保留预取给之后的检索
+            self.misses += 1
+            metrics.incr("retrieval_prefetch_misses")
+            return None
+        del self._prefetches[key]
+
+        start = time.perf_counter()
+        try:
+            docs = await prefetch.task
+        except Exception as e:
+            logger.warning(f"预取检索失败，重新检索: {e}")
+            return None
+        metrics.observe("retrieval_prefetch_wait_ms", (time.perf_counter() - start) * 1000)
+        self.hits += 1
+        metrics.incr("retrieval_prefetch_hits")
+        logger.info(f"使用预取检索结果: {query} ~ {prefetch.query}（相似度 {similarity:.2f}）")
+        return docs
+
+    def stats(self):
+        return {
+            "pending": len(self._prefetches),
+            "started": self.started,
+            "hits": self.hits,
+            "misses": self.misses,
+            "wasted": self.wasted,
+        }
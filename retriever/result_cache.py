@@ -0,0 +1,122 @@
+"""
+检索结果缓存
+ReAct 智能体在同一会话内、不同用户之间经常发出相同或几乎相同的检索输入，
+以归一化后的查询为键缓存检索结果，按 TTL 过期、按容量 LRU 淘汰，索引版本变化时整体失效
+"""
+
+import logging
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from metrics.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """全角转半角、转小写，去掉空白和标点，“刑法 第二十条？”与“刑法第二十条”视为同一查询"""
+    text = unicodedata.normalize("NFKC", query).lower()
+    return "".join(ch for ch in text if not unicodedata.category(ch).startswith(("P", "Z", "C")))
+
+
+class RetrievalResultCache:
+    """进程内的检索结果缓存，线程安全"""
+
+    def __init__(self,
+                 max_entries: int = 1024,
+                 ttl_seconds: int = 600,
+                 version_fn: Optional[Callable[[], Optional[str]]] = None,
+                 version_check_seconds: int = 30):
+        """
+        version_fn 返回当前索引版本（如别名指向的具体索引），每隔 version_check_seconds 秒检查一次，
+        版本变化时清空缓存
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version_fn = version_fn
+        self.version_check_seconds = version_check_seconds
+        self._entries: "OrderedDict[str, Tuple[float, List[Document]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._version_checked_at = 0.0
+        self._version_refreshing = False
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _check_version(self):
+        """
+        到检查时间时在后台线程中查询版本：版本查询是同步的 ES 请求，get 可能在事件循环中调用，
+        不能在这里等待，也不能持有锁等待；版本变化前的这段时间仍使用旧结果
+        """
+        if self.version_fn is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._version_refreshing or now - self._version_checked_at < self.version_check_seconds:
+                return
+            self._version_checked_at = now
+            self._version_refreshing = True
+        threading.Thread(target=self._refresh_version, name="retrieval-cache-version", daemon=True).start()
+
+    def _refresh_version(self):
+        try:
+            version = self.version_fn()
+        except Exception as e:
+            logger.warning(f"获取索引版本失败，暂不失效检索缓存: {e}")
+            with self._lock:
+                self._version_refreshing = False
+            return
+        with self._lock:
+            self._version_refreshing = False
+            if version != self._version:
+                if self._version is not None:
+                    logger.info(f"索引版本由 {self._version} 变为 {version}，清空检索缓存")
+                    self.invalidations += 1
+                    self._entries.clear()
+                self._version = version
+
+    def get(self, query: str) -> Optional[List[Document]]:
+        key = normalize_query(query)
+        self._check_version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                metrics.incr("retrieval_cache_misses")
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        metrics.incr("retrieval_cache_hits")
+        return list(entry[1])
+
+    def set(self, query: str, documents: List[Document]):
+        key = normalize_query(query)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), list(documents))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "invalidations": self.invalidations,
+            "index_version": self._version,
+        }
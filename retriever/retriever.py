@@ -1,39 +1,107 @@
-from elasticsearch import Elasticsearch
-from langchain.chains.llm import LLMChain
-from langchain.retrievers.multi_query import LineListOutputParser, MultiQueryRetriever
-from langchain_community.vectorstores import ElasticsearchStore
+from typing import Callable, Optional
+
+from langchain.retrievers.multi_query import LineListOutputParser
 from langchain_core.embeddings import Embeddings
 from langchain_core.retrievers import BaseRetriever
 from langchain_core.vectorstores import VectorStore
 from pydantic import BaseModel
 
+from config.config_manager import SystemConfig
 from embedding.embedding import AliEmbeddings
+from embedding.reindex import resolve_index_alias
+from metrics.metrics import metrics
 from prompt.prompt import MULTI_QUERY_PROMPT_TEMPLATE
+from retriever.es_client import get_async_es_client, get_es_client
+from retriever.es_retriever import LawESRetriever
+from retriever.local_index import LocalVectorIndex, LocalVectorRetriever
+from retriever.multi_query import FusionMultiQueryRetriever
+from retriever.prefetch import RetrievalPrefetcher
+from retriever.result_cache import RetrievalResultCache
+from retriever.router import LawBookRouter
 
 
-def get_es_retriever(index_name: str, embedding: Embeddings) -> BaseRetriever:
-    es_client = Elasticsearch(
-        hosts=["http://localhost:9200"],
-        # 如果有认证信息
-        http_auth=('elastic', '123456')
-    )
-
-    vectorstore = ElasticsearchStore(
-        es_connection=es_client,
-        index_name="law_documents",
+def get_es_retriever(index_name: str, embedding: Embeddings, mode: str = None) -> BaseRetriever:
+    """mode 为 dense（仅kNN）或 hybrid（BM25 + kNN，RRF融合），默认取配置 retriever_mode"""
+    return LawESRetriever(
+        es_client=get_es_client(),
+        async_es_client=get_async_es_client(),
+        index_name=index_name,
         embedding=embedding,
-        strategy=ElasticsearchStore.ApproxRetrievalStrategy()  # 或者 DenseVectorStrategy
+        k=3,
+        mode=mode or SystemConfig.get_retriever_mode(),
+        candidates=SystemConfig.get_hybrid_candidates(),
+        bm25_weight=SystemConfig.get_hybrid_bm25_weight(),
+        knn_weight=SystemConfig.get_hybrid_knn_weight(),
+        rrf_k=SystemConfig.get_rrf_k(),
+        router=get_law_router(),
     )
 
-    return vectorstore.as_retriever(search_kwargs={"k": 3, })
 
-def get_multi_query_retriever(retriever: BaseRetriever, model: BaseModel) -> BaseRetriever:
-    output_parser = LineListOutputParser()
+def get_law_router() -> Optional[LawBookRouter]:
+    """按配置加载法律路由词典，路由统计通过指标接口导出"""
+    if not SystemConfig.is_law_router_enabled():
+        return None
+    router = LawBookRouter.load_if_exists(SystemConfig.get_law_router_path(),
+                                          min_confidence=SystemConfig.get_law_router_min_confidence())
+    if router is not None:
+        metrics.register_collector("law_router", router.stats)
+    return router
+
+
+def get_local_retriever(index_path: str, embedding: Embeddings) -> BaseRetriever:
+    index = LocalVectorIndex(index_path)
+    return LocalVectorRetriever(embedding=embedding, index=index, k=3)
+
+
+def get_law_retriever(embedding: Embeddings) -> BaseRetriever:
+    """按配置 retriever_backend 选择检索后端：es 或 local"""
+    backend = SystemConfig.get_retriever_backend()
+    if backend == "local":
+        return get_local_retriever(SystemConfig.get_local_index_path(), embedding)
+    return get_es_retriever(SystemConfig.get_law_index_name(), embedding)
+
+
+def get_index_version_fn(retriever: BaseRetriever) -> Optional[Callable[[], Optional[str]]]:
+    """返回获取当前索引版本的函数：ES 后端为别名指向的具体索引，重建索引切换别名后版本变化"""
+    if isinstance(retriever, LawESRetriever):
+        return lambda: resolve_index_alias(retriever.es_client, retriever.index_name)
+    return None
+
+
+def get_retrieval_cache(retriever: BaseRetriever) -> Optional[RetrievalResultCache]:
+    """按配置创建检索结果缓存；ES 后端以别名指向的具体索引作为版本，重建索引切换别名后缓存失效"""
+    if not SystemConfig.is_retrieval_cache_enabled():
+        return None
+    cache = RetrievalResultCache(max_entries=SystemConfig.get_retrieval_cache_max_entries(),
+                                 ttl_seconds=SystemConfig.get_retrieval_cache_ttl_seconds(),
+                                 version_fn=get_index_version_fn(retriever),
+                                 version_check_seconds=SystemConfig.get_retrieval_cache_version_check_seconds())
+    metrics.register_collector("retrieval_cache", cache.stats)
+    return cache
+
+
+def get_retrieval_prefetcher(retriever: BaseRetriever) -> Optional[RetrievalPrefetcher]:
+    """按配置创建检索预取器，retriever 应与检索工具使用的检索器相同"""
+    if not SystemConfig.is_retrieval_prefetch_enabled():
+        return None
+    prefetcher = RetrievalPrefetcher(retriever,
+                                     similarity_threshold=SystemConfig.get_retrieval_prefetch_similarity_threshold(),
+                                     ttl_seconds=SystemConfig.get_retrieval_prefetch_ttl_seconds())
+    metrics.register_collector("retrieval_prefetch", prefetcher.stats)
+    return prefetcher
+
 
-    llm_chain = LLMChain(llm=model, prompt=MULTI_QUERY_PROMPT_TEMPLATE, output_parser=output_parser)
+def get_multi_query_retriever(retriever: BaseRetriever, model: BaseModel, adaptive: bool = None) -> BaseRetriever:
+    """adaptive 为 True 时原问题检索结果可信则跳过 LLM 问题扩展，默认取配置 enable_adaptive_multi_query"""
+    query_generator = MULTI_QUERY_PROMPT_TEMPLATE | model | LineListOutputParser()
 
-    retriever = MultiQueryRetriever(
-        retriever=retriever, llm_chain=llm_chain, parser_key="lines"
+    retriever = FusionMultiQueryRetriever(
+        retriever=retriever,
+        query_generator=query_generator,
+        rrf_k=SystemConfig.get_rrf_k(),
+        adaptive=SystemConfig.is_adaptive_multi_query_enabled() if adaptive is None else adaptive,
+        min_top_score=SystemConfig.get_multi_query_min_top_score(),
+        min_score_margin=SystemConfig.get_multi_query_min_score_margin(),
     )
 
-    return retriever
\ No newline at end of file
+    return retriever
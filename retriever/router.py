@@ -0,0 +1,189 @@
+"""
+法律书目路由
+根据 Law-Book 的标题（法律名称及其别名、编/章/节标题）构建关键词词典，不调用 LLM 预测问题涉及的法律，
+检索时作为 metadata.book 过滤条件缩小候选范围；置信度低时不过滤
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+from collections import defaultdict, deque
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from metrics.metrics import metrics
+from retriever.article_index import law_aliases
+
+logger = logging.getLogger(__name__)
+
+_CN_NUM = "零〇一二三四五六七八九十百千万两"
+_STRUCTURE_PREFIX = re.compile(rf"^第[{_CN_NUM}\d]+[编章节分]\s*")
+# 法律名称直接出现在问题中时的权重，远高于标题关键词
+_ALIAS_WEIGHT = 10.0
+# 没有命中法律名称时，至少需要相当于两个专属标题词的得分才按法律过滤
+_MIN_TERM_SCORE = 2.0
+_MIN_TERM_LENGTH = 2
+_HEADER_FIELDS = ("header2", "header3", "header4")
+
+
+@dataclass
+class RouteDecision:
+    """一次路由决策，books 为空表示不过滤"""
+    query: str
+    books: List[str]
+    confidence: float
+    matched: Dict[str, List[str]] = field(default_factory=dict)
+
+    @property
+    def filtered(self) -> bool:
+        return bool(self.books)
+
+
+def header_terms(header: str) -> List[str]:
+    """标题去掉“第X章”等序号后作为关键词，如“第二章 犯罪” -> “犯罪”"""
+    term = _STRUCTURE_PREFIX.sub("", header or "").strip()
+    return [term] if len(term) >= _MIN_TERM_LENGTH else []
+
+
+class LawBookRouter:
+    """基于别名和标题关键词的法律书目路由"""
+
+    def __init__(self,
+                 aliases: Dict[str, str],
+                 terms: Dict[str, List[str]],
+                 min_confidence: float = 0.6,
+                 max_books: int = 3,
+                 history_size: int = 200):
+        self.aliases = aliases
+        self.terms = terms
+        self.min_confidence = min_confidence
+        self.max_books = max_books
+        self._history: deque = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+        self.filtered = 0
+        self.unfiltered = 0
+
+    @classmethod
+    def from_headers(cls, headers_by_book: Dict[str, Iterable[str]], **kwargs) -> "LawBookRouter":
+        """headers_by_book: 法律名称 -> 该法律下的各级标题"""
+        aliases: Dict[str, str] = {}
+        terms: Dict[str, set] = defaultdict(set)
+        for book, headers in headers_by_book.items():
+            for alias in law_aliases(book):
+                aliases.setdefault(alias, book)
+            for header in headers:
+                for term in header_terms(header):
+                    terms[term].add(book)
+        # 与法律名称相同的标题词由别名负责
+        return cls(aliases, {term: sorted(books) for term, books in terms.items() if term not in aliases}, **kwargs)
+
+    @classmethod
+    def build_from_elasticsearch(cls, es_client, index_name: str, **kwargs) -> "LawBookRouter":
+        """从索引中聚合每部法律的各级标题"""
+        aggs = {name: {"terms": {"field": f"metadata.{name}", "size": 10000}} for name in _HEADER_FIELDS}
+        response = es_client.search(index=index_name, size=0, aggs={
+            "books": {"terms": {"field": "metadata.book", "size": 10000}, "aggs": aggs}
+        })
+        headers_by_book = {}
+        for bucket in response["aggregations"]["books"]["buckets"]:
+            headers_by_book[bucket["key"]] = [header["key"] for name in _HEADER_FIELDS
+                                              for header in bucket[name]["buckets"]]
+        logger.info(f"从索引 {index_name} 构建法律路由词典，共 {len(headers_by_book)} 部法律")
+        return cls.from_headers(headers_by_book, **kwargs)
+
+    def route(self, query: str) -> RouteDecision:
+        scores: Dict[str, float] = defaultdict(float)
+        matched: Dict[str, List[str]] = defaultdict(list)
+        alias_books = set()
+        for alias, book in self.aliases.items():
+            if alias in query:
+                scores[book] += _ALIAS_WEIGHT
+                matched[book].append(alias)
+                alias_books.add(book)
+        for term, books in self.terms.items():
+            if term in query:
+                # 多部法律共有的标题词（如“总则”）区分度低
+                for book in books:
+                    scores[book] += 1.0 / len(books)
+                    matched[book].append(term)
+
+        books, confidence = [], 0.0
+        if scores:
+            ranked = sorted(scores, key=scores.get, reverse=True)
+            top = scores[ranked[0]]
+            candidates = [book for book in ranked if scores[book] >= top / 2][:self.max_books]
+            confidence = sum(scores[book] for book in candidates) / sum(scores.values())
+            # 置信度只是相对占比，单个标题词也能得到 1.0，过滤前还要求足够的绝对证据
+            enough_evidence = bool(alias_books & set(candidates)) or top >= _MIN_TERM_SCORE
+            if confidence >= self.min_confidence and enough_evidence:
+                books = candidates
+
+        decision = RouteDecision(query, books, round(confidence, 4),
+                                 {book: matched[book] for book in books or list(matched)[:self.max_books]})
+        with self._lock:
+            self._history.append(decision)
+            if decision.filtered:
+                self.filtered += 1
+            else:
+                self.unfiltered += 1
+        metrics.incr("law_router_filtered" if decision.filtered else "law_router_unfiltered")
+        logger.info(f"法律路由: {query} -> {books or '不过滤'}，置信度 {confidence:.2f}")
+        return decision
+
+    def stats(self) -> Dict:
+        """路由统计和最近的决策，供评估使用"""
+        with self._lock:
+            total = self.filtered + self.unfiltered
+            return {
+                "filtered": self.filtered,
+                "unfiltered": self.unfiltered,
+                "filter_rate": self.filtered / total if total else 0.0,
+                "recent": [asdict(decision) for decision in list(self._history)[-20:]],
+            }
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"aliases": self.aliases, "terms": self.terms}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        logger.info(f"法律路由词典已保存到 {path}")
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "LawBookRouter":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["aliases"], data["terms"], **kwargs)
+
+    @classmethod
+    def load_if_exists(cls, path: str, **kwargs) -> Optional["LawBookRouter"]:
+        if not path or not os.path.exists(path):
+            logger.info(f"未找到法律路由词典 {path}，检索不按法律过滤")
+            return None
+        return cls.load(path, **kwargs)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from config.config_manager import SystemConfig
+    from retriever.es_client import get_es_client
+
+    parser = argparse.ArgumentParser(description="法律书目路由")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="从索引构建路由词典")
+    build_parser.add_argument("--index", default="law_documents", help="索引或别名")
+    route_parser = subparsers.add_parser("route", help="查看问题的路由决策")
+    route_parser.add_argument("questions", nargs="+")
+    args = parser.parse_args()
+
+    router_path = SystemConfig.get_law_router_path()
+    if args.command == "build":
+        router = LawBookRouter.build_from_elasticsearch(get_es_client(), args.index)
+        router.save(router_path)
+        print(f"法律 {len(set(router.aliases.values()))} 部，别名 {len(router.aliases)} 个，标题关键词 {len(router.terms)} 个")
+    else:
+        router = LawBookRouter.load(router_path, min_confidence=SystemConfig.get_law_router_min_confidence())
+        for question in args.questions:
+            print(json.dumps(asdict(router.route(question)), ensure_ascii=False))
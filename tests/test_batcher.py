@@ -0,0 +1,54 @@
+import asyncio
+import threading
+import unittest
+
+from embedding.batcher import QueryBatcher
+
+
+class QueryBatcherCancelTest(unittest.TestCase):
+    """同一批中的一个调用方被取消时，其余调用方仍能拿到向量"""
+
+    def test_cancel_before_dispatch(self):
+        calls = []
+
+        def embed_fn(texts):
+            calls.append(list(texts))
+            return [[float(len(text))] for text in texts]
+
+        batcher = QueryBatcher(embed_fn, max_batch_size=10, max_wait_ms=200)
+
+        async def run():
+            cancelled = asyncio.create_task(batcher.aembed("取消的问题"))
+            kept = asyncio.create_task(batcher.aembed("问题"))
+            await asyncio.sleep(0.01)
+            cancelled.cancel()
+            return await asyncio.wait_for(kept, timeout=2)
+
+        self.assertEqual(asyncio.run(run()), [2.0])
+        self.assertEqual(calls, [["问题"]])
+
+    def test_cancel_during_embedding(self):
+        started, release = threading.Event(), threading.Event()
+
+        def embed_fn(texts):
+            started.set()
+            release.wait(timeout=2)
+            return [[float(len(text))] for text in texts]
+
+        batcher = QueryBatcher(embed_fn, max_batch_size=2, max_wait_ms=200)
+
+        async def run():
+            cancelled = asyncio.create_task(batcher.aembed("取消的问题"))
+            kept = asyncio.create_task(batcher.aembed("问题"))
+            await asyncio.to_thread(started.wait, 2)
+            cancelled.cancel()
+            release.set()
+            return await asyncio.wait_for(kept, timeout=2)
+
+        self.assertEqual(asyncio.run(run()), [2.0])
+        # 同步调用方在取消之后仍能正常使用
+        self.assertEqual(batcher.embed("同步"), [2.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
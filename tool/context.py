@@ -0,0 +1,113 @@
+"""
+检索工具输出整理
+多查询检索的各个变体经常命中同一条文，相邻切片之间又有重叠，
+按条文合并切片、去掉重复内容后按分数排序，在 token 预算内输出
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from model.tokens import estimate_tokens, truncate_to_tokens
+
+# 判定首尾重叠的最短字符数，太短容易误合并
+_MIN_OVERLAP = 5
+_MAX_OVERLAP = 200
+# 没有条号的切片的分组标记
+_LOOSE = object()
+
+
+def format_document(doc: Document) -> str:
+    return f"出处：{doc.metadata['book']}\n内容：{doc.page_content}"
+
+
+def format_documents(docs: List[Document]) -> str:
+    return "\n\n".join(format_document(doc) for doc in docs)
+
+
+def merge_overlapping(first: str, second: str) -> Optional[str]:
+    """second 与 first 的结尾重叠或被其包含时返回合并后的文本，否则返回 None"""
+    if second in first:
+        return first
+    if first in second:
+        return second
+    for size in range(min(len(first), len(second), _MAX_OVERLAP), _MIN_OVERLAP - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return None
+
+
+def _merge_loose(groups: Dict[Tuple, List[Document]], doc: Document) -> bool:
+    """没有条号的切片只与同一来源、文本确实首尾重叠或互相包含的切片合并"""
+    for key, group in groups.items():
+        if key[0] != _LOOSE:
+            continue
+        first = group[0]
+        if (first.metadata.get("book"), first.metadata.get("source")) != (doc.metadata.get("book"),
+                                                                          doc.metadata.get("source")):
+            continue
+        merged = merge_overlapping(first.page_content, doc.page_content)
+        if merged is None:
+            merged = merge_overlapping(doc.page_content, first.page_content)
+        if merged is not None:
+            # 保留排名较高的切片的 id 和元数据
+            groups[key] = [Document(id=first.id, page_content=merged, metadata=first.metadata)]
+            return True
+    return False
+
+
+def _merge_group(docs: List[Document]) -> Document:
+    """合并同一条文的多个切片，按款号排序，去掉后续切片重复的条号前缀"""
+    best = docs[0]
+    article = best.metadata.get("article")
+    ordered = sorted(docs, key=lambda doc: doc.metadata.get("paragraph_no", 0))
+    pieces: List[str] = []
+    for index, doc in enumerate(ordered):
+        text = doc.page_content
+        if index and article and text.startswith(f"{article} "):
+            text = text[len(article) + 1:]
+        merged = merge_overlapping(pieces[-1], text) if pieces else None
+        if merged is not None:
+            pieces[-1] = merged
+        else:
+            pieces.append(text)
+    metadata = dict(best.metadata)
+    metadata.pop("paragraph_no", None)
+    return Document(id=best.id, page_content="\n".join(pieces), metadata=metadata)
+
+
+def compact_documents(docs: List[Document], max_tokens: int) -> List[Document]:
+    """
+    去掉完全重复的切片，合并同一条文的切片，按分数从高到低在 max_tokens 内输出；
+    放不下的条文跳过，排名第一的条文超长时截断
+    """
+    ranked = sorted(enumerate(docs), key=lambda item: (-(item[1].metadata.get("score") or 0), item[0]))
+
+    groups: Dict[Tuple, List[Document]] = {}
+    seen_texts = set()
+    for position, doc in ranked:
+        if doc.page_content in seen_texts:
+            continue
+        seen_texts.add(doc.page_content)
+        article = doc.metadata.get("article")
+        if article:
+            groups.setdefault((doc.metadata.get("book"), article), []).append(doc)
+        elif not _merge_loose(groups, doc):
+            # 不能合并的切片各自按排名输出
+            groups[(_LOOSE, position)] = [doc]
+
+    result: List[Document] = []
+    used = 0
+    for group in groups.values():
+        doc = _merge_group(group) if len(group) > 1 else group[0]
+        # 文档之间的空行也计入预算
+        cost = estimate_tokens(format_document(doc)) + (1 if result else 0)
+        if used + cost <= max_tokens:
+            result.append(doc)
+            used += cost
+        elif not result:
+            header_cost = estimate_tokens(format_document(Document(page_content="", metadata=doc.metadata)))
+            content = truncate_to_tokens(doc.page_content, max_tokens - header_cost)
+            result.append(Document(id=doc.id, page_content=content, metadata=doc.metadata))
+            used = max_tokens
+    return result
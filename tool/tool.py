@@ -1,17 +1,77 @@
+from typing import List, Optional
+
+from langchain_core.documents import Document
 from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import Tool, tool
 
-def get_law_documents_retriever_tool(retriever: BaseRetriever) -> Tool:
+from config.config_manager import SystemConfig
+from metrics.metrics import metrics
+from model.tokens import estimate_tokens
+from retriever.article_index import ArticleIndex
+from retriever.prefetch import RetrievalPrefetcher
+from retriever.result_cache import RetrievalResultCache
+from tool.context import compact_documents, format_documents
+
+
+def _format_documents(docs: List[Document], max_tokens: int) -> str:
+    """合并重叠切片并按 token 预算输出，整理前后的 token 数记入指标"""
+    output = format_documents(compact_documents(docs, max_tokens))
+    metrics.observe("retriever_tool_tokens_before", estimate_tokens(format_documents(docs)))
+    metrics.observe("retriever_tool_tokens_after", estimate_tokens(output))
+    return output
+
+
+def get_law_documents_retriever_tool(retriever: BaseRetriever,
+                                     article_index: Optional[ArticleIndex] = None,
+                                     result_cache: Optional[RetrievalResultCache] = None,
+                                     max_tokens: int = None,
+                                     prefetcher: Optional[RetrievalPrefetcher] = None) -> Tool:
+    max_tokens = max_tokens or SystemConfig.get_retriever_tool_max_tokens()
+
+    def lookup_without_retrieval(query) -> Optional[List[Document]]:
+        # 直接引用条文（如“民法典第1165条”）时精确查找，不经过向量检索
+        if article_index is not None:
+            docs = article_index.lookup(query)
+            if docs:
+                metrics.incr("article_index_hits")
+                return docs
+            metrics.incr("article_index_misses")
+        if result_cache is not None:
+            return result_cache.get(query)
+        return None
+
     @tool(name_or_callable="LegalRetriever",
           description="用于检索中国法律法规和条文。输入一个法律问题或关键词。")
     def law_retriever(query):
+        docs = lookup_without_retrieval(query)
+        if docs is not None:
+            return _format_documents(docs, max_tokens)
         # 基于向量相似度检索，并可利用元数据进行过滤
         docs = retriever.invoke(query)
+        if result_cache is not None:
+            result_cache.set(query, docs)
         # docs = retriever.similarity_search(query, k=3)  # 检索最相关的5个片段
-        return "\n\n".join([f"出处：{doc.metadata['book']}\n内容：{doc.page_content}" for doc in docs])
+        return _format_documents(docs, max_tokens)
+
+    async def alaw_retriever(query, config: RunnableConfig):
+        # 异步检索，不阻塞事件循环
+        docs = lookup_without_retrieval(query)
+        if docs is not None:
+            return _format_documents(docs, max_tokens)
+        # 问题到达时已开始的预取检索，输入相近时直接使用
+        thread_id = config.get("configurable", {}).get("thread_id")
+        if prefetcher is not None and thread_id is not None:
+            docs = await prefetcher.take(thread_id, query)
+        if docs is None:
+            docs = await retriever.ainvoke(query)
+        if result_cache is not None:
+            result_cache.set(query, docs)
+        return _format_documents(docs, max_tokens)
 
     return Tool(
         name="LegalRetriever",
         func=law_retriever,
+        coroutine=alaw_retriever,
         description="用于检索中国法律法规和条文。输入一个法律问题或关键词。"
     )